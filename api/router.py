@@ -6,12 +6,14 @@ from backend.plugin.ai.api.v1.conversation import router as conversation_router
 from backend.plugin.ai.api.v1.default_model import router as default_model_router
 from backend.plugin.ai.api.v1.mcp import router as mcp_router
 from backend.plugin.ai.api.v1.message import router as message_router
+from backend.plugin.ai.api.v1.metrics import router as metrics_router
 from backend.plugin.ai.api.v1.model import router as model_router
 from backend.plugin.ai.api.v1.model_option import router as model_option_router
 from backend.plugin.ai.api.v1.provider import router as provider_router
 from backend.plugin.ai.api.v1.quick_phrase import router as quick_phrase_router
+from backend.plugin.ai.lifespan import ai_lifespan
 
-v1 = APIRouter(prefix=settings.FASTAPI_API_V1_PATH)
+v1 = APIRouter(prefix=settings.FASTAPI_API_V1_PATH, lifespan=ai_lifespan)
 
 v1.include_router(chat_router, prefix='/chat', tags=['AI 生成'])
 v1.include_router(model_option_router, prefix='/model-options', tags=['AI 模型管理'])
@@ -22,3 +24,4 @@ v1.include_router(quick_phrase_router, prefix='/quick-phrases', tags=['AI 快捷
 v1.include_router(model_router, prefix='/models', tags=['AI 模型管理'])
 v1.include_router(provider_router, prefix='/providers', tags=['AI 供应商管理'])
 v1.include_router(mcp_router, prefix='/mcps', tags=['AI MCP 管理'])
+v1.include_router(metrics_router, prefix='/metrics', tags=['AI 运行指标'])
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Request
+from typing import Annotated
+
+from fastapi import APIRouter, Header, Path, Request
 from pydantic_ai.ui import SSE_CONTENT_TYPE
 from starlette.responses import StreamingResponse
 
@@ -23,3 +25,25 @@ async def create_ai_chat_completion(
         obj=obj,
         accept=request.headers.get('accept', SSE_CONTENT_TYPE),
     )
+
+
+@router.get(
+    '/conversations/{conversation_id}/runs/{run_id}/events',
+    summary='重新连接流式生成',
+    dependencies=[DependsJwtAuth],
+)
+async def resume_ai_chat_completion(
+    request: Request,
+    conversation_id: Annotated[str, Path(description='对话 ID')],
+    run_id: Annotated[str, Path(description='运行 ID，即 RUN_STARTED 事件中的 runId')],
+    last_event_id: Annotated[
+        int | None,
+        Header(alias='Last-Event-ID', ge=0, description='已收到的最后一个事件 ID，为空时从头重放'),
+    ] = None,
+) -> StreamingResponse:
+    return ai_chat_service.resume_completion(
+        user_id=request.user.id,
+        conversation_id=conversation_id,
+        run_id=run_id,
+        last_event_id=last_event_id,
+    )
@@ -1,6 +1,7 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Path, Request
+from fastapi import APIRouter, Path, Query, Request
+from starlette.responses import Response, StreamingResponse
 
 from backend.common.pagination import CursorPageData, DependsCursorPagination
 from backend.common.response.response_schema import ResponseModel, ResponseSchemaModel, response_base
@@ -9,6 +10,7 @@ from backend.database.db import CurrentSession, CurrentSessionTransaction
 from backend.plugin.ai.schema.conversation import (
     GetAIConversationDetail,
     GetAIConversationListDetail,
+    GetAIConversationMessagesDetail,
     UpdateAIConversationPinnedParam,
     UpdateAIConversationTitleParam,
 )
@@ -16,6 +18,9 @@ from backend.plugin.ai.service.conversation_service import ai_conversation_servi
 
 router = APIRouter()
 
+# 允许浏览器内联展示的附件类型，其余类型按下载处理，避免脚本类内容在站点域下执行
+_INLINE_BLOB_MEDIA_TYPE_PREFIXES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'audio/', 'video/')
+
 
 @router.get(
     '/{pk}',
@@ -26,11 +31,79 @@ async def get_conversation(
     request: Request,
     db: CurrentSession,
     pk: Annotated[str, Path(description='对话 ID')],
+    include_messages: Annotated[bool, Query(description='是否返回全部消息快照')] = False,
 ) -> ResponseSchemaModel[GetAIConversationDetail]:
-    data = await ai_conversation_service.get(db=db, conversation_id=pk, user_id=request.user.id)
+    data = await ai_conversation_service.get(
+        db=db,
+        conversation_id=pk,
+        user_id=request.user.id,
+        include_messages=include_messages,
+    )
     return response_base.success(data=data)
 
 
+@router.get(
+    '/{pk}/messages',
+    summary='分页获取对话消息',
+    dependencies=[DependsJwtAuth],
+)
+async def get_conversation_messages(
+    request: Request,
+    db: CurrentSession,
+    pk: Annotated[str, Path(description='对话 ID')],
+    limit: Annotated[int, Query(ge=1, le=200, description='每页消息数量')] = 50,
+    before_message_index: Annotated[int | None, Query(description='仅返回索引小于该值的消息，为空时返回最近的消息')] = None,
+    before_message_id: Annotated[
+        int | None,
+        Query(description='与 before_message_index 组成游标，同时返回索引相同且 ID 小于该值的消息'),
+    ] = None,
+) -> ResponseSchemaModel[GetAIConversationMessagesDetail]:
+    data = await ai_conversation_service.get_messages(
+        db=db,
+        conversation_id=pk,
+        user_id=request.user.id,
+        limit=limit,
+        before_message_index=before_message_index,
+        before_message_id=before_message_id,
+    )
+    return response_base.success(data=data)
+
+
+@router.get(
+    '/{pk}/export',
+    summary='流式导出对话消息',
+    dependencies=[DependsJwtAuth],
+)
+async def export_conversation_messages(
+    request: Request,
+    pk: Annotated[str, Path(description='对话 ID')],
+) -> StreamingResponse:
+    return await ai_conversation_service.export_messages(conversation_id=pk, user_id=request.user.id)
+
+
+@router.get(
+    '/{pk}/blobs/{key}',
+    summary='下载对话附件',
+    dependencies=[DependsJwtAuth],
+)
+async def get_conversation_blob(
+    request: Request,
+    db: CurrentSession,
+    pk: Annotated[str, Path(description='对话 ID')],
+    key: Annotated[str, Path(description='附件内容键')],
+    media_type: Annotated[str | None, Query(description='附件类型')] = None,
+) -> Response:
+    data = await ai_conversation_service.get_blob(db=db, conversation_id=pk, user_id=request.user.id, key=key)
+    if media_type and media_type.startswith(_INLINE_BLOB_MEDIA_TYPE_PREFIXES):
+        headers = {'Content-Disposition': 'inline'}
+    else:
+        media_type = 'application/octet-stream'
+        headers = {'Content-Disposition': f'attachment; filename="{key}"'}
+    headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    headers['X-Content-Type-Options'] = 'nosniff'
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
 @router.get(
     '',
     summary='分页获取所有对话列表',
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from backend.common.security.jwt import DependsJwtAuth
+from backend.plugin.ai.utils.metrics import ai_metrics_registry
+
+router = APIRouter()
+
+
+@router.get('', summary='获取 AI 运行指标', dependencies=[DependsJwtAuth])
+async def get_ai_metrics() -> PlainTextResponse:
+    return PlainTextResponse(ai_metrics_registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
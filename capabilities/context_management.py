@@ -2,9 +2,28 @@ from collections.abc import Sequence
 
 from pydantic_ai_harness.compaction import ClampOversizedMessages, LimitWarner, SlidingWindow
 
-from backend.plugin.ai.dataclasses import CapabilityContext, CapabilityResult
+from backend.plugin.ai.dataclasses import CapabilityContext, CapabilityResult, ContextManagementPolicy
 from backend.plugin.ai.enums import AIChatGenerationType
 
+# 滑动窗口按消息数裁剪且会向前补齐工具调用链，按行加载历史时额外多取的行数
+SLIDING_WINDOW_ROW_MARGIN = 8
+
+
+def get_history_row_limit(policy: ContextManagementPolicy, generation_type: AIChatGenerationType) -> int | None:
+    """
+    获取按行加载历史时需要覆盖的最近模型消息数量
+
+    已加载的模型消息超过 max_messages 时裁剪必然触发，保留区间完整落在已加载的行内；
+    占位消息与失败消息可能不含模型消息，调用方按模型消息数而非行数判断加载是否足够
+
+    :param policy: 上下文管理策略
+    :param generation_type: 生成类型
+    :return:
+    """
+    if generation_type != AIChatGenerationType.text or policy.max_messages is None:
+        return None
+    return policy.max_messages + SLIDING_WINDOW_ROW_MARGIN
+
 
 async def build_context_management_capabilities(  # ruff:ignore[unused-async]
     ctx: CapabilityContext,
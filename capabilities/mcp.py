@@ -7,7 +7,7 @@ from backend.common.exception import errors
 from backend.core.conf import settings
 from backend.plugin.ai.dataclasses import CapabilityContext, CapabilityResult
 from backend.plugin.ai.enums import McpType
-from backend.plugin.ai.service.mcp_service import ai_mcp_service
+from backend.plugin.ai.utils.metadata_cache import ai_metadata_cache
 
 
 async def build_mcp_capability(ctx: CapabilityContext) -> Sequence[CapabilityResult]:
@@ -19,7 +19,7 @@ async def build_mcp_capability(ctx: CapabilityContext) -> Sequence[CapabilityRes
     """
     if not ctx.forwarded_props.mcp_ids:
         return ()
-    mcps = await ai_mcp_service.get_by_ids(db=ctx.db, mcp_ids=ctx.forwarded_props.mcp_ids)
+    mcps = await ai_metadata_cache.get_mcps(ctx.db, ctx.forwarded_props.mcp_ids)
     results: list[CapabilityResult] = []
     for mcp in mcps:
         headers = {str(key): str(value) for key, value in (mcp.headers or {}).items()}
@@ -11,7 +11,7 @@ from backend.common.exception import errors
 from backend.core.conf import settings
 from backend.plugin.ai.dataclasses import CapabilityContext, CapabilityResult
 from backend.plugin.ai.enums import AIChatGenerationType, AIProviderType, AIWebSearchType
-from backend.plugin.ai.utils.dynamic_config import load_ai_config
+from backend.plugin.ai.utils.metadata_cache import ai_metadata_cache
 
 
 async def build_search_capabilities(ctx: CapabilityContext) -> Sequence[CapabilityResult]:
@@ -45,7 +45,7 @@ async def build_search_capabilities(ctx: CapabilityContext) -> Sequence[Capabili
                 )
             results.append(CapabilityResult(capability=NativeTool(WebSearchTool()), introduces_builtin_tool=True))
         case AIWebSearchType.exa:
-            await load_ai_config(ctx.db)
+            await ai_metadata_cache.load_ai_config(ctx.db)
             if not settings.AI_EXA_API_KEY:
                 raise errors.RequestError(msg='未配置 AI_EXA_API_KEY，无法启用 Exa 搜索')
             results.append(
@@ -55,7 +55,7 @@ async def build_search_capabilities(ctx: CapabilityContext) -> Sequence[Capabili
                 )
             )
         case AIWebSearchType.tavily:
-            await load_ai_config(ctx.db)
+            await ai_metadata_cache.load_ai_config(ctx.db)
             if not settings.AI_TAVILY_API_KEY:
                 raise errors.RequestError(msg='未配置 AI_TAVILY_API_KEY，无法启用 Tavily 搜索')
             results.append(
@@ -3,20 +3,26 @@ from dataclasses import replace
 from typing import Any
 
 from pydantic_ai import AgentRunResult, ModelRequest, ModelResponse, SystemPromptPart, UserPromptPart
-from pydantic_core import to_jsonable_python
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.common.exception import errors
 from backend.common.log import log
 from backend.database.db import async_db_session
-from backend.plugin.ai.crud.crud_conversation import ai_conversation_dao
+from backend.plugin.ai.crud.crud_conversation import MESSAGE_INDEX_STRIDE, ai_conversation_dao
 from backend.plugin.ai.crud.crud_message import ai_message_dao
 from backend.plugin.ai.dataclasses import CompletionPersistenceContext, RegenerationPersistenceContext
 from backend.plugin.ai.enums import AIMessageStatus
+from backend.plugin.ai.model import AIConversation
 from backend.plugin.ai.protocol.base import ChatModelMessage
-from backend.plugin.ai.schema.conversation import CreateAIConversationParam, UpdateAIConversationParam
+from backend.plugin.ai.schema.conversation import CreateAIConversationParam
 from backend.plugin.ai.utils.conversation_control import normalize_generated_conversation_title
-from backend.plugin.ai.utils.message_storage import build_chat_message_record
+from backend.plugin.ai.utils.message_cache import ai_message_cache
+from backend.plugin.ai.utils.message_storage import (
+    ChatMessageRole,
+    build_chat_message_record,
+    dump_model_messages,
+    externalize_message_blobs,
+)
 
 
 def extract_assistant_messages(run_messages: Sequence[ChatModelMessage]) -> list[ChatModelMessage]:
@@ -56,36 +62,71 @@ def extract_assistant_run_messages(result: AgentRunResult[Any]) -> list[ChatMode
     return extract_assistant_messages(result.new_messages())
 
 
+def _group_chat_messages(messages: list[ChatModelMessage]) -> list[tuple[ChatMessageRole, list[ChatModelMessage]]]:
+    """
+    按用户可见聊天消息分组原始模型消息
+
+    :param messages: 原始模型消息
+    :return:
+    """
+    groups: list[tuple[ChatMessageRole, list[ChatModelMessage]]] = []
+    for message in messages:
+        if isinstance(message, ModelRequest) and bool(message.parts) and isinstance(message.parts[0], UserPromptPart):
+            groups.append(('user', [message]))
+        elif groups and groups[-1][0] == 'assistant':
+            groups[-1][1].append(message)
+        else:
+            groups.append(('assistant', [message]))
+    return groups
+
+
 def _build_chat_message_records(
-    *,
     messages: list[ChatModelMessage],
-    payload_messages: list[dict[str, Any]],
-) -> list[dict[str, Any]]:
+) -> list[tuple[dict[str, Any], list[ChatModelMessage], int]]:
     """
-    按用户可见聊天消息构建持久化载荷
+    按用户可见聊天消息构建持久化字段
 
     :param messages: 原始模型消息
-    :param payload_messages: 原始模型消息 JSON
-    :return:
+    :return: 持久化字段、对应的原始模型消息及其 JSON 大小
     """
-    chat_message_records: list[dict[str, Any]] = []
-    assistant_messages: list[dict[str, Any]] = []
+    records: list[tuple[dict[str, Any], list[ChatModelMessage], int]] = []
+    for role, group in _group_chat_messages(messages):
+        raw = dump_model_messages(group)
+        records.append((build_chat_message_record(role=role, model_messages=raw), group, len(raw)))
+    return records
 
-    def flush_assistant_messages() -> None:
-        if not assistant_messages:
-            return
-        chat_message_records.append(build_chat_message_record(role='assistant', model_messages=assistant_messages))
-        assistant_messages.clear()
 
-    for message, payload_message in zip(messages, payload_messages, strict=False):
-        if isinstance(message, ModelRequest) and bool(message.parts) and isinstance(message.parts[0], UserPromptPart):
-            flush_assistant_messages()
-            chat_message_records.append(build_chat_message_record(role='user', model_messages=[payload_message]))
-            continue
-        assistant_messages.append(payload_message)
+async def _cache_finalized_message(
+    *,
+    db: AsyncSession,
+    conversation_id: str,
+    message_id: int,
+    model_messages: str,
+    size: int,
+    messages: list[ChatModelMessage],
+) -> None:
+    """
+    将已完成的消息行追加到消息缓存，避免下一轮重新校验
 
-    flush_assistant_messages()
-    return chat_message_records
+    :param db: 数据库会话
+    :param conversation_id: 对话 ID
+    :param message_id: 消息 ID
+    :param model_messages: 存储的模型消息 JSON 文本
+    :param size: 模型消息 JSON 大小
+    :param messages: 原始模型消息
+    :return:
+    """
+    versions = await ai_message_dao.get_row_versions(db, [message_id])
+    if message_id not in versions:
+        return
+    updated_time, status = versions[message_id]
+    ai_message_cache.put(
+        conversation_id=conversation_id,
+        row_id=message_id,
+        version=(updated_time, status, len(model_messages)),
+        size=size,
+        messages=messages,
+    )
 
 
 async def persist_completion(
@@ -108,29 +149,25 @@ async def persist_completion(
         if persistence.assistant_message_id is not None:
             await _finalize_pending_placeholder(
                 db=db,
-                message_id=persistence.assistant_message_id,
+                persistence=persistence,
                 payload={'status': status},
             )
         return
-    payload_messages = to_jsonable_python(messages, by_alias=True)
-    assert isinstance(payload_messages, list)
-    chat_message_records = _build_chat_message_records(
-        messages=messages,
-        payload_messages=payload_messages,
-    )
+    messages = await externalize_message_blobs(messages)
+    chat_message_records = _build_chat_message_records(messages)
     if persistence.assistant_message_id is not None:
-        assistant_records = [record for record in chat_message_records if record['role'] == 'assistant']
+        assistant_records = [item for item in chat_message_records if item[0]['role'] == 'assistant']
         if not assistant_records:
             await _finalize_pending_placeholder(
                 db=db,
-                message_id=persistence.assistant_message_id,
+                persistence=persistence,
                 payload={'status': status},
             )
             return
-        assistant_record = assistant_records[-1]
+        assistant_record, assistant_messages, assistant_size = assistant_records[-1]
         await _finalize_pending_placeholder(
             db=db,
-            message_id=persistence.assistant_message_id,
+            persistence=persistence,
             payload={
                 'provider_id': persistence.forwarded_props.provider_id,
                 'model_id': persistence.forwarded_props.model_id,
@@ -138,6 +175,14 @@ async def persist_completion(
                 **assistant_record,
             },
         )
+        await _cache_finalized_message(
+            db=db,
+            conversation_id=persistence.conversation_id,
+            message_id=persistence.assistant_message_id,
+            model_messages=assistant_record['model_messages'],
+            size=assistant_size,
+            messages=assistant_messages,
+        )
         return
 
     current = await ai_conversation_dao.get_by_conversation_id_for_update(db, persistence.conversation_id)
@@ -145,19 +190,18 @@ async def persist_completion(
     if current:
         if current.user_id != persistence.user_id:
             raise errors.NotFoundError(msg='对话不存在')
-        await ai_conversation_dao.update(
+        await ai_conversation_dao.touch_model(
             db,
             current.id,
-            UpdateAIConversationParam(
-                conversation_id=current.conversation_id,
-                title=normalized_title,
-                provider_id=persistence.forwarded_props.provider_id,
-                model_id=persistence.forwarded_props.model_id,
-                user_id=current.user_id,
-                pinned_time=current.pinned_time,
-                context_start_message_id=current.context_start_message_id,
-                context_cleared_time=current.context_cleared_time,
-            ),
+            persistence.forwarded_props.provider_id,
+            persistence.forwarded_props.model_id,
+        )
+        if normalized_title != current.title:
+            await ai_conversation_dao.update_title(db, current.id, normalized_title)
+        message_indexes = await ai_conversation_dao.allocate_message_indexes(
+            db,
+            current,
+            len(chat_message_records),
         )
     else:
         await ai_conversation_dao.create(
@@ -168,10 +212,11 @@ async def persist_completion(
                 provider_id=persistence.forwarded_props.provider_id,
                 model_id=persistence.forwarded_props.model_id,
                 user_id=persistence.user_id,
+                next_message_index=len(chat_message_records) * MESSAGE_INDEX_STRIDE,
             ),
         )
+        message_indexes = [offset * MESSAGE_INDEX_STRIDE for offset in range(len(chat_message_records))]
 
-    next_message_index = await ai_message_dao.get_next_message_index(db, persistence.conversation_id)
     await ai_message_dao.bulk_create(
         db,
         [
@@ -179,11 +224,11 @@ async def persist_completion(
                 'conversation_id': persistence.conversation_id,
                 'provider_id': persistence.forwarded_props.provider_id,
                 'model_id': persistence.forwarded_props.model_id,
-                'message_index': next_message_index + offset,
+                'message_index': message_index,
                 'status': status,
                 **record,
             }
-            for offset, record in enumerate(chat_message_records)
+            for message_index, (record, _, _) in zip(message_indexes, chat_message_records, strict=True)
         ],
     )
 
@@ -219,22 +264,18 @@ async def persist_regeneration(
         raise errors.ConflictError(msg='重生成任务已失效，请重试')
     if not any(isinstance(message, ModelResponse) for message in messages):
         if status == AIMessageStatus.success:
-            await _delete_pending_placeholder(db=db, message_id=assistant_message_id)
+            await _delete_pending_placeholder(db=db, persistence=persistence)
         else:
             await _finalize_pending_placeholder(
                 db=db,
-                message_id=assistant_message_id,
+                persistence=persistence,
                 payload={'status': status},
             )
         return
-    payload_messages = to_jsonable_python(messages, by_alias=True)
-    assert isinstance(payload_messages, list)
-    chat_message_records = _build_chat_message_records(
-        messages=messages,
-        payload_messages=payload_messages,
-    )
+    messages = await externalize_message_blobs(messages)
+    chat_message_records = _build_chat_message_records(messages)
 
-    await _delete_pending_placeholder(db=db, message_id=assistant_message_id)
+    await _delete_pending_placeholder(db=db, persistence=persistence)
 
     if persistence.replace_start_index is not None:
         replace_end_index = (
@@ -248,26 +289,25 @@ async def persist_regeneration(
             persistence.replace_start_index,
             replace_end_index,
         )
-        old_message_count = replace_end_index - persistence.replace_start_index + 1
-        message_index_offset = len(chat_message_records) - old_message_count
-        if message_index_offset:
-            await ai_message_dao.update_message_indexes_offset(
-                db,
-                persistence.conversation_id,
-                replace_end_index + 1,
-                message_index_offset,
-            )
-        message_index = persistence.replace_start_index
+        message_indexes = await _allocate_gap_message_indexes(
+            db=db,
+            conversation=conversation,
+            message_index=persistence.replace_start_index,
+            count=len(chat_message_records),
+        )
     elif persistence.insert_before_index is not None:
-        await ai_message_dao.update_message_indexes_offset(
+        message_indexes = await _allocate_gap_message_indexes(
+            db=db,
+            conversation=conversation,
+            message_index=persistence.insert_before_index,
+            count=len(chat_message_records),
+        )
+    else:
+        message_indexes = await ai_conversation_dao.allocate_message_indexes(
             db,
-            persistence.conversation_id,
-            persistence.insert_before_index,
+            conversation,
             len(chat_message_records),
         )
-        message_index = persistence.insert_before_index
-    else:
-        message_index = await ai_message_dao.get_next_message_index(db, persistence.conversation_id)
 
     await ai_message_dao.bulk_create(
         db,
@@ -276,15 +316,55 @@ async def persist_regeneration(
                 'conversation_id': persistence.conversation_id,
                 'provider_id': persistence.forwarded_props.provider_id,
                 'model_id': persistence.forwarded_props.model_id,
-                'message_index': message_index + offset,
+                'message_index': message_index,
                 'status': status,
                 **record,
             }
-            for offset, record in enumerate(chat_message_records)
+            for message_index, (record, _, _) in zip(message_indexes, chat_message_records, strict=True)
         ],
     )
 
 
+async def _allocate_gap_message_indexes(
+    *,
+    db: AsyncSession,
+    conversation: AIConversation,
+    message_index: int,
+    count: int,
+) -> list[int]:
+    """
+    在指定索引之前的空隙中分配消息索引，空隙不足时重新均匀编排对话消息索引并预留该位置
+
+    :param db: 数据库会话
+    :param conversation: 已锁定的对话
+    :param message_index: 插入位置，新消息排在不小于该索引的首条消息之前
+    :param count: 分配数量
+    :return:
+    """
+    lower_index, upper_index = await ai_message_dao.get_message_index_gap(
+        db,
+        conversation.conversation_id,
+        message_index,
+    )
+    if upper_index is None:
+        return await ai_conversation_dao.allocate_message_indexes(db, conversation, count)
+    lower_index = -1 if lower_index is None else lower_index
+    step = (upper_index - lower_index) // (count + 1)
+    if step >= 1:
+        return [lower_index + step * (offset + 1) for offset in range(count)]
+
+    rows = await ai_message_dao.get_message_index_rows(db, conversation.conversation_id)
+    position = sum(1 for _, row_message_index in rows if row_message_index < message_index)
+    rebalanced_indexes = {
+        pk: (row_position + (count if row_position >= position else 0)) * MESSAGE_INDEX_STRIDE
+        for row_position, (pk, _) in enumerate(rows)
+    }
+    await ai_message_dao.update_message_indexes(db, rebalanced_indexes)
+    await ai_conversation_dao.reset_next_message_index(db, conversation, (len(rows) + count) * MESSAGE_INDEX_STRIDE)
+    log.info(f'消息索引空隙不足，已重新编排 conversation_id={conversation.conversation_id} rows={len(rows)}')
+    return [(position + offset) * MESSAGE_INDEX_STRIDE for offset in range(count)]
+
+
 async def persist_terminal_completion(
     *,
     persistence: CompletionPersistenceContext,
@@ -313,7 +393,7 @@ async def persist_terminal_completion(
     except Exception as exc:
         log.exception(f'持久化聊天终态消息异常: {exc}')
         await _mark_placeholder_terminal(
-            message_id=persistence.assistant_message_id,
+            persistence=persistence,
             status=status,
         )
     else:
@@ -352,7 +432,7 @@ async def persist_terminal_regeneration(
     except Exception as exc:
         log.exception(f'持久化重生成终态消息异常: {exc}')
         await _mark_placeholder_terminal(
-            message_id=persistence.assistant_message_id,
+            persistence=persistence,
             status=status,
         )
     else:
@@ -366,31 +446,55 @@ async def persist_terminal_regeneration(
 async def _finalize_pending_placeholder(
     *,
     db: AsyncSession,
-    message_id: int,
+    persistence: CompletionPersistenceContext | RegenerationPersistenceContext,
     payload: dict[str, Any],
 ) -> None:
     """通过待生成状态校验防止过期任务覆盖新终态"""
-    count = await ai_message_dao.finalize_pending(db, message_id, payload)
+    assert persistence.assistant_message_id is not None
+    count = await ai_message_dao.finalize_pending(db, persistence.assistant_message_id, payload)
     if count == 0:
         raise errors.ConflictError(msg='生成任务已失效，请重试')
+    await _release_active_run(db=db, persistence=persistence)
 
 
-async def _delete_pending_placeholder(*, db: AsyncSession, message_id: int) -> None:
+async def _delete_pending_placeholder(
+    *,
+    db: AsyncSession,
+    persistence: CompletionPersistenceContext | RegenerationPersistenceContext,
+) -> None:
     """通过待生成状态校验删除重生成占位消息"""
-    count = await ai_message_dao.delete_pending(db, message_id)
+    assert persistence.assistant_message_id is not None
+    count = await ai_message_dao.delete_pending(db, persistence.assistant_message_id)
     if count == 0:
         raise errors.ConflictError(msg='生成任务已失效，请重试')
+    await _release_active_run(db=db, persistence=persistence)
 
 
-async def _mark_placeholder_terminal(*, message_id: int | None, status: AIMessageStatus) -> None:
+async def _release_active_run(
+    *,
+    db: AsyncSession,
+    persistence: CompletionPersistenceContext | RegenerationPersistenceContext,
+) -> None:
+    """清除对话上当前任务的生成标记"""
+    if persistence.run_id is not None:
+        await ai_conversation_dao.clear_active_run(db, persistence.conversation_id, persistence.run_id)
+
+
+async def _mark_placeholder_terminal(
+    *,
+    persistence: CompletionPersistenceContext | RegenerationPersistenceContext,
+    status: AIMessageStatus,
+) -> None:
     """
     在主持久化失败后兜底释放生成占位消息
 
-    :param message_id: 占位消息 ID
+    :param persistence: 持久化上下文
     :param status: 目标终态
     :return:
     """
-    if message_id is None:
+    if persistence.assistant_message_id is None:
         return
     async with async_db_session.begin() as db:
-        await ai_message_dao.finalize_pending(db, message_id, {'status': status})
+        count = await ai_message_dao.finalize_pending(db, persistence.assistant_message_id, {'status': status})
+        if count:
+            await _release_active_run(db=db, persistence=persistence)
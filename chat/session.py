@@ -1,8 +1,6 @@
 from collections.abc import Awaitable, Callable
 from typing import Any
 
-import httpx
-
 from pydantic_ai import Agent, AgentRunResult
 from pydantic_ai.models import Model
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -19,6 +17,7 @@ from backend.plugin.ai.chat.persistence import (
     persist_terminal_completion,
 )
 from backend.plugin.ai.chat.pipeline import assemble_capabilities
+from backend.plugin.ai.chat.write_behind import completion_write_behind
 from backend.plugin.ai.dataclasses import (
     ChatAgentDeps,
     ChatRunContext,
@@ -27,26 +26,28 @@ from backend.plugin.ai.dataclasses import (
 )
 from backend.plugin.ai.enums import AIMessageStatus
 from backend.plugin.ai.policy.context import AIInvocationContext, AIInvocationResult
-from backend.plugin.ai.policy.registry import notify_ai_invocation_result
+from backend.plugin.ai.policy.dispatcher import ai_policy_dispatcher
 from backend.plugin.ai.protocol.base import ChatAgent, ChatModelMessage, ChatProtocolAdapter
 from backend.plugin.ai.providers.base import ProviderAdapter
-from backend.plugin.ai.providers.http import build_retry_http_client
+from backend.plugin.ai.providers.model_cache import provider_model_cache
 from backend.plugin.ai.schema.chat import AIChatForwardedPropsParam
+from backend.plugin.ai.utils.timing import ChatPhaseTimings
 
 
 class AgentSession:
-    """对话运行时会话，拥有 HTTP/SDK 客户端、模型与 agent 生命周期"""
+    """对话运行时会话，借用缓存的模型实例，拥有 agent 生命周期"""
 
     def __init__(
         self,
         *,
         adapter: ProviderAdapter,
         model: Model,
-        http_client: httpx.AsyncClient,
+        timings: ChatPhaseTimings | None = None,
     ) -> None:
         self.adapter = adapter
         self.model = model
-        self._http_client = http_client
+        self.timings = timings or ChatPhaseTimings()
+        self.history_row_limit: int | None = None
         self._closed = False
         self.invocation_context: AIInvocationContext | None = None
 
@@ -55,42 +56,38 @@ class AgentSession:
         cls,
         *,
         adapter: ProviderAdapter,
+        provider_id: int,
         model_name: str,
         api_key: str,
         base_url: str,
+        timings: ChatPhaseTimings | None = None,
     ) -> 'AgentSession':
         """
-        打开会话并构建模型实例
+        打开会话并借用模型实例
 
         :param adapter: 供应商适配器
+        :param provider_id: 供应商 ID
         :param model_name: 模型名称
         :param api_key: API 密钥
         :param base_url: API 基础地址
+        :param timings: 阶段耗时记录
         :return:
         """
-        http_client = build_retry_http_client()
-        try:
-            model = adapter.create_model(
-                model_name=model_name,
-                api_key=api_key,
-                base_url=base_url,
-                http_client=http_client,
-            )
-        except Exception:
-            await http_client.aclose()
-            raise
-        return cls(adapter=adapter, model=model, http_client=http_client)
+        model = await provider_model_cache.acquire(
+            provider_id=provider_id,
+            adapter=adapter,
+            model_name=model_name,
+            api_key=api_key,
+            base_url=base_url,
+        )
+        return cls(adapter=adapter, model=model, timings=timings)
 
     async def aclose(self) -> None:
-        """幂等关闭会话及其客户端资源"""
+        """幂等关闭会话，并将模型实例归还缓存"""
         if self._closed:
             return
         self._closed = True
-        try:
-            await self.adapter.aclose(self.model)
-        finally:
-            if not self._http_client.is_closed:
-                await self._http_client.aclose()
+        await provider_model_cache.release(self.model)
 
     async def build_agent(
         self,
@@ -113,15 +110,16 @@ class AgentSession:
         supports_tools = bool(profile.get('supports_tools', False))
         supported_native_tools = profile.get('supported_native_tools', frozenset())
         supports_image_output = bool(profile.get('supports_image_output', False))
-        capabilities = await assemble_capabilities(
-            db=db,
-            adapter=self.adapter,
-            forwarded_props=forwarded_props,
-            supports_tools=supports_tools,
-            supported_native_tools=supported_native_tools,
-            supports_image_output=supports_image_output,
-            context_management=context_management,
-        )
+        with self.timings.measure('capabilities'):
+            capabilities = await assemble_capabilities(
+                db=db,
+                adapter=self.adapter,
+                forwarded_props=forwarded_props,
+                supports_tools=supports_tools,
+                supported_native_tools=supported_native_tools,
+                supports_image_output=supports_image_output,
+                context_management=context_management,
+            )
         model_settings = build_model_settings(
             adapter=self.adapter,
             forwarded_props=forwarded_props,
@@ -172,12 +170,13 @@ class AgentSession:
 
         async def default_on_complete(result: AgentRunResult[Any]) -> None:
             assert persistence is not None
-            async with async_db_session.begin() as db:
-                await persist_completion(
-                    db=db,
-                    persistence=persistence,
-                    messages=extract_assistant_run_messages(result),
-                )
+            with self.timings.measure('persist'):
+                async with async_db_session.begin() as db:
+                    await persist_completion(
+                        db=db,
+                        persistence=persistence,
+                        messages=extract_assistant_run_messages(result),
+                    )
 
         async def default_on_run_error(message: str, messages: list[ChatModelMessage]) -> None:
             assert persistence is not None
@@ -197,15 +196,24 @@ class AgentSession:
             )
 
         async def complete_with_policy(result: AgentRunResult[Any]) -> None:
+            invocation_result = (
+                AIInvocationResult.from_agent_result(result) if self.invocation_context is not None else None
+            )
+            if on_complete is None and persistence is not None and completion_write_behind.enabled:
+                # 后写模式下持久化与策略通知由后台任务完成，响应无需等待数据库
+                with self.timings.measure('persist_enqueue'):
+                    submitted = await completion_write_behind.submit(
+                        persistence=persistence,
+                        messages=extract_assistant_run_messages(result),
+                        invocation_context=self.invocation_context,
+                        invocation_result=invocation_result,
+                    )
+                if submitted:
+                    return
             await (on_complete or default_on_complete)(result)
-            if self.invocation_context is None:
+            if self.invocation_context is None or invocation_result is None:
                 return
-            async with async_db_session.begin() as db:
-                await notify_ai_invocation_result(
-                    db=db,
-                    context=self.invocation_context,
-                    result=AIInvocationResult.from_agent_result(result),
-                )
+            await ai_policy_dispatcher.dispatch(context=self.invocation_context, result=invocation_result)
 
         async def on_finish() -> None:
             try:
@@ -223,4 +231,5 @@ class AgentSession:
             on_run_error=on_run_error or default_on_run_error,
             on_interrupted=on_interrupted or default_on_interrupted,
             on_finish=on_finish,
+            timings=self.timings,
         )
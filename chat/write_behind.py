@@ -0,0 +1,421 @@
+import asyncio
+import os
+import threading
+
+from collections.abc import Sequence
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import BinaryIO
+
+import anyio
+
+from pydantic import ConfigDict, TypeAdapter, ValidationError, with_config
+from pydantic_core import PydanticSerializationError
+
+from backend.common.exception import errors
+from backend.common.log import log
+from backend.core.conf import settings
+from backend.core.path_conf import BASE_PATH
+from backend.database.db import async_db_session, uuid4_str
+from backend.plugin.ai.chat.persistence import persist_completion, persist_terminal_completion
+from backend.plugin.ai.dataclasses import CompletionPersistenceContext
+from backend.plugin.ai.enums import AIMessageStatus
+from backend.plugin.ai.policy.context import AIInvocationContext, AIInvocationResult
+from backend.plugin.ai.policy.dispatcher import ai_policy_dispatcher
+from backend.plugin.ai.protocol.base import ChatModelMessage
+from backend.plugin.ai.utils.message_storage import externalize_message_blobs
+from backend.plugin.ai.utils.metrics import ai_metrics_registry
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+persist_queue_depth = ai_metrics_registry.gauge(
+    'ai_persist_queue_depth',
+    '待写入数据库的聊天完成结果数量',
+)
+persist_write_total = ai_metrics_registry.counter(
+    'ai_persist_writes',
+    '聊天完成结果写入次数',
+    ('outcome',),
+)
+
+_SPILL_FILE_PREFIX = 'spill-'
+_SPILL_FILE_SUFFIX = '.jsonl'
+
+
+@dataclass(frozen=True, slots=True)
+class _CompletionWrite:
+    """待写入的聊天完成结果"""
+
+    write_id: str
+    persistence: CompletionPersistenceContext
+    messages: list[ChatModelMessage]
+    invocation_context: AIInvocationContext | None = None
+    invocation_result: AIInvocationResult | None = None
+
+
+@with_config(ConfigDict(ser_json_bytes='base64', val_json_bytes='base64'))
+@dataclass(frozen=True, slots=True)
+class _SpillRecord:
+    """溢写文件记录，put 记录完整写入任务，done 记录已确认写入的任务 ID；未外置的二进制内容按 base64 编码"""
+
+    op: str
+    write: _CompletionWrite | None = None
+    write_ids: tuple[str, ...] = ()
+
+
+_spill_record_adapter: TypeAdapter[_SpillRecord] = TypeAdapter(_SpillRecord)
+
+
+def _resolve_spill_dir() -> Path:
+    spill_dir = Path(settings.AI_PERSIST_SPILL_DIR)
+    return spill_dir if spill_dir.is_absolute() else BASE_PATH / spill_dir
+
+
+def _dump_spill_record(record: _SpillRecord) -> bytes:
+    return _spill_record_adapter.dump_json(record, by_alias=True) + b'\n'
+
+
+class _SpillFile:
+    """当前进程的溢写文件
+
+    写入任务入队前先追加 put 记录并落盘，确认写入数据库后追加 done 记录；
+    文件在进程存活期间持有排他锁，所有任务确认后截断，进程正常退出且无遗留任务时删除
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = path.open('ab')
+        self._lock = threading.Lock()
+        self._pending: set[str] = set()
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    @classmethod
+    def create(cls, spill_dir: Path) -> '_SpillFile':
+        """
+        在溢写目录中创建当前进程的溢写文件
+
+        :param spill_dir: 溢写目录
+        :return:
+        """
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        return cls(spill_dir / f'{_SPILL_FILE_PREFIX}{os.getpid()}-{uuid4_str()}{_SPILL_FILE_SUFFIX}')
+
+    def _append(self, data: bytes, write_ids: tuple[str, ...], *, done: bool) -> None:
+        with self._lock:
+            if done:
+                self._pending.difference_update(write_ids)
+                if not self._pending:
+                    self._file.truncate(0)
+                    self._file.seek(0)
+                    return
+            else:
+                self._pending.update(write_ids)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    async def append_put(self, write: _CompletionWrite) -> None:
+        """
+        记录待写入任务
+
+        :param write: 写入任务
+        :return:
+        """
+        spilled = write
+        if write.invocation_result is not None:
+            # 原始运行结果不可序列化，恢复时策略只能拿到用量统计
+            spilled = replace(write, invocation_result=replace(write.invocation_result, raw_result=None))
+        data = _dump_spill_record(_SpillRecord(op='put', write=spilled))
+        await anyio.to_thread.run_sync(lambda: self._append(data, (write.write_id,), done=False))
+
+    async def append_done(self, write_ids: tuple[str, ...]) -> None:
+        """
+        记录已确认写入的任务
+
+        :param write_ids: 任务 ID
+        :return:
+        """
+        data = _dump_spill_record(_SpillRecord(op='done', write_ids=write_ids))
+        await anyio.to_thread.run_sync(lambda: self._append(data, write_ids, done=True))
+
+    def close(self) -> None:
+        """关闭溢写文件，无遗留任务时删除"""
+        with self._lock:
+            self._file.close()
+            if not self._pending:
+                self.path.unlink(missing_ok=True)
+
+
+def _open_orphan_spill_file(path: Path) -> tuple[BinaryIO, list[_CompletionWrite]] | None:
+    """
+    打开并锁定已无进程持有的溢写文件，读取其中未确认的任务；调用方需在任务写入并删除文件后关闭文件释放锁
+
+    :param path: 溢写文件路径
+    :return: 文件已被其他进程处理或仍被持有时返回 None
+    """
+    try:
+        file = path.open('rb')
+    except FileNotFoundError:
+        return None
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                return None
+        if os.fstat(file.fileno()).st_nlink == 0:
+            # 等待锁期间其他进程已恢复并删除该文件
+            file.close()
+            return None
+        writes: dict[str, _CompletionWrite] = {}
+        for line in file:
+            try:
+                record = _spill_record_adapter.validate_json(line)
+            except ValidationError:
+                # 进程崩溃时末行可能不完整，该任务未入队，客户端也未收到完成响应
+                log.warning(f'跳过无法解析的溢写记录 path={path}')
+                continue
+            if record.op == 'put' and record.write is not None:
+                writes[record.write.write_id] = record.write
+            elif record.op == 'done':
+                for write_id in record.write_ids:
+                    writes.pop(write_id, None)
+    except BaseException:
+        file.close()
+        raise
+    return file, list(writes.values())
+
+
+async def _dispatch_notifications(writes: Sequence[_CompletionWrite]) -> None:
+    """
+    在持久化事务提交后派发策略通知，通知失败不影响已写入的结果
+
+    :param writes: 已写入的任务
+    :return:
+    """
+    for write in writes:
+        if write.invocation_context is None or write.invocation_result is None:
+            continue
+        try:
+            await ai_policy_dispatcher.dispatch(context=write.invocation_context, result=write.invocation_result)
+        except Exception as exc:  # ruff:ignore[try-except-in-loop]
+            log.exception(f'AI 调用后策略通知异常: {exc}')
+
+
+async def _write_one(write: _CompletionWrite) -> None:
+    """
+    在独立事务中写入单个任务，失败时按错误终态回写
+
+    :param write: 写入任务
+    :return:
+    """
+    try:
+        async with async_db_session.begin() as db:
+            await persist_completion(db=db, persistence=write.persistence, messages=write.messages)
+    except errors.ConflictError:
+        # 占位消息已不是待生成状态，说明该任务已写入或已被回收
+        persist_write_total.inc(outcome='conflict')
+        log.warning(f'聊天完成结果已失效，跳过写入 conversation_id={write.persistence.conversation_id}')
+    except Exception as exc:
+        persist_write_total.inc(outcome='error')
+        log.exception(f'写入聊天完成结果异常: {exc}')
+        await persist_terminal_completion(
+            persistence=write.persistence,
+            messages=write.messages,
+            status=AIMessageStatus.error,
+            reason=str(exc),
+        )
+    else:
+        persist_write_total.inc(outcome='success')
+        await _dispatch_notifications([write])
+
+
+class CompletionWriteBehind:
+    """聊天完成结果后写队列
+
+    流式响应完成时只将结果写入溢写文件并放入有界队列，由后台任务按批在同一事务中写入，事务提交后再派发策略通知；
+    每个任务使用独立 savepoint；写入确认前占位消息保持待生成状态，对话生成标记也不会释放。
+    队列已满或未启用时由调用方同步写入；进程异常退出后，未确认的任务在下次启动时从溢写文件恢复
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[_CompletionWrite] | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._spill_file: _SpillFile | None = None
+        self._closing = False
+
+    @property
+    def enabled(self) -> bool:
+        """是否接受新的写入任务"""
+        return self._worker is not None and not self._worker.done() and not self._closing
+
+    async def start(self) -> None:
+        """恢复遗留的溢写文件，并在启用后写时启动后台任务"""
+        spill_dir = _resolve_spill_dir()
+        if spill_dir.is_dir():
+            await self._recover(spill_dir)
+        if not settings.AI_PERSIST_WRITE_BEHIND or self._worker is not None:
+            return
+        self._spill_file = await anyio.to_thread.run_sync(_SpillFile.create, spill_dir)
+        self._queue = asyncio.Queue(maxsize=max(settings.AI_PERSIST_QUEUE_SIZE, 1))
+        self._worker = asyncio.create_task(self._run())
+
+    async def submit(
+        self,
+        *,
+        persistence: CompletionPersistenceContext,
+        messages: list[ChatModelMessage],
+        invocation_context: AIInvocationContext | None = None,
+        invocation_result: AIInvocationResult | None = None,
+    ) -> bool:
+        """
+        提交聊天完成结果
+
+        :param persistence: 持久化上下文，需包含占位消息
+        :param messages: 待持久化消息
+        :param invocation_context: AI 调用策略上下文
+        :param invocation_result: AI 调用结果策略上下文
+        :return: 未启用、队列已满、缺少占位消息或无法序列化时返回 False，由调用方同步写入
+        """
+        if not self.enabled or persistence.assistant_message_id is None:
+            return False
+        assert self._queue is not None and self._spill_file is not None
+        if self._queue.full():
+            persist_write_total.inc(outcome='fallback')
+            return False
+        write = _CompletionWrite(
+            write_id=uuid4_str(),
+            persistence=persistence,
+            messages=await externalize_message_blobs(messages),
+            invocation_context=invocation_context,
+            invocation_result=invocation_result,
+        )
+        try:
+            await self._spill_file.append_put(write)
+        except PydanticSerializationError as exc:
+            log.warning(f'聊天完成结果无法写入溢写文件，改为同步写入: {exc}')
+            persist_write_total.inc(outcome='fallback')
+            return False
+        try:
+            self._queue.put_nowait(write)
+        except asyncio.QueueFull:
+            await self._spill_file.append_done((write.write_id,))
+            persist_write_total.inc(outcome='fallback')
+            return False
+        persist_queue_depth.set(self._queue.qsize())
+        return True
+
+    async def _run(self) -> None:
+        """按批取出任务写入数据库"""
+        assert self._queue is not None
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < max(settings.AI_PERSIST_BATCH_SIZE, 1):
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._write_batch(batch)
+            except Exception as exc:
+                # 确认记录写入失败时任务仍保留在溢写文件中，下次启动时按占位消息状态幂等恢复
+                log.exception(f'聊天完成结果后写批次异常: {exc}')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                persist_queue_depth.set(self._queue.qsize())
+
+    async def _write_batch(self, batch: list[_CompletionWrite]) -> None:
+        """
+        在同一事务中写入一批任务，整批提交失败时逐个重试
+
+        :param batch: 写入任务
+        :return:
+        """
+        assert self._spill_file is not None
+        failed: list[_CompletionWrite] = []
+        persisted: list[_CompletionWrite] = []
+        conflicted = 0
+        try:
+            async with async_db_session.begin() as db:
+                for write in batch:
+                    try:
+                        async with db.begin_nested():
+                            await persist_completion(db=db, persistence=write.persistence, messages=write.messages)
+                    except errors.ConflictError:  # ruff:ignore[try-except-in-loop]
+                        conflicted += 1
+                        log.warning(
+                            f'聊天完成结果已失效，跳过写入 conversation_id={write.persistence.conversation_id}'
+                        )
+                        continue
+                    except Exception:  # ruff:ignore[try-except-in-loop]
+                        failed.append(write)
+                        continue
+                    persisted.append(write)
+        except Exception as exc:
+            log.warning(f'聊天完成结果批量写入失败，逐个重试: {exc}')
+            for write in batch:
+                await _write_one(write)
+        else:
+            persist_write_total.inc(len(batch) - len(failed) - conflicted, outcome='success')
+            if conflicted:
+                persist_write_total.inc(conflicted, outcome='conflict')
+            await _dispatch_notifications(persisted)
+            for write in failed:
+                await _write_one(write)
+        await self._spill_file.append_done(tuple(write.write_id for write in batch))
+
+    async def _recover(self, spill_dir: Path) -> None:
+        """
+        写入其他已退出进程遗留的溢写任务
+
+        :param spill_dir: 溢写目录
+        :return:
+        """
+        own_path = self._spill_file.path if self._spill_file is not None else None
+        for path in sorted(spill_dir.glob(f'{_SPILL_FILE_PREFIX}*{_SPILL_FILE_SUFFIX}')):
+            if path == own_path:
+                continue
+            opened = await anyio.to_thread.run_sync(_open_orphan_spill_file, path)
+            if opened is None:
+                continue
+            # 写入并删除前保持文件锁，避免多个进程同时启动时重复恢复同一文件
+            file, writes = opened
+            try:
+                if writes:
+                    log.warning(f'从溢写文件恢复聊天完成结果 path={path} count={len(writes)}')
+                for write in writes:
+                    await _write_one(write)
+                path.unlink(missing_ok=True)
+            finally:
+                file.close()
+
+    async def aclose(self) -> None:
+        """停止接受新任务，等待队列中的任务写入完成后关闭溢写文件"""
+        worker = self._worker
+        if worker is None:
+            return
+        queue = self._queue
+        assert queue is not None and self._spill_file is not None
+        self._closing = True
+        if not worker.done():
+            await queue.join()
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        self._queue = None
+        await anyio.to_thread.run_sync(self._spill_file.close)
+        self._spill_file = None
+        self._closing = False
+        persist_queue_depth.set(0)
+
+
+completion_write_behind: CompletionWriteBehind = CompletionWriteBehind()
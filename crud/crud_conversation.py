@@ -1,13 +1,19 @@
 from datetime import datetime
+from typing import Any
 
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import Select
 from sqlalchemy_crud_plus import CRUDPlus
 
 from backend.plugin.ai.model import AIConversation
-from backend.plugin.ai.schema.conversation import CreateAIConversationParam, UpdateAIConversationParam
+from backend.plugin.ai.schema.conversation import CreateAIConversationParam
 from backend.utils.timezone import timezone
 
+# 消息索引步长，相邻消息之间预留空隙，重生成插入或替换回复段时无需平移后续消息
+MESSAGE_INDEX_STRIDE = 1024
+
 
 class CRUDAIConversation(CRUDPlus[AIConversation]):
     """AI 对话数据库操作类"""
@@ -38,13 +44,17 @@ class CRUDAIConversation(CRUDPlus[AIConversation]):
         conversation_id: str,
     ) -> AIConversation | None:
         """
-        通过对话 ID 获取并锁定对话
+        通过对话 ID 获取并锁定对话，会话中已加载的对话对象会以锁定后读取的行刷新
 
         :param db: 数据库会话
         :param conversation_id: 对话 ID
         :return:
         """
-        stmt = (await self.select(conversation_id=conversation_id, deleted=0)).with_for_update()
+        stmt = (
+            (await self.select(conversation_id=conversation_id, deleted=0))
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
         return await db.scalar(stmt)
 
     async def get_select(self, user_id: int) -> Select[tuple[AIConversation]]:
@@ -66,16 +76,161 @@ class CRUDAIConversation(CRUDPlus[AIConversation]):
         """
         await self.create_model(db, obj)
 
-    async def update(self, db: AsyncSession, pk: int, obj: UpdateAIConversationParam) -> int:
+    async def touch_model(self, db: AsyncSession, pk: int, provider_id: int, model_id: str) -> int:
+        """
+        更新对话当前使用的模型
+
+        :param db: 数据库会话
+        :param pk: ID
+        :param provider_id: 供应商 ID
+        :param model_id: 模型 ID
+        :return:
+        """
+        return await self.update_model_by_column(
+            db,
+            {'provider_id': provider_id, 'model_id': model_id},
+            id=pk,
+            deleted=0,
+        )
+
+    async def set_context_boundary(
+        self,
+        db: AsyncSession,
+        pk: int,
+        context_start_message_id: int | None,
+        context_cleared_time: datetime | None,
+    ) -> int:
         """
-        更新对话
+        更新对话上下文边界
 
         :param db: 数据库会话
         :param pk: ID
-        :param obj: 更新对话参数
+        :param context_start_message_id: 上下文起始消息 ID
+        :param context_cleared_time: 上下文清除时间
         :return:
         """
-        return await self.update_model_by_column(db, obj, id=pk, deleted=0)
+        return await self.update_model_by_column(
+            db,
+            {'context_start_message_id': context_start_message_id, 'context_cleared_time': context_cleared_time},
+            id=pk,
+            deleted=0,
+        )
+
+    async def _advance_message_index(
+        self,
+        db: AsyncSession,
+        conversation: AIConversation,
+        count: int,
+        values: dict[str, Any],
+    ) -> list[int]:
+        """
+        在一次更新中按步长分配消息索引并写入附带字段
+
+        :param db: 数据库会话
+        :param conversation: 已锁定的对话
+        :param count: 分配数量
+        :param values: 附带更新字段
+        :return:
+        """
+        span = count * MESSAGE_INDEX_STRIDE
+        start = conversation.next_message_index
+        stmt = (
+            update(self.model)
+            .where(self.model.id == conversation.id)
+            .values(next_message_index=self.model.next_message_index + span, **values)
+            .execution_options(synchronize_session=False)
+        )
+        if db.bind.dialect.update_returning:
+            result = await db.execute(stmt.returning(self.model.next_message_index))
+            start = result.scalar_one() - span
+        else:
+            await db.execute(stmt)
+        set_committed_value(conversation, 'next_message_index', start + span)
+        for key, value in values.items():
+            set_committed_value(conversation, key, value)
+        return [start + offset * MESSAGE_INDEX_STRIDE for offset in range(count)]
+
+    async def allocate_message_indexes(self, db: AsyncSession, conversation: AIConversation, count: int) -> list[int]:
+        """
+        在对话末尾按步长分配消息索引，调用方需已通过 get_by_conversation_id_for_update 锁定对话行
+
+        :param db: 数据库会话
+        :param conversation: 已锁定的对话
+        :param count: 分配数量
+        :return: 分配的消息索引
+        """
+        return await self._advance_message_index(db, conversation, count, {})
+
+    async def start_turn(
+        self,
+        db: AsyncSession,
+        conversation: AIConversation,
+        *,
+        provider_id: int,
+        model_id: str,
+        run_id: str,
+        count: int,
+    ) -> list[int]:
+        """
+        开始生成任务，以一次更新写入当前模型、生成任务标记并分配消息索引，调用方需已锁定对话行
+
+        :param db: 数据库会话
+        :param conversation: 已锁定的对话
+        :param provider_id: 供应商 ID
+        :param model_id: 模型 ID
+        :param run_id: 生成任务 ID
+        :param count: 分配的消息索引数量
+        :return: 分配的消息索引
+        """
+        return await self._advance_message_index(
+            db,
+            conversation,
+            count,
+            {
+                'provider_id': provider_id,
+                'model_id': model_id,
+                'active_run_id': run_id,
+                'active_since': timezone.now(),
+            },
+        )
+
+    async def reset_next_message_index(self, db: AsyncSession, conversation: AIConversation, value: int) -> None:
+        """
+        重置对话的下一条消息索引，调用方需已锁定对话行
+
+        :param db: 数据库会话
+        :param conversation: 已锁定的对话
+        :param value: 下一条消息索引
+        :return:
+        """
+        await db.execute(
+            update(self.model)
+            .where(self.model.id == conversation.id)
+            .values(next_message_index=value)
+            .execution_options(synchronize_session=False)
+        )
+        set_committed_value(conversation, 'next_message_index', value)
+
+    async def clear_active_run(self, db: AsyncSession, conversation_id: str, run_id: str) -> int:
+        """
+        清除对话生成任务标记，仅当标记仍属于该任务时生效
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param run_id: 生成任务 ID
+        :return:
+        """
+        result = await db.execute(
+            update(self.model)
+            .where(
+                self.model.conversation_id == conversation_id,
+                self.model.active_run_id == run_id,
+                self.model.deleted == 0,
+            )
+            .values(active_run_id=None, active_since=None)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
 
     async def update_title(self, db: AsyncSession, pk: int, title: str) -> int:
         """
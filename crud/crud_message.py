@@ -1,7 +1,8 @@
-from collections.abc import Sequence
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
 from typing import Any
 
-from sqlalchemy import Select, update
+from sqlalchemy import Select, and_, func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy_crud_plus import CRUDPlus
 
@@ -49,6 +50,146 @@ class CRUDAIMessage(CRUDPlus[AIMessage]):
             deleted=0,
         )
 
+    async def get_page_by_message_index(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        *,
+        limit: int,
+        before_message_index: int | None = None,
+        before_message_id: int | None = None,
+    ) -> list[AIMessage]:
+        """
+        按聊天上下文顺序获取指定索引之前最近的一页消息，多取一条用于判断是否还有更早的消息
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param limit: 每页消息数量
+        :param before_message_index: 仅获取索引小于该值的消息，为空时从最新消息开始
+        :param before_message_id: 与 before_message_index 组成游标，同时获取索引相同且 ID 小于该值的消息
+        :return:
+        """
+        stmt = select(self.model).where(self.model.conversation_id == conversation_id, self.model.deleted == 0)
+        if before_message_index is not None and before_message_id is not None:
+            stmt = stmt.where(
+                or_(
+                    self.model.message_index < before_message_index,
+                    and_(
+                        self.model.message_index == before_message_index,
+                        self.model.id < before_message_id,
+                    ),
+                )
+            )
+        elif before_message_index is not None:
+            stmt = stmt.where(self.model.message_index < before_message_index)
+        stmt = stmt.order_by(self.model.message_index.desc(), self.model.id.desc()).limit(limit + 1)
+        result = await db.execute(stmt)
+        return list(reversed(result.scalars().all()))
+
+    async def stream_by_message_index(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        *,
+        chunk_size: int,
+    ) -> AsyncIterator[Sequence[AIMessage]]:
+        """
+        按聊天上下文顺序分块读取对话全部消息，使用服务端游标，内存占用与对话长度无关
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param chunk_size: 每块消息数量
+        :return:
+        """
+        stmt = (
+            select(self.model)
+            .where(self.model.conversation_id == conversation_id, self.model.deleted == 0)
+            .order_by(self.model.message_index, self.model.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        result = await db.stream_scalars(stmt)
+        async for rows in result.partitions():
+            yield rows
+
+    def _select_context_window(self, conversation_id: str, context_start_message_id: int | None) -> Select:
+        """
+        构建上下文边界之后的消息查询表达式
+
+        :param conversation_id: 对话 ID
+        :param context_start_message_id: 上下文边界消息 ID，边界消息不存在时不过滤
+        :return:
+        """
+        stmt = select(self.model).where(self.model.conversation_id == conversation_id, self.model.deleted == 0)
+        if context_start_message_id is not None:
+            boundary_index = (
+                select(self.model.message_index)
+                .where(
+                    self.model.id == context_start_message_id,
+                    self.model.conversation_id == conversation_id,
+                    self.model.deleted == 0,
+                )
+                .scalar_subquery()
+            )
+            stmt = stmt.where(
+                or_(
+                    self.model.message_index > func.coalesce(boundary_index, -1),
+                    and_(
+                        self.model.message_index == boundary_index,
+                        self.model.id > context_start_message_id,
+                    ),
+                )
+            )
+        return stmt
+
+    async def get_context_window_by_message_index(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        context_start_message_id: int | None,
+        *,
+        limit: int | None = None,
+    ) -> Sequence[AIMessage]:
+        """
+        按聊天上下文顺序获取上下文边界之后的消息
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param context_start_message_id: 上下文边界消息 ID，边界消息不存在时返回全部消息
+        :param limit: 仅获取最近的消息数量
+        :return:
+        """
+        stmt = self._select_context_window(conversation_id, context_start_message_id)
+        if limit is None:
+            stmt = stmt.order_by(self.model.message_index.asc(), self.model.id.asc())
+            result = await db.execute(stmt)
+            return result.scalars().all()
+        stmt = stmt.order_by(self.model.message_index.desc(), self.model.id.desc()).limit(limit)
+        result = await db.execute(stmt)
+        return list(reversed(result.scalars().all()))
+
+    async def get_context_window_first_user_message(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        context_start_message_id: int | None,
+    ) -> AIMessage | None:
+        """
+        获取上下文边界之后的首条用户消息
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param context_start_message_id: 上下文边界消息 ID
+        :return:
+        """
+        stmt = (
+            self._select_context_window(conversation_id, context_start_message_id)
+            .where(self.model.role == 'user')
+            .order_by(self.model.message_index.asc(), self.model.id.asc())
+            .limit(1)
+        )
+        result = await db.execute(stmt)
+        return result.scalars().first()
+
     async def get_select(self, conversation_id: str) -> Select:
         """
         获取对话消息查询表达式
@@ -58,34 +199,36 @@ class CRUDAIMessage(CRUDPlus[AIMessage]):
         """
         return await self.select_order('id', 'asc', conversation_id=conversation_id, deleted=0)
 
-    async def get_next_message_index(self, db: AsyncSession, conversation_id: str) -> int:
+    async def get_row_versions(self, db: AsyncSession, pks: Sequence[int]) -> dict[int, tuple[datetime | None, str]]:
         """
-        获取下一条消息索引
+        获取消息行的更新时间和状态
 
         :param db: 数据库会话
-        :param conversation_id: 对话 ID
+        :param pks: 消息 ID 列表
         :return:
         """
-        rows = await self.select_models_order(
-            db,
-            'message_index',
-            'desc',
-            conversation_id=conversation_id,
-            deleted=0,
-            limit=1,
+        if not pks:
+            return {}
+        result = await db.execute(
+            select(self.model.id, self.model.updated_time, self.model.status).where(
+                self.model.id.in_(pks),
+                self.model.deleted == 0,
+            )
         )
-        return (rows[0].message_index if rows else -1) + 1
+        return {pk: (updated_time, status) for pk, updated_time, status in result.all()}
 
-    async def has_pending(self, db: AsyncSession, conversation_id: str) -> bool:
+    async def interrupt_pending(self, db: AsyncSession, conversation_id: str) -> int:
         """
-        检查对话是否存在待完成消息
+        将对话中的待生成消息标记为已中断
 
         :param db: 数据库会话
         :param conversation_id: 对话 ID
         :return:
         """
-        return await self.exists(
+        return await self.update_model_by_column(
             db,
+            {'status': AIMessageStatus.interrupted},
+            allow_multiple=True,
             conversation_id=conversation_id,
             status=AIMessageStatus.pending,
             deleted=0,
@@ -104,6 +247,19 @@ class CRUDAIMessage(CRUDPlus[AIMessage]):
         await db.flush()
         return message
 
+    async def create_many(self, db: AsyncSession, objs: list[dict[str, Any]]) -> list[AIMessage]:
+        """
+        在一次刷新中创建多条消息并返回 ORM 对象
+
+        :param db: 数据库会话
+        :param objs: 消息列表
+        :return:
+        """
+        messages = [self.model(**obj) for obj in objs]
+        db.add_all(messages)
+        await db.flush()
+        return messages
+
     async def bulk_create(self, db: AsyncSession, objs: list[dict[str, Any]]) -> None:
         """
         批量创建消息
@@ -123,34 +279,56 @@ class CRUDAIMessage(CRUDPlus[AIMessage]):
         ]
         await self.bulk_create_models(db, payloads)
 
-    async def update_message_indexes_offset(
+    async def get_message_index_gap(
         self,
         db: AsyncSession,
         conversation_id: str,
-        start_message_index: int,
-        offset: int,
-    ) -> int:
+        message_index: int,
+    ) -> tuple[int | None, int | None]:
         """
-        平移指定索引及之后的消息索引
+        获取指定索引所在空隙的上下界，即小于该索引的最大索引和不小于该索引的最小索引
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param message_index: 消息索引
+        :return:
+        """
+        filters = (self.model.conversation_id == conversation_id, self.model.deleted == 0)
+        lower = select(func.max(self.model.message_index)).where(*filters, self.model.message_index < message_index)
+        upper = select(func.min(self.model.message_index)).where(*filters, self.model.message_index >= message_index)
+        result = await db.execute(select(lower.scalar_subquery(), upper.scalar_subquery()))
+        lower_index, upper_index = result.one()
+        return lower_index, upper_index
+
+    async def get_message_index_rows(self, db: AsyncSession, conversation_id: str) -> list[tuple[int, int]]:
+        """
+        按聊天上下文顺序获取对话消息的 ID 和索引
 
         :param db: 数据库会话
         :param conversation_id: 对话 ID
-        :param start_message_index: 起始消息索引
-        :param offset: 平移偏移量
         :return:
         """
-        if offset == 0:
-            return 0
         result = await db.execute(
-            update(self.model)
-            .where(
-                self.model.conversation_id == conversation_id,
-                self.model.message_index >= start_message_index,
-                self.model.deleted == 0,
-            )
-            .values(message_index=self.model.message_index + offset)
+            select(self.model.id, self.model.message_index)
+            .where(self.model.conversation_id == conversation_id, self.model.deleted == 0)
+            .order_by(self.model.message_index.asc(), self.model.id.asc())
+        )
+        return [(pk, message_index) for pk, message_index in result.all()]
+
+    async def update_message_indexes(self, db: AsyncSession, message_indexes: dict[int, int]) -> None:
+        """
+        按消息 ID 批量更新消息索引
+
+        :param db: 数据库会话
+        :param message_indexes: 消息 ID 到新索引的映射
+        :return:
+        """
+        if not message_indexes:
+            return
+        await db.execute(
+            update(self.model),
+            [{'id': pk, 'message_index': message_index} for pk, message_index in message_indexes.items()],
         )
-        return result.rowcount or 0
 
     async def update(self, db: AsyncSession, pk: int, obj: dict[str, Any]) -> int:
         """
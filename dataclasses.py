@@ -31,6 +31,16 @@ class ChatConversationState:
     context_start_index: int
 
 
+@dataclass(slots=True)
+class ChatContextWindowState:
+    """聊天上下文窗口状态，仅包含上下文边界之后的消息"""
+
+    conversation: AIConversation
+    message_rows: list[AIMessage]
+    model_messages: list[ModelRequest | ModelResponse]
+    row_model_message_ranges: list[tuple[int, int]]
+
+
 @dataclass(frozen=True, slots=True)
 class ChatRunContext:
     """协议运行上下文，核心聊天流程只读取通用字段"""
@@ -83,6 +93,7 @@ class CompletionPersistenceContext:
     forwarded_props: AIChatForwardedPropsParam
     title: str
     assistant_message_id: int | None = None
+    run_id: str | None = None
 
 
 @dataclass(frozen=True, slots=True)
@@ -96,6 +107,59 @@ class RegenerationPersistenceContext:
     expected_context_start_message_id: int | None = None
     expected_context_cleared_time: datetime | None = None
     assistant_message_id: int | None = None
+    run_id: str | None = None
     insert_before_index: int | None = None
     replace_start_index: int | None = None
     replace_end_index: int | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class AIProviderSnapshot:
+    """供应商元数据快照"""
+
+    id: int
+    name: str
+    type: int
+    api_key: str
+    api_host: str
+    status: int
+
+
+@dataclass(frozen=True, slots=True)
+class AIModelSnapshot:
+    """模型元数据快照"""
+
+    id: int
+    provider_id: int
+    model_id: str
+    status: int
+    context_max_part_chars: int | None
+    context_max_messages: int | None
+    context_keep_messages: int
+    context_max_tokens: int | None
+
+
+@dataclass(frozen=True, slots=True)
+class AIMcpSnapshot:
+    """MCP 元数据快照"""
+
+    id: int
+    name: str
+    command: str
+    type: int
+    url: str | None
+    headers: dict[str, Any] | None
+    args: list[str] | None
+    env: dict[str, Any] | None
+    timeout: float
+    read_timeout: float
+    tool_prefix: str | None
+    include_instructions: bool
+
+
+@dataclass(frozen=True, slots=True)
+class ChatStreamCoalescePolicy:
+    """流式增量事件合并策略"""
+
+    window: float
+    max_bytes: int
@@ -0,0 +1,30 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from backend.plugin.ai.chat.write_behind import completion_write_behind
+from backend.plugin.ai.policy.dispatcher import ai_policy_dispatcher
+from backend.plugin.ai.providers.http import provider_http_client_pool
+from backend.plugin.ai.providers.model_cache import provider_model_cache
+from backend.plugin.ai.utils.stream_resume import ai_stream_registry
+
+
+@asynccontextmanager
+async def ai_lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    AI 插件生命周期，启动时恢复遗留的后写任务，应用停止时中断未结束的可重连生成，写完队列中的任务与策略通知并释放进程级资源
+
+    :param app: FastAPI 应用
+    :return:
+    """
+    await ai_policy_dispatcher.start()
+    await completion_write_behind.start()
+    try:
+        yield
+    finally:
+        await ai_stream_registry.aclose()
+        await completion_write_behind.aclose()
+        await ai_policy_dispatcher.aclose()
+        await provider_model_cache.aclose()
+        await provider_http_client_pool.aclose()
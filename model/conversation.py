@@ -33,3 +33,11 @@ class AIConversation(Base):
         default=None,
         comment='上下文清除时间',
     )
+    active_run_id: Mapped[str | None] = mapped_column(sa.String(64), default=None, comment='当前生成任务 ID')
+    active_since: Mapped[datetime | None] = mapped_column(TimeZone, default=None, comment='当前生成任务开始时间')
+    next_message_index: Mapped[int] = mapped_column(
+        sa.Integer,
+        default=0,
+        server_default='0',
+        comment='下一条消息索引',
+    )
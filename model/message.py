@@ -1,25 +1,62 @@
+import json
+
 from typing import Any
 
 import sqlalchemy as sa
 
+from sqlalchemy.engine import Dialect
 from sqlalchemy.orm import Mapped, mapped_column
 
-from backend.common.model import Base, id_key
+from backend.common.model import Base, UniversalText, id_key
 from backend.plugin.ai.enums import AIMessageStatus
 
 
+class ModelMessagesJSON(sa.TypeDecorator[str]):
+    """模型消息 JSON 文本
+
+    直接存取序列化后的 JSON 文本，读写不经过 Python 字典；写入列表等 JSON 值时自动序列化，
+    未执行升级脚本的 JSON 列读出的值同样转为文本
+    """
+
+    impl = UniversalText
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Dialect) -> str | None:
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, bytes):
+            return value.decode()
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> str | None:
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, bytes):
+            return value.decode()
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
 class AIMessage(Base):
     """AI 消息"""
 
     __tablename__ = 'ai_message'
+    __table_args__ = (
+        sa.Index('ix_ai_message_conversation_order', 'conversation_id', 'deleted', 'message_index', 'id'),
+        sa.Index(
+            'ix_ai_message_conversation_pending',
+            'conversation_id',
+            'status',
+            postgresql_where=sa.text("status = 'pending'"),
+        ),
+    )
 
     id: Mapped[id_key] = mapped_column(init=False)
-    conversation_id: Mapped[str] = mapped_column(sa.String(64), index=True, comment='对话 ID')
+    conversation_id: Mapped[str] = mapped_column(sa.String(64), comment='对话 ID')
     provider_id: Mapped[int] = mapped_column(sa.BigInteger, comment='供应商 ID')
     model_id: Mapped[str] = mapped_column(sa.String(512), comment='模型 ID')
-    message_index: Mapped[int] = mapped_column(index=True, comment='消息索引')
+    message_index: Mapped[int] = mapped_column(comment='消息索引')
     role: Mapped[str] = mapped_column(sa.String(16), comment='消息角色')
-    model_messages: Mapped[list[dict[str, Any]]] = mapped_column(sa.JSON(), comment='原始 Pydantic 模型消息列表')
+    model_messages: Mapped[str] = mapped_column(ModelMessagesJSON(), comment='原始 Pydantic 模型消息列表 JSON')
     status: Mapped[str] = mapped_column(
         sa.String(16),
         default=AIMessageStatus.success,
@@ -1,11 +1,30 @@
+from collections.abc import Hashable, Sequence
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.plugin.ai.policy.context import AIInvocationContext, AIInvocationResult
+from backend.plugin.ai.policy.context import AIInvocationContext, AIInvocationRecord, AIInvocationResult
 
 
 class AIResourcePolicy:
     """AI 资源与调用策略基类"""
 
+    # 调用前校验放行结果的缓存秒数，需同时实现 get_decision_cache_key 才会生效
+    decision_cache_ttl: float = 0
+
+    def get_decision_cache_key(self, context: AIInvocationContext) -> Hashable | None:
+        """
+        调用前校验放行结果的缓存键
+
+        返回 ``None`` 时不缓存。缓存键需覆盖 ``before_invoke`` 依赖的全部上下文字段，
+        例如 ``(context.user_id, context.model_pk, context.mcp_ids)``；
+        策略依赖的数据变更时，需调用 ``ai_policy_decision_cache.invalidate()`` 失效对应结果。
+        命中缓存时 ``before_invoke`` 不会执行，可缓存的策略不得向 ``get_ai_policy_shared()`` 写入其他策略依赖的数据。
+
+        :param context: AI 调用策略上下文
+        :return:
+        """
+        return None
+
     async def before_invoke(self, *, db: AsyncSession, context: AIInvocationContext) -> None:
         """
         AI 调用前策略校验
@@ -38,3 +57,18 @@ class AIResourcePolicy:
         :return:
         """
         return
+
+    async def after_invoke_batch(self, *, db: AsyncSession, records: Sequence[AIInvocationRecord]) -> None:
+        """
+        AI 调用后策略批量通知
+
+        启用异步通知时由后台调度器按时间窗口合并调用结果后调用，默认逐条调用 ``after_invoke``。
+        整批在同一 savepoint 中执行，失败时整批回滚并重试，因此实现无需处理部分成功；
+        批内记录可能来自不同用户，``get_ai_policy_shared()`` 在整批内共享。
+
+        :param db: 数据库会话
+        :param records: AI 调用结果通知记录
+        :return:
+        """
+        for record in records:
+            await self.after_invoke(db=db, context=record.context, result=record.result)
@@ -62,3 +62,11 @@ class AIInvocationResult:
             usage_details=dict(getattr(usage, 'details', {}) or {}),
             raw_result=result,
         )
+
+
+@dataclass(frozen=True, slots=True)
+class AIInvocationRecord:
+    """AI 调用结果通知记录"""
+
+    context: AIInvocationContext
+    result: AIInvocationResult
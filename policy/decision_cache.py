@@ -0,0 +1,118 @@
+import time
+
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.core.conf import settings
+from backend.plugin.ai.policy.base import AIResourcePolicy
+
+
+@dataclass(frozen=True, slots=True)
+class _DecisionEntry:
+    """调用前校验放行结果"""
+
+    user_id: int
+    expires_at: float
+
+
+class AIPolicyDecisionCache:
+    """AI 调用前策略放行结果缓存
+
+    仅缓存策略通过 ``get_decision_cache_key`` 声明缓存键且 ``decision_cache_ttl`` 大于 0 的放行结果，拒绝结果不缓存；
+    失效时递增版本，校验前记录版本，版本未变化时才写入，避免并发失效后写入旧结论；
+    缓存为进程内缓存，多进程部署下其他进程的失效最迟在 TTL 后生效
+    """
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[tuple[AIResourcePolicy, Hashable], _DecisionEntry] = OrderedDict()
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """当前缓存版本"""
+        return self._version
+
+    def is_allowed(self, policy: AIResourcePolicy, key: Hashable) -> bool:
+        """
+        判断策略是否已放行该缓存键
+
+        :param policy: AI 资源与调用策略
+        :param key: 缓存键
+        :return:
+        """
+        entry = self._entries.get((policy, key))
+        if entry is None:
+            return False
+        if entry.expires_at <= time.monotonic():
+            self._entries.pop((policy, key), None)
+            return False
+        self._entries.move_to_end((policy, key))
+        return True
+
+    def allow(self, policy: AIResourcePolicy, key: Hashable, *, user_id: int, version: int) -> None:
+        """
+        记录策略放行结果
+
+        :param policy: AI 资源与调用策略
+        :param key: 缓存键
+        :param user_id: 用户 ID，用于按用户失效
+        :param version: 校验前记录的缓存版本
+        :return:
+        """
+        max_size = settings.AI_POLICY_DECISION_CACHE_MAX_SIZE
+        if version != self._version or policy.decision_cache_ttl <= 0 or max_size <= 0:
+            return
+        self._entries[policy, key] = _DecisionEntry(
+            user_id=user_id,
+            expires_at=time.monotonic() + policy.decision_cache_ttl,
+        )
+        self._entries.move_to_end((policy, key))
+        while len(self._entries) > max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(
+        self,
+        *,
+        policy: AIResourcePolicy | None = None,
+        key: Hashable | None = None,
+        user_id: int | None = None,
+        db: AsyncSession | None = None,
+    ) -> None:
+        """
+        失效放行结果，按给定条件同时匹配，未指定条件时清空全部缓存；
+        传入数据库会话时，事务提交后会再次失效，覆盖提交前写入的旧结论
+
+        :param policy: AI 资源与调用策略
+        :param key: 缓存键
+        :param user_id: 用户 ID
+        :param db: 数据库会话
+        :return:
+        """
+        self._version += 1
+        self._entries = OrderedDict(
+            (entry_key, entry)
+            for entry_key, entry in self._entries.items()
+            if not (
+                (policy is None or entry_key[0] is policy)
+                and (key is None or entry_key[1] == key)
+                and (user_id is None or entry.user_id == user_id)
+            )
+        )
+        if db is not None:
+            event.listen(
+                db.sync_session,
+                'after_commit',
+                lambda _session: self.invalidate(policy=policy, key=key, user_id=user_id),
+                once=True,
+            )
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self.invalidate()
+
+
+ai_policy_decision_cache: AIPolicyDecisionCache = AIPolicyDecisionCache()
@@ -0,0 +1,250 @@
+import asyncio
+
+from collections.abc import Sequence
+
+from backend.common.log import log
+from backend.core.conf import settings
+from backend.database.db import async_db_session
+from backend.plugin.ai.policy.base import AIResourcePolicy
+from backend.plugin.ai.policy.context import AIInvocationContext, AIInvocationRecord, AIInvocationResult
+from backend.plugin.ai.policy.registry import get_ai_resource_policies, notify_ai_invocation_result
+from backend.plugin.ai.policy.runtime import begin_ai_policy_shared, end_ai_policy_shared
+from backend.plugin.ai.utils.metrics import ai_metrics_registry
+
+policy_notify_queue_depth = ai_metrics_registry.gauge(
+    'ai_policy_notify_queue_depth',
+    '等待批量通知的 AI 调用结果数量',
+)
+policy_notify_total = ai_metrics_registry.counter(
+    'ai_policy_notify_batches',
+    'AI 调用后策略批量通知次数',
+    ('outcome',),
+)
+
+
+async def _notify_batch(
+    policies: Sequence[AIResourcePolicy],
+    records: Sequence[AIInvocationRecord],
+) -> list[AIResourcePolicy]:
+    """
+    在同一事务中向各策略批量通知，每个策略使用独立 savepoint
+
+    :param policies: AI 资源与调用策略
+    :param records: AI 调用结果通知记录
+    :return: 通知失败的策略
+    """
+    failed: list[AIResourcePolicy] = []
+    try:
+        async with async_db_session.begin() as db:
+            _, token = begin_ai_policy_shared()
+            try:
+                for policy in policies:
+                    try:
+                        async with db.begin_nested():
+                            await policy.after_invoke_batch(db=db, records=records)
+                    except Exception as exc:  # ruff:ignore[try-except-in-loop]
+                        log.warning(f'AI 调用后策略批量通知失败: {exc}')
+                        failed.append(policy)
+            finally:
+                end_ai_policy_shared(token)
+    except Exception as exc:
+        # 事务提交失败时已成功的策略同样被回滚，需全部重试
+        log.warning(f'AI 调用后策略批量通知事务提交失败: {exc}')
+        return list(policies)
+    return failed
+
+
+async def _notify_isolated(policy: AIResourcePolicy, records: Sequence[AIInvocationRecord]) -> None:
+    """
+    重试耗尽后逐条通知，隔离无法处理的记录
+
+    :param policy: AI 资源与调用策略
+    :param records: AI 调用结果通知记录
+    :return:
+    """
+    dropped = 0
+    try:
+        async with async_db_session.begin() as db:
+            _, token = begin_ai_policy_shared()
+            try:
+                for record in records:
+                    try:
+                        async with db.begin_nested():
+                            await policy.after_invoke(db=db, context=record.context, result=record.result)
+                    except Exception as exc:  # ruff:ignore[try-except-in-loop]
+                        dropped += 1
+                        log.error(
+                            f'AI 调用后策略通知失败，已放弃 policy={type(policy).__name__} '
+                            f'user_id={record.context.user_id} conversation_id={record.context.conversation_id}: {exc}'
+                        )
+            finally:
+                end_ai_policy_shared(token)
+    except Exception as exc:
+        dropped = len(records)
+        log.error(f'AI 调用后策略通知失败，已放弃 policy={type(policy).__name__} count={dropped}: {exc}')
+    if dropped:
+        policy_notify_total.inc(outcome='dropped')
+
+
+class AIPolicyDispatcher:
+    """AI 调用后策略通知调度器
+
+    启用后聊天完成时只将调用结果放入有界队列，由后台任务按时间窗口合并为批次，
+    通过 ``after_invoke_batch`` 通知各策略；单个策略失败时按指数退避整批重试，
+    重试耗尽后逐条调用 ``after_invoke`` 隔离无法处理的记录。队列已满或未启用时同步通知
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[AIInvocationRecord] | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._retries: set[asyncio.Task[None]] = set()
+        self._closing = False
+
+    @property
+    def enabled(self) -> bool:
+        """是否接受新的通知"""
+        return self._worker is not None and not self._worker.done() and not self._closing
+
+    async def start(self) -> None:
+        """启用异步通知时启动后台任务"""
+        if not settings.AI_POLICY_NOTIFY_ASYNC or self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=max(settings.AI_POLICY_NOTIFY_QUEUE_SIZE, 1))
+        self._worker = asyncio.create_task(self._run())
+
+    async def dispatch(self, *, context: AIInvocationContext, result: AIInvocationResult) -> None:
+        """
+        提交 AI 调用结果通知
+
+        :param context: AI 调用策略上下文
+        :param result: AI 调用结果策略上下文
+        :return:
+        """
+        if not get_ai_resource_policies():
+            return
+        if self.enabled:
+            assert self._queue is not None
+            try:
+                self._queue.put_nowait(AIInvocationRecord(context=context, result=result))
+            except asyncio.QueueFull:
+                policy_notify_total.inc(outcome='fallback')
+            else:
+                policy_notify_queue_depth.set(self._queue.qsize())
+                return
+        async with async_db_session.begin() as db:
+            await notify_ai_invocation_result(db=db, context=context, result=result)
+
+    async def _collect(self) -> list[AIInvocationRecord]:
+        """
+        等待首条记录后在时间窗口内合并后续记录
+
+        :return:
+        """
+        assert self._queue is not None
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.AI_POLICY_NOTIFY_WINDOW
+        while len(batch) < max(settings.AI_POLICY_NOTIFY_BATCH_SIZE, 1):
+            timeout = deadline - loop.time()
+            if timeout <= 0 or self._closing:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        """按批取出调用结果并通知策略"""
+        assert self._queue is not None
+        while True:
+            batch = await self._collect()
+            policy_notify_queue_depth.set(self._queue.qsize())
+            try:
+                await self._deliver(get_ai_resource_policies(), batch, attempt=0)
+            except Exception as exc:
+                log.exception(f'AI 调用后策略批量通知异常: {exc}')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _deliver(
+        self,
+        policies: Sequence[AIResourcePolicy],
+        records: list[AIInvocationRecord],
+        *,
+        attempt: int,
+    ) -> None:
+        """
+        通知一个批次，失败的策略按指数退避重试
+
+        :param policies: AI 资源与调用策略
+        :param records: AI 调用结果通知记录
+        :param attempt: 已重试次数
+        :return:
+        """
+        if not policies:
+            return
+        failed = await _notify_batch(policies, records)
+        if not failed:
+            policy_notify_total.inc(outcome='success' if attempt == 0 else 'retried')
+            return
+        if attempt >= settings.AI_POLICY_NOTIFY_MAX_RETRIES:
+            for policy in failed:
+                await _notify_isolated(policy, records)
+            return
+        delay = settings.AI_POLICY_NOTIFY_RETRY_BACKOFF * 2**attempt
+        task = asyncio.create_task(self._retry(failed, records, attempt=attempt + 1, delay=delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry(
+        self,
+        policies: list[AIResourcePolicy],
+        records: list[AIInvocationRecord],
+        *,
+        attempt: int,
+        delay: float,
+    ) -> None:
+        """
+        延迟后重试批次
+
+        :param policies: 需重试的策略
+        :param records: AI 调用结果通知记录
+        :param attempt: 重试次数
+        :param delay: 延迟秒数
+        :return:
+        """
+        await asyncio.sleep(delay)
+        try:
+            await self._deliver(policies, records, attempt=attempt)
+        except Exception as exc:
+            log.exception(f'AI 调用后策略批量通知重试异常: {exc}')
+
+    async def aclose(self) -> None:
+        """停止接受新通知，等待队列及重试中的批次通知完成"""
+        worker = self._worker
+        if worker is None:
+            return
+        assert self._queue is not None
+        self._closing = True
+        if not worker.done():
+            await self._queue.join()
+        while self._retries:
+            await asyncio.gather(*self._retries, return_exceptions=True)
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        self._queue = None
+        self._closing = False
+        policy_notify_queue_depth.set(0)
+
+
+ai_policy_dispatcher: AIPolicyDispatcher = AIPolicyDispatcher()
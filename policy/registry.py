@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from backend.common.log import log
 from backend.plugin.ai.policy.base import AIResourcePolicy
 from backend.plugin.ai.policy.context import AIInvocationContext, AIInvocationResult
+from backend.plugin.ai.policy.decision_cache import ai_policy_decision_cache
 from backend.plugin.ai.policy.runtime import begin_ai_policy_shared, end_ai_policy_shared
 
 _ai_resource_policies: list[AIResourcePolicy] = []
@@ -19,12 +20,21 @@ def register_ai_resource_policy(policy: AIResourcePolicy) -> None:
         _ai_resource_policies.append(policy)
 
 
+def get_ai_resource_policies() -> tuple[AIResourcePolicy, ...]:
+    """
+    获取已注册的 AI 资源与调用策略
+
+    :return:
+    """
+    return tuple(_ai_resource_policies)
+
+
 async def validate_ai_invocation(*, db: AsyncSession, context: AIInvocationContext) -> None:
     """
     校验 AI 调用策略
 
     按注册顺序串行执行：任一策略拒绝即中断。
-    同一调用周期内通过共享缓存避免策略间重复查库。
+    同一调用周期内通过共享缓存避免策略间重复查库，声明了缓存键的策略在放行结果有效期内跳过校验。
 
     :param db: 数据库会话
     :param context: AI 调用策略上下文
@@ -38,7 +48,15 @@ async def validate_ai_invocation(*, db: AsyncSession, context: AIInvocationConte
     _, token = begin_ai_policy_shared()
     try:
         for policy in policies:
+            cache_key = policy.get_decision_cache_key(context) if policy.decision_cache_ttl > 0 else None
+            if cache_key is None:
+                await policy.before_invoke(db=db, context=context)
+                continue
+            if ai_policy_decision_cache.is_allowed(policy, cache_key):
+                continue
+            version = ai_policy_decision_cache.version
             await policy.before_invoke(db=db, context=context)
+            ai_policy_decision_cache.allow(policy, cache_key, user_id=context.user_id, version=version)
     finally:
         end_ai_policy_shared(token)
 
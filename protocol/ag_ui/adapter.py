@@ -7,13 +7,39 @@ from pydantic_ai.ui.ag_ui import AGUIAdapter
 from starlette.responses import StreamingResponse
 
 from backend.common.exception import errors
+from backend.core.conf import settings
 from backend.database.db import uuid4_str
-from backend.plugin.ai.dataclasses import ChatRunContext
+from backend.plugin.ai.dataclasses import ChatRunContext, ChatStreamCoalescePolicy
 from backend.plugin.ai.protocol.ag_ui.event_stream import build_streaming_response
 from backend.plugin.ai.protocol.ag_ui.request_decoder import decode_input_messages as decode_ag_ui_input_messages
-from backend.plugin.ai.protocol.ag_ui.snapshot_builder import serialize_messages_to_snapshot as serialize_ag_ui_snapshot
+from backend.plugin.ai.protocol.ag_ui.schema import AIChatAgUiMessagesSnapshotDetail
+from backend.plugin.ai.protocol.ag_ui.snapshot_builder import (
+    serialize_messages_to_snapshot as serialize_ag_ui_snapshot,
+    serialize_snapshot_messages as serialize_ag_ui_messages,
+)
 from backend.plugin.ai.protocol.base import ChatAgent, ChatModelMessage
 from backend.plugin.ai.schema.chat import AIChatForwardedPropsParam
+from backend.plugin.ai.utils.timing import ChatPhaseTimings
+
+
+def _resolve_coalesce_policy(forwarded_props: AIChatForwardedPropsParam) -> ChatStreamCoalescePolicy | None:
+    """
+    解析增量事件合并策略，请求参数优先于服务端配置
+
+    :param forwarded_props: 聊天扩展参数
+    :return:
+    """
+    enabled = forwarded_props.stream_coalesce
+    if enabled is None:
+        enabled = settings.AI_STREAM_COALESCE
+    if not enabled:
+        return None
+    window = forwarded_props.stream_coalesce_window
+    max_bytes = forwarded_props.stream_coalesce_max_bytes
+    return ChatStreamCoalescePolicy(
+        window=settings.AI_STREAM_COALESCE_WINDOW if window is None else window,
+        max_bytes=settings.AI_STREAM_COALESCE_MAX_BYTES if max_bytes is None else max_bytes,
+    )
 
 
 class AgUiChatProtocolAdapter:
@@ -104,6 +130,7 @@ class AgUiChatProtocolAdapter:
         on_run_error: Callable[[str, list[ChatModelMessage]], Awaitable[None]],
         on_interrupted: Callable[[list[ChatModelMessage]], Awaitable[None]],
         on_finish: Callable[[], Awaitable[None]] | None = None,
+        timings: ChatPhaseTimings | None = None,
     ) -> StreamingResponse:
         """
         运行聊天代理并返回 AG-UI 流式响应
@@ -117,6 +144,7 @@ class AgUiChatProtocolAdapter:
         :param on_run_error: 运行失败回调
         :param on_interrupted: 运行中断回调
         :param on_finish: 流结束回调
+        :param timings: 阶段耗时记录
         :return:
         """
         return build_streaming_response(
@@ -129,6 +157,9 @@ class AgUiChatProtocolAdapter:
             on_run_error=on_run_error,
             on_interrupted=on_interrupted,
             on_finish=on_finish,
+            timings=timings,
+            coalesce_policy=_resolve_coalesce_policy(run_context.forwarded_props),
+            resumable=settings.AI_STREAM_RESUME,
         )
 
     @staticmethod
@@ -161,5 +192,45 @@ class AgUiChatProtocolAdapter:
             message_indexes=message_indexes,
         )
 
+    @staticmethod
+    def serialize_snapshot_messages(
+        messages: Sequence[ModelMessage],
+        *,
+        conversation_id: str | None = None,
+        message_ids: Sequence[int | None] | None = None,
+        provider_ids: Sequence[int | None] | None = None,
+        model_ids: Sequence[str | None] | None = None,
+        message_indexes: Sequence[int | None] | None = None,
+    ) -> list[Any]:
+        """
+        序列化模型消息为 AG-UI 快照消息列表
+
+        :param messages: 模型消息列表
+        :param conversation_id: 对话 ID
+        :param message_ids: 持久化消息 ID 列表
+        :param provider_ids: 供应商 ID 列表
+        :param model_ids: 模型 ID 列表
+        :param message_indexes: 持久化消息索引列表
+        :return:
+        """
+        return serialize_ag_ui_messages(
+            messages,
+            conversation_id=conversation_id,
+            message_ids=message_ids,
+            provider_ids=provider_ids,
+            model_ids=model_ids,
+            message_indexes=message_indexes,
+        )
+
+    @staticmethod
+    def build_snapshot(snapshot_messages: Sequence[Any]) -> AIChatAgUiMessagesSnapshotDetail:
+        """
+        由 AG-UI 快照消息列表组装快照
+
+        :param snapshot_messages: AG-UI 快照消息列表
+        :return:
+        """
+        return AIChatAgUiMessagesSnapshotDetail.model_construct(messages=list(snapshot_messages))
+
 
 ag_ui_chat_protocol_adapter = AgUiChatProtocolAdapter()
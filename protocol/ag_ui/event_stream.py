@@ -1,19 +1,44 @@
-from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+import asyncio
+import time
+
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable, Sequence
 from typing import Any, TypeAlias
 
 import anyio
 
-from ag_ui.core import BaseEvent, RunAgentInput, RunErrorEvent
+from ag_ui.core import (
+    BaseEvent,
+    ReasoningMessageContentEvent,
+    RunAgentInput,
+    RunErrorEvent,
+    TextMessageContentEvent,
+    ToolCallArgsEvent,
+)
 from pydantic_ai import Agent, AgentRunResult, BinaryImage, ModelRequest, ModelResponse, capture_run_messages
+from pydantic_ai.ui import SSE_CONTENT_TYPE
 from pydantic_ai.ui.ag_ui import AGUIAdapter
 from starlette.responses import StreamingResponse
 
 from backend.common.log import log
-from backend.plugin.ai.dataclasses import ChatAgentDeps
+from backend.plugin.ai.dataclasses import ChatAgentDeps, ChatStreamCoalescePolicy
+from backend.plugin.ai.utils.metrics import ai_metrics_registry
+from backend.plugin.ai.utils.stream_resume import ai_stream_registry
+from backend.plugin.ai.utils.timing import ChatPhaseTimings
 
 ChatModelMessage: TypeAlias = ModelRequest | ModelResponse
 ChatAgentOutput: TypeAlias = BinaryImage | str
 ChatAgent: TypeAlias = Agent[ChatAgentDeps, ChatAgentOutput]
+DeltaEvent: TypeAlias = TextMessageContentEvent | ReasoningMessageContentEvent | ToolCallArgsEvent
+
+stream_coalesce_events_total = ai_metrics_registry.counter(
+    'ai_stream_coalesce_events',
+    '启用增量合并的流式响应事件数量，received 为上游事件数，sent 为实际发送的帧数',
+    ('stage',),
+)
+
+# 上游事件缓冲数量，客户端读取过慢时上游读取随之暂停
+_COALESCE_QUEUE_SIZE = 256
+_STREAM_END = object()
 
 
 class _StreamLifecycle:
@@ -111,14 +136,21 @@ async def _observe_native_events(
     message_history: Sequence[ChatModelMessage],
     lifecycle: _StreamLifecycle,
     on_finish: Callable[[], Awaitable[None]] | None,
-) -> AsyncIterator[BaseEvent]:
+    timings: ChatPhaseTimings | None = None,
+) -> AsyncGenerator[BaseEvent, None]:
     """观察 Pydantic AI 原生事件并执行持久化生命周期回调"""
     current_run_messages: list[ChatModelMessage] = []
+    stream_start = time.perf_counter()
+    first_event_pending = True
     try:
         try:
             with capture_run_messages() as captured_messages:
                 try:
                     async for event in event_stream:
+                        if first_event_pending:
+                            first_event_pending = False
+                            if timings is not None:
+                                timings.record('first_event', time.perf_counter() - stream_start)
                         if isinstance(event, RunErrorEvent):
                             lifecycle.record_error(event.message or '')
                         yield event
@@ -140,10 +172,119 @@ async def _observe_native_events(
             try:
                 await lifecycle.finalize(current_run_messages)
             finally:
+                if timings is not None:
+                    timings.record('stream', time.perf_counter() - stream_start)
                 if on_finish:
                     await on_finish()
 
 
+def _get_delta_key(event: BaseEvent) -> tuple[type[BaseEvent], str, str | None] | None:
+    """
+    获取可合并增量事件的合并键，不可合并的事件返回 None
+
+    :param event: AG-UI 事件
+    :return:
+    """
+    if event.raw_event is not None:
+        return None
+    if isinstance(event, (TextMessageContentEvent, ReasoningMessageContentEvent)):
+        return type(event), event.message_id, event.subagent_run_id
+    if isinstance(event, ToolCallArgsEvent):
+        return type(event), event.tool_call_id, event.subagent_run_id
+    return None
+
+
+async def coalesce_delta_events(
+    events: AsyncGenerator[BaseEvent, None],
+    *,
+    policy: ChatStreamCoalescePolicy,
+) -> AsyncGenerator[BaseEvent, None]:
+    """
+    合并同一消息连续的增量事件，合并时间超过窗口或字节数达到上限时发送，遇到其他事件先发送已合并的增量
+
+    上游事件由独立任务读取，窗口到期时即使上游暂无新事件也会按时发送，增量延迟不超过时间窗口；
+    读取任务结束时关闭上游事件流，返回前上游的生命周期回调已执行完成
+
+    :param events: AG-UI 事件流
+    :param policy: 增量事件合并策略
+    :return:
+    """
+    queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=_COALESCE_QUEUE_SIZE)
+
+    async def pump() -> None:
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as exc:
+            await queue.put(exc)
+        else:
+            await queue.put(_STREAM_END)
+        finally:
+            # 读取任务在 queue.put 处被取消时上游停在 yield，需显式关闭以在当前任务内执行其生命周期回调
+            with anyio.CancelScope(shield=True):
+                await events.aclose()
+
+    loop = asyncio.get_running_loop()
+    pump_task = asyncio.create_task(pump())
+    pending: DeltaEvent | None = None
+    pending_key: tuple[type[BaseEvent], str, str | None] | None = None
+    pending_deltas: list[str] = []
+    pending_size = 0
+    flush_at = 0.0
+
+    def flush() -> DeltaEvent:
+        nonlocal pending, pending_key, pending_size
+        assert pending is not None
+        event = pending if len(pending_deltas) == 1 else pending.model_copy(update={'delta': ''.join(pending_deltas)})
+        pending, pending_key, pending_size = None, None, 0
+        pending_deltas.clear()
+        stream_coalesce_events_total.inc(stage='sent')
+        return event
+
+    try:
+        while True:
+            if pending is None:
+                item = await queue.get()
+            elif not queue.empty():
+                item = queue.get_nowait()
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(flush_at - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    yield flush()
+                    continue
+            if item is _STREAM_END or isinstance(item, Exception):
+                if pending is not None:
+                    yield flush()
+                if isinstance(item, Exception):
+                    raise item
+                return
+            stream_coalesce_events_total.inc(stage='received')
+            key = _get_delta_key(item)
+            if pending is not None and key != pending_key:
+                yield flush()
+            if key is None:
+                stream_coalesce_events_total.inc(stage='sent')
+                yield item
+                continue
+            if pending is None:
+                pending, pending_key = item, key
+                flush_at = loop.time() + policy.window
+            pending_deltas.append(item.delta)
+            pending_size += len(item.delta.encode())
+            if pending_size >= policy.max_bytes or loop.time() >= flush_at:
+                yield flush()
+    finally:
+        # 屏蔽取消：等待上游读取任务关闭上游事件流，确保其生命周期回调执行完成
+        with anyio.CancelScope(shield=True):
+            if not pump_task.done():
+                pump_task.cancel()
+            try:
+                await pump_task
+            except asyncio.CancelledError:
+                pass
+
+
 def build_streaming_response(
     *,
     user_id: int,
@@ -155,6 +296,9 @@ def build_streaming_response(
     on_run_error: Callable[[str, list[ChatModelMessage]], Awaitable[None]],
     on_interrupted: Callable[[list[ChatModelMessage]], Awaitable[None]],
     on_finish: Callable[[], Awaitable[None]] | None = None,
+    timings: ChatPhaseTimings | None = None,
+    coalesce_policy: ChatStreamCoalescePolicy | None = None,
+    resumable: bool = False,
 ) -> StreamingResponse:
     """
     运行聊天代理并返回流式响应
@@ -168,6 +312,9 @@ def build_streaming_response(
     :param on_run_error: 运行失败回调
     :param on_interrupted: 运行中断回调
     :param on_finish: 流结束回调
+    :param timings: 阶段耗时记录
+    :param coalesce_policy: 增量事件合并策略，为空时逐个发送事件
+    :param resumable: 是否支持断线重连，仅 SSE 响应生效
     :return:
     """
     adapter = AGUIAdapter(
@@ -188,14 +335,27 @@ def build_streaming_response(
         message_history=message_history,
         on_complete=lifecycle.complete,
     )
-    response = event_stream_handler.streaming_response(
-        _observe_native_events(
-            event_stream=event_stream,
-            message_history=message_history,
-            lifecycle=lifecycle,
-            on_finish=on_finish,
-        )
+    events = _observe_native_events(
+        event_stream=event_stream,
+        message_history=message_history,
+        lifecycle=lifecycle,
+        on_finish=on_finish,
+        timings=timings,
     )
+    if coalesce_policy is not None:
+        events = coalesce_delta_events(events, policy=coalesce_policy)
+    if resumable and event_stream_handler.content_type == SSE_CONTENT_TYPE:
+        # 运行由后台任务驱动，客户端断线不再立即中断生成，可携带 Last-Event-ID 重连
+        run = ai_stream_registry.start(
+            conversation_id=run_input.thread_id,
+            run_id=run_input.run_id,
+            user_id=user_id,
+            frames=event_stream_handler.encode_stream(events),
+            media_type=event_stream_handler.content_type,
+            headers=event_stream_handler.response_headers,
+        )
+        return run.streaming_response()
+    response = event_stream_handler.streaming_response(events)
     response.headers['X-Accel-Buffering'] = 'no'
     response.headers['Cache-Control'] = 'no-cache'
     return response
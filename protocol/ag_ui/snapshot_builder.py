@@ -1,5 +1,5 @@
-from collections import defaultdict
 from collections.abc import Callable, Sequence
+from dataclasses import replace
 from datetime import datetime
 from typing import Any, NamedTuple, TypeAlias, cast
 
@@ -13,7 +13,17 @@ from ag_ui.core import (
     ToolMessage,
     UserMessage,
 )
-from pydantic_ai import ModelMessage, ModelRequest, ModelResponse
+from pydantic_ai import (
+    AudioUrl,
+    BinaryContent,
+    DocumentUrl,
+    ImageUrl,
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    UserPromptPart,
+    VideoUrl,
+)
 from pydantic_ai.ui.ag_ui import AGUIAdapter
 
 from backend.plugin.ai.protocol.ag_ui.schema import (
@@ -27,6 +37,7 @@ from backend.plugin.ai.protocol.ag_ui.schema import (
     AIChatAgUiToolMessageDetail,
     AIChatAgUiUserMessageDetail,
 )
+from backend.plugin.ai.utils.blob_store import BLOB_REF_METADATA_KEY, build_blob_url, get_blob_ref
 
 SnapshotMessage: TypeAlias = (
     AIChatAgUiUserMessageDetail
@@ -111,6 +122,92 @@ _SNAPSHOT_MESSAGE_BUILD_CONFIGS: tuple[SnapshotMessageBuildConfig, ...] = (
         },
     ),
 )
+_SNAPSHOT_MESSAGE_BUILD_CONFIG_BY_TYPE: dict[type[Message], SnapshotMessageBuildConfig] = {
+    config.message_type: config for config in _SNAPSHOT_MESSAGE_BUILD_CONFIGS
+}
+
+
+_BLOB_URL_TYPES: dict[str, type[ImageUrl | AudioUrl | VideoUrl]] = {
+    'image': ImageUrl,
+    'audio': AudioUrl,
+    'video': VideoUrl,
+}
+
+
+def _link_request_blobs(*, message: ModelRequest, conversation_id: str | None) -> ModelRequest:
+    """
+    将用户输入中已外置的二进制内容替换为下载地址
+
+    :param message: 请求消息
+    :param conversation_id: 对话 ID
+    :return:
+    """
+    if conversation_id is None:
+        return message
+    parts = []
+    for part in message.parts:
+        if isinstance(part, UserPromptPart) and not isinstance(part.content, str):
+            content = []
+            for item in part.content:
+                key = get_blob_ref(item) if isinstance(item, BinaryContent) else None
+                if key is not None:
+                    assert isinstance(item, BinaryContent)
+                    url_type = _BLOB_URL_TYPES.get(item.media_type.split('/', 1)[0], DocumentUrl)
+                    url = build_blob_url(conversation_id=conversation_id, key=key, media_type=item.media_type)
+                    item = url_type(url=url, media_type=item.media_type)
+                content.append(item)
+            if any(new is not old for new, old in zip(content, part.content, strict=True)):
+                part = replace(part, content=content)
+        parts.append(part)
+    if all(new is old for new, old in zip(parts, message.parts, strict=True)):
+        return message
+    return replace(message, parts=parts)
+
+
+def _link_file_activity_blobs(*, encoded_messages: list[Message], conversation_id: str | None) -> list[Message]:
+    """
+    将模型生成文件中已外置的二进制内容替换为下载地址
+
+    :param encoded_messages: 标准 AG-UI 消息列表
+    :param conversation_id: 对话 ID
+    :return:
+    """
+    if conversation_id is None:
+        return encoded_messages
+    linked_messages: list[Message] = []
+    for encoded_message in encoded_messages:
+        if isinstance(encoded_message, ActivityMessage):
+            content = cast('dict[str, Any]', encoded_message.content)
+            vendor_metadata = content.get('vendor_metadata')
+            key = vendor_metadata.get(BLOB_REF_METADATA_KEY) if isinstance(vendor_metadata, dict) else None
+            if isinstance(key, str):
+                url = build_blob_url(conversation_id=conversation_id, key=key, media_type=content.get('media_type', ''))
+                content = {**content, 'url': url}
+                vendor_metadata = {k: v for k, v in vendor_metadata.items() if k != BLOB_REF_METADATA_KEY}
+                if vendor_metadata:
+                    content['vendor_metadata'] = vendor_metadata
+                else:
+                    content.pop('vendor_metadata')
+                encoded_message = encoded_message.model_copy(update={'content': content})
+        linked_messages.append(encoded_message)
+    return linked_messages
+
+
+def _get_snapshot_message_build_config(message_type: type[Message]) -> SnapshotMessageBuildConfig:
+    """
+    获取快照消息构建配置，子类首次命中后写入分派表
+
+    :param message_type: 标准 AG-UI 消息类型
+    :return:
+    """
+    config = _SNAPSHOT_MESSAGE_BUILD_CONFIG_BY_TYPE.get(message_type)
+    if config is not None:
+        return config
+    for config in _SNAPSHOT_MESSAGE_BUILD_CONFIGS:
+        if issubclass(message_type, config.message_type):
+            _SNAPSHOT_MESSAGE_BUILD_CONFIG_BY_TYPE[message_type] = config
+            return config
+    raise ValueError(f'不支持的 AG-UI 消息类型: {message_type.__name__}')
 
 
 def _build_snapshot_messages_from_encoded_messages(
@@ -131,42 +228,30 @@ def _build_snapshot_messages_from_encoded_messages(
     :param fallback_empty_assistant: 是否在空结果时补一条空助手消息
     :return:
     """
-    snapshot_messages: list[SnapshotMessage] = []
-    fragment_indexes: defaultdict[str, int] = defaultdict(int)
+    base_id = f'msg_{message_id if message_id is not None else message_index}'
+    if not encoded_messages:
+        if not fallback_empty_assistant:
+            return []
+        return [AIChatAgUiAssistantMessageDetail(id=base_id, content=None, tool_calls=None, **base_meta)]
 
+    snapshot_messages: list[SnapshotMessage] = []
+    fragment_indexes: dict[str, int] = {}
     for encoded_message in encoded_messages:
-        for config in _SNAPSHOT_MESSAGE_BUILD_CONFIGS:
-            if not isinstance(encoded_message, config.message_type):
-                continue
-            fragment_index = fragment_indexes[config.fragment_type]
-            base_id = f'msg_{message_id if message_id is not None else message_index}'
-            primary_without_suffix = not snapshot_messages and config.primary_without_suffix and fragment_index == 0
-            snapshot_id = base_id if primary_without_suffix else f'{base_id}_{config.fragment_type}_{fragment_index}'
-            snapshot_messages.append(
-                cast(
-                    'SnapshotMessage',
-                    config.detail_model(
-                        id=snapshot_id,
-                        **config.extra_fields_getter(encoded_message),
-                        **base_meta,
-                    ),
-                )
-            )
-            fragment_indexes[config.fragment_type] += 1
-            break
+        config = _get_snapshot_message_build_config(type(encoded_message))
+        fragment_index = fragment_indexes.get(config.fragment_type, 0)
+        fragment_indexes[config.fragment_type] = fragment_index + 1
+        if not snapshot_messages and config.primary_without_suffix and fragment_index == 0:
+            snapshot_id = base_id
         else:
-            raise ValueError(f'不支持的 AG-UI 消息类型: {type(encoded_message).__name__}')
-
-    if snapshot_messages or not fallback_empty_assistant:
-        return snapshot_messages
-    return [
-        AIChatAgUiAssistantMessageDetail(
-            id=f'msg_{message_id if message_id is not None else message_index}',
-            content=None,
-            tool_calls=None,
-            **base_meta,
+            snapshot_id = f'{base_id}_{config.fragment_type}_{fragment_index}'
+        snapshot_messages.append(
+            config.detail_model(
+                id=snapshot_id,
+                **config.extra_fields_getter(encoded_message),
+                **base_meta,
+            )
         )
-    ]
+    return snapshot_messages
 
 
 def serialize_request_message(
@@ -202,7 +287,10 @@ def serialize_request_message(
         'message_type': message.state if message.state != 'complete' else 'normal',
     }
 
-    encoded_messages = AGUIAdapter.dump_messages([message], preserve_file_data=True)
+    encoded_messages = AGUIAdapter.dump_messages(
+        [_link_request_blobs(message=message, conversation_id=conversation_id)],
+        preserve_file_data=True,
+    )
     return _build_snapshot_messages_from_encoded_messages(
         encoded_messages=encoded_messages,
         base_meta=base_meta,
@@ -248,7 +336,10 @@ def serialize_response_message(
         ),
     }
 
-    encoded_messages = AGUIAdapter.dump_messages([message], preserve_file_data=True)
+    encoded_messages = _link_file_activity_blobs(
+        encoded_messages=AGUIAdapter.dump_messages([message], preserve_file_data=True),
+        conversation_id=conversation_id,
+    )
     return _build_snapshot_messages_from_encoded_messages(
         encoded_messages=encoded_messages,
         base_meta=base_meta,
@@ -258,7 +349,7 @@ def serialize_response_message(
     )
 
 
-def serialize_messages_to_snapshot(
+def serialize_snapshot_messages(
     messages: Sequence[ModelMessage],
     *,
     conversation_id: str | None = None,
@@ -266,9 +357,9 @@ def serialize_messages_to_snapshot(
     provider_ids: Sequence[int | None] | None = None,
     model_ids: Sequence[str | None] | None = None,
     message_indexes: Sequence[int | None] | None = None,
-) -> AIChatAgUiMessagesSnapshotDetail:
+) -> list[SnapshotMessage]:
     """
-    序列化模型消息为快照
+    序列化模型消息为快照消息列表
 
     :param messages: 模型消息列表
     :param conversation_id: 对话 ID
@@ -278,7 +369,7 @@ def serialize_messages_to_snapshot(
     :param message_indexes: 持久化消息索引列表
     :return:
     """
-    snapshot_messages: list[AIChatAgUiSnapshotMessageDetail] = []
+    snapshot_messages: list[SnapshotMessage] = []
     message_contexts = zip(
         messages,
         message_ids or [None] * len(messages),
@@ -287,6 +378,7 @@ def serialize_messages_to_snapshot(
         message_indexes or [None] * len(messages),
         strict=False,
     )
+    # dump_messages 不提供编码结果到来源消息的映射，快照 ID 又按模型消息分片编号，因此逐条编码
     for fallback_index, (message, message_id, provider_id, model_id, message_index) in enumerate(message_contexts):
         resolved_message_index = fallback_index if message_index is None else message_index
         if isinstance(message, ModelRequest):
@@ -310,5 +402,38 @@ def serialize_messages_to_snapshot(
                 message_index=resolved_message_index,
             )
             snapshot_messages.extend(response_messages)
+    return snapshot_messages
+
+
+def serialize_messages_to_snapshot(
+    messages: Sequence[ModelMessage],
+    *,
+    conversation_id: str | None = None,
+    message_ids: Sequence[int | None] | None = None,
+    provider_ids: Sequence[int | None] | None = None,
+    model_ids: Sequence[str | None] | None = None,
+    message_indexes: Sequence[int | None] | None = None,
+) -> AIChatAgUiMessagesSnapshotDetail:
+    """
+    序列化模型消息为快照
 
-    return AIChatAgUiMessagesSnapshotDetail(messages=snapshot_messages)
+    :param messages: 模型消息列表
+    :param conversation_id: 对话 ID
+    :param message_ids: 持久化消息 ID 列表
+    :param provider_ids: 供应商 ID 列表
+    :param model_ids: 模型 ID 列表
+    :param message_indexes: 持久化消息索引列表
+    :return:
+    """
+    snapshot_messages = serialize_snapshot_messages(
+        messages,
+        conversation_id=conversation_id,
+        message_ids=message_ids,
+        provider_ids=provider_ids,
+        model_ids=model_ids,
+        message_indexes=message_indexes,
+    )
+    # 快照消息均为已校验的详情对象，组装快照时不再逐条重复校验
+    return AIChatAgUiMessagesSnapshotDetail.model_construct(
+        messages=cast('list[AIChatAgUiSnapshotMessageDetail]', snapshot_messages)
+    )
@@ -6,6 +6,7 @@ from starlette.responses import StreamingResponse
 
 from backend.plugin.ai.dataclasses import ChatAgentDeps, ChatRunContext
 from backend.plugin.ai.schema.chat import AIChatForwardedPropsParam
+from backend.plugin.ai.utils.timing import ChatPhaseTimings
 
 ChatModelMessage: TypeAlias = ModelRequest | ModelResponse
 ChatAgentOutput: TypeAlias = BinaryImage | str
@@ -74,6 +75,7 @@ class ChatProtocolAdapter(Protocol):
         on_run_error: Callable[[str, list[ChatModelMessage]], Awaitable[None]],
         on_interrupted: Callable[[list[ChatModelMessage]], Awaitable[None]],
         on_finish: Callable[[], Awaitable[None]] | None = None,
+        timings: ChatPhaseTimings | None = None,
     ) -> StreamingResponse:
         """
         运行聊天代理并构建协议流式响应
@@ -87,6 +89,7 @@ class ChatProtocolAdapter(Protocol):
         :param on_run_error: 运行失败回调
         :param on_interrupted: 运行中断回调
         :param on_finish: 流结束回调
+        :param timings: 阶段耗时记录
         :return:
         """
         ...
@@ -113,3 +116,35 @@ class ChatProtocolAdapter(Protocol):
         :return:
         """
         ...
+
+    def serialize_snapshot_messages(
+        self,
+        messages: Sequence[ModelMessage],
+        *,
+        conversation_id: str | None = None,
+        message_ids: Sequence[int | None] | None = None,
+        provider_ids: Sequence[int | None] | None = None,
+        model_ids: Sequence[str | None] | None = None,
+        message_indexes: Sequence[int | None] | None = None,
+    ) -> list[Any]:
+        """
+        序列化模型消息为协议快照消息列表，可按消息行缓存后通过 build_snapshot 组装
+
+        :param messages: 模型消息列表
+        :param conversation_id: 对话 ID
+        :param message_ids: 持久化消息 ID 列表
+        :param provider_ids: 供应商 ID 列表
+        :param model_ids: 模型 ID 列表
+        :param message_indexes: 持久化消息索引列表
+        :return:
+        """
+        ...
+
+    def build_snapshot(self, snapshot_messages: Sequence[Any]) -> Any:
+        """
+        由协议快照消息列表组装协议快照
+
+        :param snapshot_messages: 协议快照消息列表
+        :return:
+        """
+        ...
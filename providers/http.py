@@ -1,13 +1,26 @@
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
 import httpx
 
 from pydantic_ai.retries import AsyncTenacityTransport, RetryConfig, wait_retry_after
 from tenacity import retry_if_exception_type, stop_after_attempt
 
+from backend.common.log import log
 from backend.core.conf import settings
+from backend.plugin.ai.enums import AIProviderType
+from backend.plugin.ai.providers.base import normalize_provider_api_host
+
 
+def build_retry_http_client(*, limits: httpx.Limits | None = None) -> httpx.AsyncClient:
+    """
+    构建带重试的 HTTP 客户端
 
-def build_retry_http_client() -> httpx.AsyncClient:
-    """构建带重试的 HTTP 客户端"""
+    :param limits: 底层连接池限制
+    :return:
+    """
     return httpx.AsyncClient(
         transport=AsyncTenacityTransport(
             config=RetryConfig(
@@ -19,8 +32,123 @@ def build_retry_http_client() -> httpx.AsyncClient:
                 stop=stop_after_attempt(settings.AI_HTTP_MAX_RETRIES + 1),
                 reraise=True,
             ),
+            wrapped=httpx.AsyncHTTPTransport(limits=limits) if limits is not None else None,
             validate_response=lambda response: (
                 response.raise_for_status() if response.status_code in {408, 409, 429, 500, 502, 503, 504} else None
             ),
         )
     )
+
+
+@dataclass(slots=True)
+class _PooledHttpClient:
+    """连接池中的 HTTP 客户端"""
+
+    client: httpx.AsyncClient
+    leases: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ProviderHttpClientPool:
+    """供应商 HTTP 客户端连接池
+
+    按（供应商类型，标准化 API 地址）复用带重试的 HTTP 客户端，保留 keep-alive 连接；
+    空闲超时或超出数量上限的客户端会在未被借用时关闭
+    """
+
+    def __init__(self) -> None:
+        self._clients: OrderedDict[tuple[AIProviderType, str], _PooledHttpClient] = OrderedDict()
+        self._keys: dict[int, tuple[AIProviderType, str]] = {}
+
+    @staticmethod
+    def _build_limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.AI_HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.AI_HTTP_POOL_KEEPALIVE_EXPIRY,
+        )
+
+    def _pop_evictable(self) -> list[httpx.AsyncClient]:
+        """
+        移除空闲超时及超出数量上限的未借用客户端
+
+        :return:
+        """
+        now = time.monotonic()
+        evicted = []
+        for key, pooled in list(self._clients.items()):
+            if pooled.leases or now - pooled.last_used < settings.AI_HTTP_POOL_IDLE_TTL:
+                continue
+            evicted.append(self._remove(key))
+        overflow = len(self._clients) - settings.AI_HTTP_POOL_MAX_CLIENTS
+        for key, pooled in list(self._clients.items()):
+            if overflow <= 0:
+                break
+            if pooled.leases:
+                continue
+            evicted.append(self._remove(key))
+            overflow -= 1
+        return evicted
+
+    def _remove(self, key: tuple[AIProviderType, str]) -> httpx.AsyncClient:
+        pooled = self._clients.pop(key)
+        self._keys.pop(id(pooled.client), None)
+        return pooled.client
+
+    @staticmethod
+    async def _close_clients(clients: list[httpx.AsyncClient]) -> None:
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as exc:
+                log.warning(f'关闭模型供应商 HTTP 客户端失败: {exc}')
+
+    async def acquire(self, provider_type: int | AIProviderType, api_host: str) -> httpx.AsyncClient:
+        """
+        借用供应商 HTTP 客户端，使用完毕后需调用 release 归还
+
+        :param provider_type: 供应商类型
+        :param api_host: API 地址
+        :return:
+        """
+        provider_type = AIProviderType(provider_type)
+        key = (provider_type, normalize_provider_api_host(provider_type, api_host))
+        pooled = self._clients.get(key)
+        if pooled is None or pooled.client.is_closed:
+            if pooled is not None:
+                self._remove(key)
+            pooled = _PooledHttpClient(client=build_retry_http_client(limits=self._build_limits()))
+            self._clients[key] = pooled
+            self._keys[id(pooled.client)] = key
+        self._clients.move_to_end(key)
+        pooled.leases += 1
+        pooled.last_used = time.monotonic()
+        await self._close_clients(self._pop_evictable())
+        return pooled.client
+
+    async def release(self, client: httpx.AsyncClient) -> None:
+        """
+        归还借用的 HTTP 客户端，未登记的客户端直接关闭
+
+        :param client: HTTP 客户端
+        :return:
+        """
+        key = self._keys.get(id(client))
+        pooled = self._clients.get(key) if key is not None else None
+        if pooled is None or pooled.client is not client:
+            if not client.is_closed:
+                await self._close_clients([client])
+            return
+        pooled.leases = max(pooled.leases - 1, 0)
+        pooled.last_used = time.monotonic()
+        await self._close_clients(self._pop_evictable())
+
+    async def aclose(self) -> None:
+        """关闭所有客户端"""
+        clients = [pooled.client for pooled in self._clients.values()]
+        self._clients.clear()
+        self._keys.clear()
+        await self._close_clients(clients)
+
+
+provider_http_client_pool: ProviderHttpClientPool = ProviderHttpClientPool()
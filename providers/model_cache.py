@@ -0,0 +1,187 @@
+import hashlib
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TypeAlias
+
+import httpx
+
+from pydantic_ai.models import Model
+
+from backend.common.log import log
+from backend.core.conf import settings
+from backend.plugin.ai.providers.base import ProviderAdapter, normalize_provider_api_host
+from backend.plugin.ai.providers.http import provider_http_client_pool
+
+ModelCacheKey: TypeAlias = tuple[int, int, str, str, str]
+
+
+@dataclass(slots=True, eq=False)
+class _CachedModel:
+    """缓存的模型实例"""
+
+    key: ModelCacheKey
+    adapter: ProviderAdapter
+    model: Model
+    http_client: httpx.AsyncClient
+    leases: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    evicted: bool = False
+
+
+def _fingerprint_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class ProviderModelCache:
+    """供应商模型实例缓存
+
+    按（供应商 ID，供应商类型，模型，标准化 API 地址，API 密钥指纹）复用已构建的模型及其 SDK 客户端；
+    被淘汰或失效的实例在最后一次借用归还后关闭
+    """
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[ModelCacheKey, _CachedModel] = OrderedDict()
+        self._leased: dict[int, _CachedModel] = {}
+
+    async def acquire(
+        self,
+        *,
+        provider_id: int,
+        adapter: ProviderAdapter,
+        model_name: str,
+        api_key: str,
+        base_url: str,
+    ) -> Model:
+        """
+        借用模型实例，未命中时构建并缓存，使用完毕后需调用 release 归还
+
+        :param provider_id: 供应商 ID
+        :param adapter: 供应商适配器
+        :param model_name: 模型名称
+        :param api_key: API 密钥
+        :param base_url: API 基础地址
+        :return:
+        """
+        key = (
+            provider_id,
+            int(adapter.provider_type),
+            model_name,
+            normalize_provider_api_host(adapter.provider_type, base_url),
+            _fingerprint_api_key(api_key),
+        )
+        entry = self._entries.get(key)
+        duplicate_client: httpx.AsyncClient | None = None
+        if entry is None:
+            http_client = await provider_http_client_pool.acquire(adapter.provider_type, base_url)
+            # 等待连接池期间并发请求可能已构建相同实例，复用已有实例并在借用后归还本次获取的客户端
+            entry = self._entries.get(key)
+            if entry is not None:
+                duplicate_client = http_client
+            else:
+                try:
+                    model = adapter.create_model(
+                        model_name=model_name,
+                        api_key=api_key,
+                        base_url=base_url,
+                        http_client=http_client,
+                    )
+                except Exception:
+                    await provider_http_client_pool.release(http_client)
+                    raise
+                entry = _CachedModel(key=key, adapter=adapter, model=model, http_client=http_client)
+                self._entries[key] = entry
+        self._entries.move_to_end(key)
+        entry.leases += 1
+        entry.last_used = time.monotonic()
+        self._leased[id(entry.model)] = entry
+        if duplicate_client is not None:
+            await provider_http_client_pool.release(duplicate_client)
+        await self._close_entries(self._pop_evictable())
+        return entry.model
+
+    async def release(self, model: Model) -> None:
+        """
+        归还借用的模型实例
+
+        :param model: 模型实例
+        :return:
+        """
+        entry = self._leased.get(id(model))
+        if entry is None or entry.model is not model:
+            return
+        entry.leases = max(entry.leases - 1, 0)
+        entry.last_used = time.monotonic()
+        if not entry.leases:
+            self._leased.pop(id(model), None)
+        if entry.evicted and not entry.leases:
+            await self._close_entries([entry])
+            return
+        await self._close_entries(self._pop_evictable())
+
+    async def invalidate(self, *, provider_id: int, model_name: str | None = None) -> None:
+        """
+        失效供应商或指定模型的缓存实例
+
+        :param provider_id: 供应商 ID
+        :param model_name: 模型名称，为空时失效该供应商的全部模型
+        :return:
+        """
+        keys = [
+            key
+            for key in self._entries
+            if key[0] == provider_id and (model_name is None or key[2] == model_name)
+        ]
+        await self._close_entries([self._evict(key) for key in keys])
+
+    async def aclose(self) -> None:
+        """关闭所有缓存实例"""
+        entries = [self._evict(key) for key in list(self._entries)]
+        entries.extend(entry for entry in self._leased.values() if entry not in entries)
+        self._leased.clear()
+        for entry in entries:
+            entry.leases = 0
+        await self._close_entries(entries)
+
+    def _evict(self, key: ModelCacheKey) -> _CachedModel:
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        return entry
+
+    def _pop_evictable(self) -> list[_CachedModel]:
+        """
+        淘汰空闲超时及超出容量上限的缓存实例
+
+        :return:
+        """
+        now = time.monotonic()
+        evicted = [
+            self._evict(key)
+            for key, entry in list(self._entries.items())
+            if not entry.leases and now - entry.last_used >= settings.AI_MODEL_CACHE_IDLE_TTL
+        ]
+        overflow = len(self._entries) - settings.AI_MODEL_CACHE_MAX_SIZE
+        for key, entry in list(self._entries.items()):
+            if overflow <= 0:
+                break
+            if entry.leases:
+                continue
+            evicted.append(self._evict(key))
+            overflow -= 1
+        return evicted
+
+    @staticmethod
+    async def _close_entries(entries: list[_CachedModel]) -> None:
+        for entry in entries:
+            if entry.leases:
+                continue
+            try:
+                await entry.adapter.aclose(entry.model)
+            except Exception as exc:
+                log.warning(f'关闭模型供应商客户端失败: {exc}')
+            finally:
+                await provider_http_client_pool.release(entry.http_client)
+
+
+provider_model_cache: ProviderModelCache = ProviderModelCache()
@@ -75,6 +75,19 @@ class AIChatOutputParam(AIChatSchemaBase):
     generation_type: AIChatGenerationType = Field(default=AIChatGenerationType.text, description='生成类型')
 
 
+class AIChatStreamParam(AIChatSchemaBase):
+    """聊天流式输出参数"""
+
+    stream_coalesce: bool | None = Field(default=None, description='是否合并流式增量事件，不传时使用服务端配置')
+    stream_coalesce_window: float | None = Field(
+        default=None,
+        ge=0,
+        le=1,
+        description='增量事件合并时间窗口（单位：s）',
+    )
+    stream_coalesce_max_bytes: int | None = Field(default=None, ge=1, le=65536, description='增量事件合并字节上限')
+
+
 class AIChatForwardedPropsParam(
     AIChatModelSelectParam,
     AIChatThinkingParam,
@@ -82,6 +95,7 @@ class AIChatForwardedPropsParam(
     AIChatModelSettingsParam,
     AIChatImageGenerationParam,
     AIChatOutputParam,
+    AIChatStreamParam,
 ):
     """对话扩展参数"""
 
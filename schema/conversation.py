@@ -23,9 +23,9 @@ class AIConversationSchemaBase(SchemaBase):
 class CreateAIConversationParam(AIConversationSchemaBase):
     """创建对话参数"""
 
-
-class UpdateAIConversationParam(AIConversationSchemaBase):
-    """更新对话参数"""
+    active_run_id: str | None = Field(default=None, description='当前生成任务 ID')
+    active_since: datetime | None = Field(default=None, description='当前生成任务开始时间')
+    next_message_index: int = Field(default=0, description='下一条消息索引')
 
 
 class UpdateAIConversationTitleParam(SchemaBase):
@@ -68,4 +68,24 @@ class GetAIConversationDetail(SchemaBase):
     context_cleared_time: datetime | None = Field(default=None, description='上下文清除时间')
     created_time: datetime = Field(description='创建时间')
     updated_time: datetime | None = Field(None, description='更新时间')
-    messages_snapshot: AIChatMessagesSnapshotDetail = Field(description='对话消息快照')
+    messages_snapshot: AIChatMessagesSnapshotDetail | None = Field(
+        default=None,
+        description='对话全部消息快照，仅在 include_messages 为真时返回',
+    )
+
+
+class GetAIConversationMessagesDetail(SchemaBase):
+    """对话消息分页（兼容协议小驼峰返回）"""
+
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+    messages_snapshot: AIChatMessagesSnapshotDetail = Field(description='当前页消息快照，按聊天顺序排列')
+    has_more: bool = Field(description='是否还有更早的消息')
+    next_before_message_index: int | None = Field(
+        default=None,
+        description='获取更早消息时传入的 before_message_index，没有更早消息时为空',
+    )
+    next_before_message_id: int | None = Field(
+        default=None,
+        description='获取更早消息时传入的 before_message_id，没有更早消息时为空',
+    )
@@ -0,0 +1,96 @@
+"""
+对比消息持久化与历史校验的序列化路径耗时
+
+legacy 复现旧流程：to_jsonable_python 转为字典，由数据库驱动 json.dumps 编码写入，读出时 json.loads 解码后 validate_python 校验；
+current 为当前流程：ModelMessagesTypeAdapter.dump_json 直接输出 JSON 字节写入文本列，读出后 validate_json 直接校验。
+使用合成对话，不访问数据库
+
+用法：python -m backend.plugin.ai.scripts.bench_message_codec [--messages 1000] [--iterations 20] [--payload-repeat 20]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from collections.abc import Callable
+from typing import Any
+
+from pydantic_ai import ModelMessage, ModelMessagesTypeAdapter
+from pydantic_core import to_jsonable_python
+
+from backend.plugin.ai.scripts.synthetic_conversation import build_conversation
+from backend.plugin.ai.utils.message_storage import dump_model_messages
+
+
+def legacy_write(messages: list[ModelMessage]) -> str:
+    payloads = to_jsonable_python(messages, by_alias=True)
+    return json.dumps(payloads, ensure_ascii=False)
+
+
+def legacy_read(stored: str) -> list[ModelMessage]:
+    return ModelMessagesTypeAdapter.validate_python(json.loads(stored))
+
+
+def current_write(messages: list[ModelMessage]) -> str:
+    return dump_model_messages(messages).decode()
+
+
+def current_read(stored: str) -> list[ModelMessage]:
+    return ModelMessagesTypeAdapter.validate_json(stored)
+
+
+def measure(func: Callable[[Any], Any], arg: Any, iterations: int) -> list[float]:
+    """
+    多次执行并记录耗时
+
+    :param func: 被测函数
+    :param arg: 参数
+    :param iterations: 执行次数
+    :return:
+    """
+    func(arg)
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(arg)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(name: str, durations: list[float]) -> str:
+    ordered = sorted(durations)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    return f'{name:<14} p50={statistics.median(ordered) * 1000:8.2f}ms p95={p95 * 1000:8.2f}ms'
+
+
+def run(count: int, iterations: int, payload_repeat: int) -> None:
+    """
+    执行对比
+
+    :param count: 模型消息数量
+    :param iterations: 执行次数
+    :param payload_repeat: 合成对话各段文本的重复次数
+    :return:
+    """
+    messages = build_conversation(count, payload_repeat=payload_repeat)
+    legacy_stored = legacy_write(messages)
+    current_stored = current_write(messages)
+    print(f'模型消息 {count} 条，JSON 大小 legacy={len(legacy_stored.encode())}B current={len(current_stored.encode())}B')
+    print(summarize('legacy write', measure(legacy_write, messages, iterations)))
+    print(summarize('current write', measure(current_write, messages, iterations)))
+    print(summarize('legacy read', measure(legacy_read, legacy_stored, iterations)))
+    print(summarize('current read', measure(current_read, current_stored, iterations)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='对比消息持久化与历史校验的序列化路径耗时')
+    parser.add_argument('--messages', type=int, default=1000, help='合成对话的模型消息数量')
+    parser.add_argument('--iterations', type=int, default=20, help='每条路径执行次数')
+    parser.add_argument('--payload-repeat', type=int, default=20, help='合成对话各段文本的重复次数')
+    args = parser.parse_args()
+    run(args.messages, args.iterations, args.payload_repeat)
+
+
+if __name__ == '__main__':
+    main()
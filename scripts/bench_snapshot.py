@@ -0,0 +1,65 @@
+"""
+测量对话消息快照序列化耗时
+
+使用合成对话按 100、1000、10000 条模型消息分别执行 serialize_messages_to_snapshot，不访问数据库
+
+用法：python -m backend.plugin.ai.scripts.bench_snapshot [--sizes 100 1000 10000] [--iterations 5] [--payload-repeat 4]
+"""
+
+import argparse
+import statistics
+import time
+
+from backend.plugin.ai.protocol.ag_ui.snapshot_builder import serialize_messages_to_snapshot
+from backend.plugin.ai.scripts.synthetic_conversation import build_conversation
+
+
+def run(sizes: list[int], iterations: int, payload_repeat: int) -> None:
+    """
+    执行测量
+
+    :param sizes: 模型消息数量列表
+    :param iterations: 每个规模执行次数
+    :param payload_repeat: 合成对话各段文本的重复次数
+    :return:
+    """
+    for size in sizes:
+        messages = build_conversation(size, payload_repeat=payload_repeat, tool_results=1)
+        # 每 4 条模型消息对应一轮用户消息与助手消息两行
+        message_ids = [index // 4 * 2 + (index % 4 > 0) + 1 for index in range(size)]
+        message_indexes = [(message_id - 1) * 1024 for message_id in message_ids]
+        provider_ids = [1] * size
+        model_ids = ['bench'] * size
+        durations = []
+        snapshot_size = 0
+        for _ in range(iterations + 1):
+            start = time.perf_counter()
+            snapshot = serialize_messages_to_snapshot(
+                messages,
+                conversation_id='bench',
+                message_ids=message_ids,
+                provider_ids=provider_ids,
+                model_ids=model_ids,
+                message_indexes=message_indexes,
+            )
+            durations.append(time.perf_counter() - start)
+            snapshot_size = len(snapshot.messages)
+        # 首次执行包含类型分派等惰性初始化，不计入统计
+        durations = durations[1:]
+        print(
+            f'模型消息 {size:>6} 条 -> 快照消息 {snapshot_size:>6} 条 '
+            f'p50={statistics.median(durations) * 1000:9.2f}ms min={min(durations) * 1000:9.2f}ms'
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='测量对话消息快照序列化耗时')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='模型消息数量')
+    parser.add_argument('--iterations', type=int, default=5, help='每个规模执行次数')
+    parser.add_argument('--payload-repeat', type=int, default=4, help='合成对话各段文本的重复次数')
+    args = parser.parse_args()
+    run(args.sizes, args.iterations, args.payload_repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+测量流式增量事件合并前后的发送帧率与 CPU 耗时
+
+按给定速率生成一条合成文本增量事件流，分别逐个编码和合并后编码为 SSE 帧，经本机 TCP 连接逐帧写出，
+统计每条流的帧数、每秒帧数及 CPU 耗时（包含收发两端），不调用模型
+
+用法：python -m backend.plugin.ai.scripts.bench_stream_coalesce [--deltas 2000] [--rate 500] [--window 0.03]
+"""
+
+import argparse
+import asyncio
+import time
+
+from collections.abc import AsyncGenerator, AsyncIterator
+
+from ag_ui.core import BaseEvent, TextMessageContentEvent, TextMessageEndEvent, TextMessageStartEvent
+from ag_ui.encoder import EventEncoder
+
+from backend.plugin.ai.dataclasses import ChatStreamCoalescePolicy
+from backend.plugin.ai.protocol.ag_ui.event_stream import coalesce_delta_events
+
+
+async def generate_events(deltas: int, rate: float) -> AsyncGenerator[BaseEvent, None]:
+    """
+    按固定速率生成文本增量事件
+
+    :param deltas: 增量事件数量
+    :param rate: 每秒增量事件数量
+    :return:
+    """
+    yield TextMessageStartEvent(message_id='bench', role='assistant')
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for index in range(deltas):
+        delay = start + index / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield TextMessageContentEvent(message_id='bench', delta=f'token{index % 10} ')
+    yield TextMessageEndEvent(message_id='bench')
+
+
+async def _discard(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    读取并丢弃连接数据
+
+    :param reader: 读取流
+    :param writer: 写入流
+    :return:
+    """
+    while await reader.read(65536):
+        pass
+    writer.close()
+
+
+async def measure(events: AsyncIterator[BaseEvent]) -> tuple[int, int, float, float]:
+    """
+    编码事件流并逐帧写出，统计帧数、字节数、墙钟耗时与 CPU 耗时
+
+    :param events: AG-UI 事件流
+    :return:
+    """
+    server = await asyncio.start_server(_discard, '127.0.0.1', 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    _, writer = await asyncio.open_connection(host, port)
+    encoder = EventEncoder()
+    frames = 0
+    size = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        async for event in events:
+            frame = encoder.encode(event).encode()
+            writer.write(frame)
+            await writer.drain()
+            size += len(frame)
+            frames += 1
+        return frames, size, time.perf_counter() - wall_start, time.process_time() - cpu_start
+    finally:
+        writer.close()
+        await writer.wait_closed()
+        server.close()
+        await server.wait_closed()
+
+
+async def run(deltas: int, rate: float, window: float, max_bytes: int) -> None:
+    """
+    执行测量
+
+    :param deltas: 增量事件数量
+    :param rate: 每秒增量事件数量
+    :param window: 合并时间窗口（秒）
+    :param max_bytes: 合并字节上限
+    :return:
+    """
+    policy = ChatStreamCoalescePolicy(window=window, max_bytes=max_bytes)
+    cases = (
+        ('逐个发送', generate_events(deltas, rate)),
+        ('合并发送', coalesce_delta_events(generate_events(deltas, rate), policy=policy)),
+    )
+    for name, events in cases:
+        frames, size, wall, cpu = await measure(events)
+        print(
+            f'{name} 帧数={frames:>6} 字节={size:>8} 帧率={frames / wall:8.1f}/s '
+            f'耗时={wall * 1000:8.1f}ms CPU={cpu * 1000:8.2f}ms'
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='测量流式增量事件合并前后的发送帧率与 CPU 耗时')
+    parser.add_argument('--deltas', type=int, default=2000, help='增量事件数量')
+    parser.add_argument('--rate', type=float, default=500, help='每秒增量事件数量')
+    parser.add_argument('--window', type=float, default=0.03, help='合并时间窗口（秒）')
+    parser.add_argument('--max-bytes', type=int, default=2048, help='合并字节上限')
+    args = parser.parse_args()
+    asyncio.run(run(args.deltas, args.rate, args.window, args.max_bytes))
+
+
+if __name__ == '__main__':
+    main()
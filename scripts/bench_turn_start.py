@@ -0,0 +1,206 @@
+"""
+对比聊天轮次开始阶段的行锁持有时间
+
+legacy 复现旧流程：锁定对话、扫描待生成消息、整行更新对话、查询最大消息索引、逐条插入消息并刷新、在锁内读取全部历史；
+current 为当前流程：锁定对话、一次定向更新分配索引并写入生成标记、一次刷新插入两条消息，历史在锁外读取。
+每轮均在事务内执行后回滚，不会改变测试对话
+
+用法：python -m backend.plugin.ai.scripts.bench_turn_start [--messages 200] [--iterations 50]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database.db import async_db_session, uuid4_str
+from backend.plugin.ai.crud.crud_conversation import MESSAGE_INDEX_STRIDE, ai_conversation_dao
+from backend.plugin.ai.crud.crud_message import ai_message_dao
+from backend.plugin.ai.enums import AIMessageStatus
+from backend.plugin.ai.model import AIConversation, AIMessage
+from backend.plugin.ai.schema.conversation import CreateAIConversationParam
+
+PROVIDER_ID = 0
+MODEL_ID = 'bench'
+
+
+def build_message(conversation_id: str, message_index: int, *, role: str, status: str) -> dict[str, Any]:
+    """
+    构建测试消息字段
+
+    :param conversation_id: 对话 ID
+    :param message_index: 消息索引
+    :param role: 消息角色
+    :param status: 消息状态
+    :return:
+    """
+    content = [] if status == AIMessageStatus.pending else [{'kind': 'request', 'parts': []}]
+    return {
+        'conversation_id': conversation_id,
+        'provider_id': PROVIDER_ID,
+        'model_id': MODEL_ID,
+        'message_index': message_index,
+        'role': role,
+        'status': status,
+        'model_messages': content,
+    }
+
+
+async def seed_conversation(message_count: int) -> str:
+    """
+    创建测试对话
+
+    :param message_count: 历史消息数量
+    :return:
+    """
+    conversation_id = f'bench-{uuid4_str()}'
+    async with async_db_session.begin() as db:
+        await ai_conversation_dao.create(
+            db,
+            CreateAIConversationParam(
+                conversation_id=conversation_id,
+                title='bench',
+                provider_id=PROVIDER_ID,
+                model_id=MODEL_ID,
+                user_id=0,
+                next_message_index=message_count * MESSAGE_INDEX_STRIDE,
+            ),
+        )
+        await ai_message_dao.bulk_create(
+            db,
+            [
+                build_message(
+                    conversation_id,
+                    index * MESSAGE_INDEX_STRIDE,
+                    role='user' if index % 2 == 0 else 'assistant',
+                    status=AIMessageStatus.success,
+                )
+                for index in range(message_count)
+            ],
+        )
+    return conversation_id
+
+
+async def legacy_turn_start(db: AsyncSession, conversation_id: str) -> None:
+    """旧版轮次开始流程"""
+    conversation = await ai_conversation_dao.get_by_conversation_id_for_update(db, conversation_id)
+    await db.scalar(
+        select(
+            select(AIMessage.id)
+            .where(
+                AIMessage.conversation_id == conversation_id,
+                AIMessage.status == AIMessageStatus.pending,
+                AIMessage.deleted == 0,
+            )
+            .exists()
+        )
+    )
+    await db.execute(
+        update(AIConversation)
+        .where(AIConversation.id == conversation.id)
+        .values(
+            conversation_id=conversation.conversation_id,
+            title=conversation.title,
+            provider_id=PROVIDER_ID,
+            model_id=MODEL_ID,
+            user_id=conversation.user_id,
+            pinned_time=conversation.pinned_time,
+            context_start_message_id=conversation.context_start_message_id,
+            context_cleared_time=conversation.context_cleared_time,
+        )
+    )
+    max_index = await db.scalar(
+        select(func.max(AIMessage.message_index)).where(
+            AIMessage.conversation_id == conversation_id,
+            AIMessage.deleted == 0,
+        )
+    )
+    next_index = (max_index if max_index is not None else -1) + 1
+    await ai_message_dao.create(
+        db,
+        build_message(conversation_id, next_index, role='user', status=AIMessageStatus.success),
+    )
+    await ai_message_dao.create(
+        db,
+        build_message(conversation_id, next_index + 1, role='assistant', status=AIMessageStatus.pending),
+    )
+    await ai_message_dao.get_all_by_message_index(db, conversation_id)
+
+
+async def current_turn_start(db: AsyncSession, conversation_id: str) -> None:
+    """当前轮次开始流程"""
+    conversation = await ai_conversation_dao.get_by_conversation_id_for_update(db, conversation_id)
+    message_indexes = await ai_conversation_dao.start_turn(
+        db,
+        conversation,
+        provider_id=PROVIDER_ID,
+        model_id=MODEL_ID,
+        run_id=uuid4_str(),
+        count=2,
+    )
+    await ai_message_dao.create_many(
+        db,
+        [
+            build_message(conversation_id, message_indexes[0], role='user', status=AIMessageStatus.success),
+            build_message(conversation_id, message_indexes[1], role='assistant', status=AIMessageStatus.pending),
+        ],
+    )
+
+
+async def measure(
+    turn_start: Callable[[AsyncSession, str], Awaitable[None]],
+    conversation_id: str,
+    iterations: int,
+) -> list[float]:
+    """
+    测量行锁持有时间（毫秒），从锁定语句开始到事务结束
+
+    :param turn_start: 轮次开始流程
+    :param conversation_id: 对话 ID
+    :param iterations: 迭代次数
+    :return:
+    """
+    durations = []
+    for _ in range(iterations):
+        async with async_db_session() as db:
+            start = time.perf_counter()
+            await turn_start(db, conversation_id)
+            await db.rollback()
+            durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summarize(name: str, durations: list[float]) -> str:
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f'{name:<8} median={statistics.median(ordered):.2f}ms p95={p95:.2f}ms max={ordered[-1]:.2f}ms'
+
+
+async def run(message_count: int, iterations: int) -> None:
+    conversation_id = await seed_conversation(message_count)
+    try:
+        for name, turn_start in (('legacy', legacy_turn_start), ('current', current_turn_start)):
+            await measure(turn_start, conversation_id, min(iterations, 5))
+            print(summarize(name, await measure(turn_start, conversation_id, iterations)))
+    finally:
+        async with async_db_session.begin() as db:
+            await db.execute(delete(AIMessage).where(AIMessage.conversation_id == conversation_id))
+            await db.execute(delete(AIConversation).where(AIConversation.conversation_id == conversation_id))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='对比聊天轮次开始阶段的行锁持有时间')
+    parser.add_argument('--messages', type=int, default=200, help='测试对话的历史消息数量')
+    parser.add_argument('--iterations', type=int, default=50, help='每种流程的迭代次数')
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+按批压缩已有消息的模型消息载荷，并输出存储与读取量的节省情况
+
+逐批按主键顺序读取消息，未压缩且达到 AI_MESSAGE_CODEC_MIN_BYTES 的载荷按指定编码压缩后回写；
+回写时校验更新时间未变化并保留原更新时间，并发写入的行会被跳过，消息缓存版本不受影响。
+使用 zstd 共享字典时，可先通过 --train-dict 从已有消息训练字典，再配置 AI_MESSAGE_CODEC_ZSTD_DICT_PATH
+
+用法：
+python -m backend.plugin.ai.scripts.compress_messages [--codec zlib] [--batch-size 200] [--dry-run]
+python -m backend.plugin.ai.scripts.compress_messages --train-dict ai_messages.zdict [--samples 2000]
+"""
+
+import argparse
+import asyncio
+
+from pathlib import Path
+
+from sqlalchemy import bindparam, select
+
+from backend.core.conf import settings
+from backend.database.db import async_db_session
+from backend.plugin.ai.model import AIMessage
+from backend.plugin.ai.utils.message_codec import (
+    decode_model_messages,
+    encode_model_messages,
+    import_zstandard,
+    is_encoded_model_messages,
+)
+
+
+async def train_dict(path: str, samples: int, dict_size: int) -> None:
+    """
+    从已有消息训练 zstd 共享字典
+
+    :param path: 字典输出路径
+    :param samples: 样本消息行数量
+    :param dict_size: 字典大小（字节）
+    :return:
+    """
+    zstandard = import_zstandard()
+    async with async_db_session() as db:
+        stmt = select(AIMessage.model_messages).order_by(AIMessage.id.desc()).limit(samples)
+        rows = (await db.scalars(stmt)).all()
+    sample_data = [
+        raw if isinstance(raw, bytes) else raw.encode()
+        for raw in map(decode_model_messages, rows)
+        if len(raw) > len('[]')
+    ]
+    if not sample_data:
+        print('没有可用于训练的消息')
+        return
+    zstd_dict = zstandard.train_dictionary(dict_size, sample_data)
+    Path(path).write_bytes(zstd_dict.as_bytes())
+    print(f'已从 {len(sample_data)} 条消息训练字典 dict_id={zstd_dict.dict_id()}，输出到 {path}')
+    print('请将 AI_MESSAGE_CODEC_ZSTD_DICT_PATH 指向该文件；字典投入使用后不可替换，否则已压缩的消息无法解压')
+
+
+async def compress(codec: str, batch_size: int, dry_run: bool) -> None:
+    """
+    按批压缩消息载荷
+
+    :param codec: 编码名称
+    :param batch_size: 每批消息行数量
+    :param dry_run: 仅统计，不回写
+    :return:
+    """
+    table = AIMessage.__table__
+    stmt = (
+        table.update()
+        .where(
+            table.c.id == bindparam('b_id'),
+            table.c.updated_time.is_not_distinct_from(bindparam('b_updated_time')),
+        )
+        .values(model_messages=bindparam('b_model_messages'), updated_time=table.c.updated_time)
+    )
+    last_id = 0
+    scanned = compressed = skipped = 0
+    before_bytes = after_bytes = 0
+    while True:
+        async with async_db_session.begin() as db:
+            query = (
+                select(AIMessage.id, AIMessage.model_messages, AIMessage.updated_time)
+                .where(AIMessage.id > last_id)
+                .order_by(AIMessage.id.asc())
+                .limit(batch_size)
+            )
+            rows = (await db.execute(query)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            params = []
+            for row in rows:
+                scanned += 1
+                size = len(row.model_messages.encode())
+                before_bytes += size
+                if is_encoded_model_messages(row.model_messages):
+                    after_bytes += size
+                    continue
+                encoded = encode_model_messages(row.model_messages.encode(), codec=codec)
+                if not is_encoded_model_messages(encoded):
+                    after_bytes += size
+                    continue
+                after_bytes += len(encoded.encode())
+                params.append({'b_id': row.id, 'b_updated_time': row.updated_time, 'b_model_messages': encoded})
+            if params and not dry_run:
+                result = await db.execute(stmt, params)
+                updated = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(params)
+                compressed += updated
+                skipped += len(params) - updated
+            else:
+                compressed += len(params)
+        print(f'已处理至 id={last_id}，扫描 {scanned} 行，压缩 {compressed} 行')
+
+    saved = before_bytes - after_bytes
+    ratio = saved / before_bytes * 100 if before_bytes else 0
+    mode = '（试运行，未回写）' if dry_run else ''
+    print(f'== 压缩完成{mode}：编码 {codec}，扫描 {scanned} 行，压缩 {compressed} 行，并发变更跳过 {skipped} 行')
+    print(f'载荷存储 {before_bytes} -> {after_bytes} 字节，节省 {saved} 字节（{ratio:.1f}%）')
+    if scanned:
+        print(f'单行平均读取量 {before_bytes / scanned:.0f} -> {after_bytes / scanned:.0f} 字节')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='按批压缩已有消息的模型消息载荷')
+    parser.add_argument('--codec', default=None, choices=('zlib', 'zstd'), help='编码，默认使用 AI_MESSAGE_CODEC')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批消息行数量')
+    parser.add_argument('--dry-run', action='store_true', help='仅统计节省情况，不回写')
+    parser.add_argument('--train-dict', default=None, help='训练 zstd 共享字典并输出到指定路径')
+    parser.add_argument('--samples', type=int, default=2000, help='训练字典使用的样本消息行数量')
+    parser.add_argument('--dict-size', type=int, default=112640, help='训练字典大小（字节）')
+    args = parser.parse_args()
+    if args.train_dict:
+        asyncio.run(train_dict(args.train_dict, args.samples, args.dict_size))
+        return
+    codec = args.codec or settings.AI_MESSAGE_CODEC
+    if codec not in ('zlib', 'zstd'):
+        parser.error('AI_MESSAGE_CODEC 未启用压缩，请通过 --codec 指定编码')
+    asyncio.run(compress(codec, args.batch_size, args.dry_run))
+
+
+if __name__ == '__main__':
+    main()
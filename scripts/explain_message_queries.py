@@ -0,0 +1,93 @@
+"""
+输出 AI 消息热点查询的执行计划，检查是否命中复合索引
+
+用法：python -m backend.plugin.ai.scripts.explain_message_queries [--conversation-id ID]
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import Select, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database.db import async_db_session
+from backend.plugin.ai.crud.crud_message import ai_message_dao
+from backend.plugin.ai.enums import AIMessageStatus
+from backend.plugin.ai.model import AIMessage
+
+MESSAGE_INDEXES = ('ix_ai_message_conversation_order', 'ix_ai_message_conversation_pending')
+
+
+def build_queries(conversation_id: str) -> list[tuple[str, Select]]:
+    """
+    构建待检查的热点查询
+
+    :param conversation_id: 对话 ID
+    :return:
+    """
+    context_window = ai_message_dao._select_context_window(conversation_id, None)
+    return [
+        (
+            'context_window',
+            context_window.order_by(AIMessage.message_index.asc(), AIMessage.id.asc()),
+        ),
+        (
+            'context_window_tail',
+            context_window.order_by(AIMessage.message_index.desc(), AIMessage.id.desc()).limit(20),
+        ),
+        (
+            'pending',
+            select(AIMessage).where(
+                AIMessage.conversation_id == conversation_id,
+                AIMessage.status == AIMessageStatus.pending,
+                AIMessage.deleted == 0,
+            ),
+        ),
+    ]
+
+
+async def get_largest_conversation_id(db: AsyncSession) -> str | None:
+    """
+    获取消息数量最多的对话 ID
+
+    :param db: 数据库会话
+    :return:
+    """
+    stmt = (
+        select(AIMessage.conversation_id)
+        .where(AIMessage.deleted == 0)
+        .group_by(AIMessage.conversation_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    return await db.scalar(stmt)
+
+
+async def explain(conversation_id: str | None) -> None:
+    """
+    输出执行计划
+
+    :param conversation_id: 对话 ID，为空时使用消息数量最多的对话
+    :return:
+    """
+    async with async_db_session() as db:
+        conversation_id = conversation_id or await get_largest_conversation_id(db) or 'explain'
+        dialect = db.bind.dialect
+        for name, stmt in build_queries(conversation_id):
+            sql = str(stmt.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            result = await db.execute(text(f'EXPLAIN {sql}'))
+            plan = '\n'.join(' | '.join(str(value) for value in row) for row in result.all())
+            used = [index for index in MESSAGE_INDEXES if index in plan]
+            summary = f'使用索引 {", ".join(used)}' if used else '未使用复合索引，数据量较小时优化器可能选择全表扫描'
+            print(f'== {name}: {summary}\n{plan}\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='输出 AI 消息热点查询的执行计划')
+    parser.add_argument('--conversation-id', default=None, help='对话 ID，默认使用消息数量最多的对话')
+    args = parser.parse_args()
+    asyncio.run(explain(args.conversation_id))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+基准测试使用的合成对话
+
+按用户输入、思考与工具调用、工具返回、最终回复循环构建模型消息，不访问数据库
+"""
+
+from datetime import datetime, timezone
+
+from pydantic_ai import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ThinkingPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+
+def build_conversation(count: int, *, payload_repeat: int = 8, tool_results: int = 5) -> list[ModelMessage]:
+    """
+    构建合成对话，按用户输入、思考与工具调用、工具返回、最终回复循环
+
+    :param count: 模型消息数量
+    :param payload_repeat: 各段文本的重复次数，用于调整单条消息大小
+    :param tool_results: 每次工具返回的检索结果数量
+    :return:
+    """
+    timestamp = datetime.now(timezone.utc)
+    messages: list[ModelMessage] = []
+    for turn in range(count):
+        step = turn % 4
+        if step == 0:
+            prompt = f'第 {turn} 轮问题：' + '请总结相关资料。' * payload_repeat
+            messages.append(ModelRequest(parts=[UserPromptPart(content=prompt)]))
+        elif step == 1:
+            parts = [
+                ThinkingPart(content='分析用户问题并决定检索关键词。' * payload_repeat),
+                ToolCallPart(tool_name='web_search', args={'query': f'关键词 {turn}'}, tool_call_id=f'call_{turn}'),
+            ]
+            messages.append(ModelResponse(parts=parts, model_name='bench', timestamp=timestamp))
+        elif step == 2:
+            part = ToolReturnPart(
+                tool_name='web_search',
+                content=[{'title': f'结果 {i}', 'snippet': '检索结果摘要。' * payload_repeat} for i in range(tool_results)],
+                tool_call_id=f'call_{turn - 1}',
+            )
+            messages.append(ModelRequest(parts=[part]))
+        else:
+            parts = [TextPart(content='根据检索结果整理的回答。' * payload_repeat)]
+            messages.append(ModelResponse(parts=parts, model_name='bench', timestamp=timestamp))
+    return messages
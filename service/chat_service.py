@@ -1,24 +1,34 @@
+import time
+
 import anyio
 
 from pydantic_ai import ModelMessage, ModelRequest, UserPromptPart
-from pydantic_core import to_jsonable_python
 from sqlalchemy.exc import IntegrityError
 from starlette.responses import StreamingResponse
 
 from backend.common.exception import errors
 from backend.common.log import log
-from backend.database.db import async_db_session
+from backend.database.db import async_db_session, uuid4_str
+from backend.plugin.ai.chat.persistence import persist_terminal_completion
 from backend.plugin.ai.chat.runner import is_user_prompt_message, open_chat_session
-from backend.plugin.ai.crud.crud_conversation import ai_conversation_dao
+from backend.plugin.ai.crud.crud_conversation import MESSAGE_INDEX_STRIDE, ai_conversation_dao
 from backend.plugin.ai.crud.crud_message import ai_message_dao
 from backend.plugin.ai.dataclasses import CompletionPersistenceContext
 from backend.plugin.ai.enums import AIMessageStatus
 from backend.plugin.ai.protocol.registry import get_chat_protocol_adapter
 from backend.plugin.ai.schema.chat import AIChatCompletionParam
-from backend.plugin.ai.schema.conversation import CreateAIConversationParam, UpdateAIConversationParam
+from backend.plugin.ai.schema.conversation import CreateAIConversationParam
 from backend.plugin.ai.service.conversation_service import ai_conversation_service
 from backend.plugin.ai.utils.conversation_control import normalize_generated_conversation_title
-from backend.plugin.ai.utils.message_storage import build_chat_message_record
+from backend.plugin.ai.utils.message_cache import ai_message_cache
+from backend.plugin.ai.utils.message_storage import (
+    build_chat_message_record,
+    dump_model_messages,
+    externalize_message_blobs,
+    resolve_message_blobs,
+)
+from backend.plugin.ai.utils.stream_resume import ai_stream_registry, stream_resume_total
+from backend.utils.timezone import timezone
 
 
 def _get_current_user_prompt_part(*, messages: list[ModelMessage]) -> UserPromptPart:
@@ -107,10 +117,13 @@ class AIChatService:
             prompt, has_binary_input = _parse_user_prompt(first_part=first_part)
             if not prompt and not has_binary_input:
                 raise errors.RequestError(msg='当前轮用户消息不能为空')
-            payload_messages = to_jsonable_python(current_messages, by_alias=True)
-            assert isinstance(payload_messages, list)
-            user_message_record = build_chat_message_record(role='user', model_messages=payload_messages)
+            current_messages = await externalize_message_blobs(current_messages)
+            user_message_json = dump_model_messages(current_messages)
+            user_message_record = build_chat_message_record(role='user', model_messages=user_message_json)
 
+            timings = agent_session.timings
+            run_id = uuid4_str()
+            turn_start = time.perf_counter()
             async with async_db_session.begin() as session:
                 conversation = await ai_conversation_service.get_owned_conversation(
                     db=session,
@@ -120,74 +133,84 @@ class AIChatService:
                     for_update=True,
                 )
                 if conversation:
-                    await ai_conversation_service.ensure_idle(db=session, conversation_id=conversation_id)
-                    await ai_conversation_dao.update(
+                    await ai_conversation_service.ensure_idle(db=session, conversation=conversation)
+                    title = conversation.title
+                    message_indexes = await ai_conversation_dao.start_turn(
                         session,
-                        conversation.id,
-                        UpdateAIConversationParam(
-                            conversation_id=conversation.conversation_id,
-                            title=conversation.title,
-                            provider_id=forwarded_props.provider_id,
-                            model_id=forwarded_props.model_id,
-                            user_id=conversation.user_id,
-                            pinned_time=conversation.pinned_time,
-                            context_start_message_id=conversation.context_start_message_id,
-                            context_cleared_time=conversation.context_cleared_time,
-                        ),
+                        conversation,
+                        provider_id=forwarded_props.provider_id,
+                        model_id=forwarded_props.model_id,
+                        run_id=run_id,
+                        count=2,
                     )
                 else:
+                    title = normalize_generated_conversation_title(title=prompt)
                     await ai_conversation_dao.create(
                         session,
                         CreateAIConversationParam(
                             conversation_id=conversation_id,
-                            title=normalize_generated_conversation_title(title=prompt),
+                            title=title,
                             provider_id=forwarded_props.provider_id,
                             model_id=forwarded_props.model_id,
                             user_id=user_id,
+                            active_run_id=run_id,
+                            active_since=timezone.now(),
+                            next_message_index=2 * MESSAGE_INDEX_STRIDE,
                         ),
                     )
+                    message_indexes = [0, MESSAGE_INDEX_STRIDE]
 
-                next_message_index = await ai_message_dao.get_next_message_index(session, conversation_id)
-                await ai_message_dao.create(
+                user_message, assistant_message = await ai_message_dao.create_many(
                     session,
-                    {
-                        'conversation_id': conversation_id,
-                        'provider_id': forwarded_props.provider_id,
-                        'model_id': forwarded_props.model_id,
-                        'message_index': next_message_index,
-                        'status': AIMessageStatus.success,
-                        **user_message_record,
-                    },
+                    [
+                        {
+                            'conversation_id': conversation_id,
+                            'provider_id': forwarded_props.provider_id,
+                            'model_id': forwarded_props.model_id,
+                            'message_index': message_indexes[0],
+                            'status': AIMessageStatus.success,
+                            **user_message_record,
+                        },
+                        {
+                            'conversation_id': conversation_id,
+                            'provider_id': forwarded_props.provider_id,
+                            'model_id': forwarded_props.model_id,
+                            'message_index': message_indexes[1],
+                            'role': 'assistant',
+                            'status': AIMessageStatus.pending,
+                            'model_messages': [],
+                        },
+                    ],
                 )
-                assistant_message = await ai_message_dao.create(
-                    session,
-                    {
-                        'conversation_id': conversation_id,
-                        'provider_id': forwarded_props.provider_id,
-                        'model_id': forwarded_props.model_id,
-                        'message_index': next_message_index + 1,
-                        'role': 'assistant',
-                        'status': AIMessageStatus.pending,
-                        'model_messages': [],
-                    },
-                )
-                assistant_message_id = assistant_message.id
+            timings.record('turn', time.perf_counter() - turn_start)
+            ai_message_cache.put(
+                conversation_id=conversation_id,
+                row_id=user_message.id,
+                version=(None, AIMessageStatus.success, len(user_message_record['model_messages'])),
+                size=len(user_message_json),
+                messages=current_messages,
+            )
+            persistence = CompletionPersistenceContext(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                forwarded_props=forwarded_props,
+                title=title,
+                assistant_message_id=assistant_message.id,
+                run_id=run_id,
+            )
 
-                state = await ai_conversation_service.get_chat_state(
-                    db=session,
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    must_exist=True,
-                    require_messages=True,
-                )
-                message_history = state.model_messages[state.context_start_index :]
-                persistence = CompletionPersistenceContext(
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    forwarded_props=forwarded_props,
-                    title=state.conversation.title if state.conversation else prompt,
-                    assistant_message_id=assistant_message_id,
-                )
+            # 对话已标记生成任务，历史消息在行锁释放后读取，失败时需释放占位消息
+            try:
+                with timings.measure('history'):
+                    async with async_db_session() as session:
+                        state = await ai_conversation_service.get_chat_window_state(
+                            db=session,
+                            conversation_id=conversation_id,
+                            user_id=user_id,
+                            require_messages=True,
+                            max_rows=agent_session.history_row_limit,
+                        )
+                    message_history = await resolve_message_blobs(state.model_messages)
                 response = agent_session.stream(
                     user_id=user_id,
                     agent=agent,
@@ -197,6 +220,15 @@ class AIChatService:
                     message_history=message_history,
                     persistence=persistence,
                 )
+            except BaseException as exc:
+                with anyio.CancelScope(shield=True):
+                    await persist_terminal_completion(
+                        persistence=persistence,
+                        messages=[],
+                        status=AIMessageStatus.error if isinstance(exc, Exception) else AIMessageStatus.interrupted,
+                        reason=str(exc),
+                    )
+                raise
         except BaseException as exc:
             # 屏蔽取消：任务取消时仍完成客户端关闭，避免连接泄漏
             with anyio.CancelScope(shield=True):
@@ -208,7 +240,35 @@ class AIChatService:
             if isinstance(exc, IntegrityError):
                 raise errors.ConflictError(msg='当前对话已发生变化，请重试') from exc
             raise
+        response.headers['Server-Timing'] = timings.server_timing()
         return response
 
+    @staticmethod
+    def resume_completion(
+        *,
+        user_id: int,
+        conversation_id: str,
+        run_id: str,
+        last_event_id: int | None,
+    ) -> StreamingResponse:
+        """
+        重新连接进行中或刚结束的流式生成，重放 Last-Event-ID 之后的事件并跟随实时事件
+
+        :param user_id: 用户 ID
+        :param conversation_id: 对话 ID
+        :param run_id: 运行 ID
+        :param last_event_id: 客户端已收到的最后一个事件 ID，为空时从头重放
+        :return:
+        """
+        run = ai_stream_registry.get(conversation_id, run_id)
+        if run is None or run.user_id != user_id:
+            raise errors.NotFoundError(msg='生成任务不存在或已过期')
+        last_event_id = last_event_id or 0
+        if not run.can_replay(last_event_id):
+            stream_resume_total.inc(outcome='expired')
+            raise errors.ConflictError(msg='断线期间的生成事件已过期，请重新加载对话')
+        stream_resume_total.inc(outcome='reattached')
+        return run.streaming_response(last_event_id)
+
 
 ai_chat_service: AIChatService = AIChatService()
@@ -1,22 +1,41 @@
+from collections.abc import AsyncIterator, Sequence
+from datetime import timedelta
 from typing import Any
 
+from pydantic_core import to_json
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.responses import StreamingResponse
 
 from backend.common.exception import errors
+from backend.common.log import log
 from backend.common.pagination import cursor_paging_data
+from backend.core.conf import settings
+from backend.database.db import async_db_session
 from backend.plugin.ai.crud.crud_conversation import ai_conversation_dao
 from backend.plugin.ai.crud.crud_message import ai_message_dao
-from backend.plugin.ai.dataclasses import ChatConversationState
+from backend.plugin.ai.dataclasses import ChatContextWindowState, ChatConversationState
 from backend.plugin.ai.model.conversation import AIConversation
+from backend.plugin.ai.model.message import AIMessage
+from backend.plugin.ai.protocol.default_schema import AIChatMessagesSnapshotDetail
 from backend.plugin.ai.protocol.registry import get_chat_protocol_adapter
 from backend.plugin.ai.schema.conversation import (
     GetAIConversationDetail,
-    UpdateAIConversationParam,
+    GetAIConversationMessagesDetail,
     UpdateAIConversationPinnedParam,
     UpdateAIConversationTitleParam,
 )
+from backend.plugin.ai.utils.blob_store import get_blob_store, is_valid_blob_key
 from backend.plugin.ai.utils.conversation_control import normalize_conversation_title
-from backend.plugin.ai.utils.message_storage import expand_message_row_metadata, expand_message_rows
+from backend.plugin.ai.utils.message_cache import ai_message_cache
+from backend.plugin.ai.utils.message_storage import (
+    StoredModelMessage,
+    expand_message_row_metadata,
+    expand_message_rows,
+    get_message_row_model_messages,
+    has_message_blob_ref,
+)
+from backend.plugin.ai.utils.snapshot_cache import ai_snapshot_fragment_cache
 from backend.utils.timezone import timezone
 
 
@@ -24,16 +43,26 @@ class AIConversationService:
     """AI 对话服务"""
 
     @staticmethod
-    async def ensure_idle(*, db: AsyncSession, conversation_id: str) -> None:
+    async def ensure_idle(*, db: AsyncSession, conversation: AIConversation) -> None:
         """
-        确认对话当前没有生成任务
+        确认对话当前没有生成任务，超时未结束的生成任务会被回收
 
         :param db: 数据库会话
-        :param conversation_id: 对话 ID
+        :param conversation: 已锁定的对话
         :return:
         """
-        if await ai_message_dao.has_pending(db, conversation_id):
+        run_id = conversation.active_run_id
+        if run_id is None:
+            return
+        active_since = conversation.active_since
+        timeout = timedelta(seconds=settings.AI_ACTIVE_RUN_TIMEOUT)
+        if active_since is not None and timezone.now() - active_since < timeout:
             raise errors.ConflictError(msg='当前对话正在生成，请稍后再试')
+        log.warning(f'回收超时生成任务 conversation_id={conversation.conversation_id} run_id={run_id}')
+        await ai_message_dao.interrupt_pending(db, conversation.conversation_id)
+        await ai_conversation_dao.clear_active_run(db, conversation.conversation_id, run_id)
+        set_committed_value(conversation, 'active_run_id', None)
+        set_committed_value(conversation, 'active_since', None)
 
     @staticmethod
     async def get_owned_conversation(
@@ -120,13 +149,152 @@ class AIConversationService:
             context_start_index=context_start_index,
         )
 
-    async def get(self, *, db: AsyncSession, conversation_id: str, user_id: int) -> GetAIConversationDetail:
+    async def get_chat_window_state(
+        self,
+        *,
+        db: AsyncSession,
+        conversation_id: str,
+        user_id: int,
+        require_messages: bool = False,
+        max_rows: int | None = None,
+    ) -> ChatContextWindowState:
+        """
+        加载聊天上下文窗口状态，只查询和校验上下文边界之后的消息
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param user_id: 用户 ID
+        :param require_messages: 是否要求上下文消息存在
+        :param max_rows: 至少加载的最近模型消息数量，按消息行加载，截断时额外保留首条用户消息供滑动窗口使用
+        :return:
+        """
+        conversation = await self.get_owned_conversation(db=db, conversation_id=conversation_id, user_id=user_id)
+        limit = max_rows
+        while True:
+            message_rows = list(
+                await ai_message_dao.get_context_window_by_message_index(
+                    db,
+                    conversation_id,
+                    conversation.context_start_message_id,
+                    limit=limit,
+                )
+            )
+            model_messages, row_model_message_ranges = expand_message_rows(message_rows)
+            truncated = limit is not None and len(message_rows) >= limit
+            # 占位消息与失败消息可能不含模型消息，按模型消息数判断已加载的历史是否足够，不足时扩大加载行数
+            if not truncated or max_rows is None or len(model_messages) >= max_rows:
+                break
+            limit = len(message_rows) * 2
+        if truncated:
+            first_user_row = await ai_message_dao.get_context_window_first_user_message(
+                db,
+                conversation_id,
+                conversation.context_start_message_id,
+            )
+            if first_user_row is not None and all(row.id != first_user_row.id for row in message_rows):
+                message_rows.insert(0, first_user_row)
+                model_messages, row_model_message_ranges = expand_message_rows(message_rows)
+        if require_messages and not message_rows:
+            raise errors.RequestError(msg='对话消息不存在')
+        return ChatContextWindowState(
+            conversation=conversation,
+            message_rows=message_rows,
+            model_messages=model_messages,
+            row_model_message_ranges=row_model_message_ranges,
+        )
+
+    @staticmethod
+    def _serialize_snapshot_messages(
+        conversation_id: str,
+        message_rows: Sequence[AIMessage],
+        *,
+        write_cache: bool = True,
+    ) -> list[Any]:
+        """
+        将消息行序列化为协议快照消息列表，复用版本未变化的消息行快照片段，仅校验和序列化新增或变更的消息行
+
+        :param conversation_id: 对话 ID
+        :param message_rows: 按聊天顺序排列的消息行
+        :param write_cache: 是否将未命中的消息行写入消息缓存与快照片段缓存
+        :return:
+        """
+        protocol_adapter = get_chat_protocol_adapter()
+        row_snapshot_messages: list[Sequence[Any] | None] = [
+            ai_snapshot_fragment_cache.get(row) for row in message_rows
+        ]
+        missing_rows = [
+            row
+            for row, snapshot_messages in zip(message_rows, row_snapshot_messages, strict=True)
+            if snapshot_messages is None
+        ]
+        if missing_rows:
+            model_messages: list[StoredModelMessage] = []
+            row_model_message_ranges: list[tuple[int, int]] = []
+            row_sizes: list[int] = []
+            for row in missing_rows:
+                row_messages, size = get_message_row_model_messages(row, write_cache=write_cache)
+                start = len(model_messages)
+                model_messages.extend(row_messages)
+                row_model_message_ranges.append((start, len(model_messages)))
+                row_sizes.append(size)
+            message_ids, provider_ids, model_ids, message_indexes = expand_message_row_metadata(
+                missing_rows,
+                row_model_message_ranges,
+            )
+            serialized: dict[int, Sequence[Any]] = {}
+            for row, (start, end), size in zip(missing_rows, row_model_message_ranges, row_sizes, strict=True):
+                snapshot_messages = protocol_adapter.serialize_snapshot_messages(
+                    model_messages[start:end],
+                    conversation_id=conversation_id,
+                    message_ids=message_ids[start:end],
+                    provider_ids=provider_ids[start:end],
+                    model_ids=model_ids[start:end],
+                    message_indexes=message_indexes[start:end],
+                )
+                if write_cache:
+                    ai_snapshot_fragment_cache.put(row, snapshot_messages, size=size)
+                serialized[row.id] = snapshot_messages
+            row_snapshot_messages = [
+                serialized[row.id] if snapshot_messages is None else snapshot_messages
+                for row, snapshot_messages in zip(message_rows, row_snapshot_messages, strict=True)
+            ]
+        return [
+            snapshot_message
+            for snapshot_messages in row_snapshot_messages
+            if snapshot_messages is not None
+            for snapshot_message in snapshot_messages
+        ]
+
+    def _serialize_message_rows(
+        self,
+        conversation_id: str,
+        message_rows: Sequence[AIMessage],
+    ) -> AIChatMessagesSnapshotDetail:
+        """
+        将消息行序列化为协议消息快照
+
+        :param conversation_id: 对话 ID
+        :param message_rows: 按聊天顺序排列的消息行
+        :return:
+        """
+        snapshot_messages = self._serialize_snapshot_messages(conversation_id, message_rows)
+        return get_chat_protocol_adapter().build_snapshot(snapshot_messages)
+
+    async def get(
+        self,
+        *,
+        db: AsyncSession,
+        conversation_id: str,
+        user_id: int,
+        include_messages: bool = False,
+    ) -> GetAIConversationDetail:
         """
         获取对话详情
 
         :param db: 数据库会话
         :param conversation_id: 对话 ID
         :param user_id: 用户 ID
+        :param include_messages: 是否返回全部消息快照，消息较多时应改用消息分页接口
         :return:
         """
         conversation = await self.get_owned_conversation(
@@ -134,21 +302,10 @@ class AIConversationService:
             conversation_id=conversation_id,
             user_id=user_id,
         )
-        message_rows = await ai_message_dao.get_all_by_message_index(db, conversation.conversation_id)
-        model_messages, row_model_message_ranges = expand_message_rows(message_rows)
-        message_ids, provider_ids, model_ids, message_indexes = expand_message_row_metadata(
-            message_rows,
-            row_model_message_ranges,
-        )
-        protocol_adapter = get_chat_protocol_adapter()
-        messages_snapshot = protocol_adapter.serialize_messages_to_snapshot(
-            model_messages,
-            conversation_id=conversation.conversation_id,
-            message_ids=message_ids,
-            provider_ids=provider_ids,
-            model_ids=model_ids,
-            message_indexes=message_indexes,
-        )
+        messages_snapshot = None
+        if include_messages:
+            message_rows = await ai_message_dao.get_all_by_message_index(db, conversation.conversation_id)
+            messages_snapshot = self._serialize_message_rows(conversation.conversation_id, message_rows)
         return GetAIConversationDetail(
             id=conversation.id,
             conversation_id=conversation.conversation_id,
@@ -163,6 +320,88 @@ class AIConversationService:
             messages_snapshot=messages_snapshot,
         )
 
+    async def get_messages(
+        self,
+        *,
+        db: AsyncSession,
+        conversation_id: str,
+        user_id: int,
+        limit: int,
+        before_message_index: int | None = None,
+        before_message_id: int | None = None,
+    ) -> GetAIConversationMessagesDetail:
+        """
+        按游标分页获取对话消息，默认返回最近的消息
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param user_id: 用户 ID
+        :param limit: 每页消息数量
+        :param before_message_index: 仅返回索引小于该值的消息
+        :param before_message_id: 与 before_message_index 组成游标，同时返回索引相同且 ID 小于该值的消息
+        :return:
+        """
+        conversation = await self.get_owned_conversation(
+            db=db,
+            conversation_id=conversation_id,
+            user_id=user_id,
+        )
+        message_rows = await ai_message_dao.get_page_by_message_index(
+            db,
+            conversation.conversation_id,
+            limit=limit,
+            before_message_index=before_message_index,
+            before_message_id=before_message_id,
+        )
+        has_more = len(message_rows) > limit
+        if has_more:
+            message_rows = message_rows[1:]
+        return GetAIConversationMessagesDetail(
+            messages_snapshot=self._serialize_message_rows(conversation.conversation_id, message_rows),
+            has_more=has_more,
+            next_before_message_index=message_rows[0].message_index if has_more else None,
+            next_before_message_id=message_rows[0].id if has_more else None,
+        )
+
+    async def _iter_export_lines(self, conversation_id: str) -> AsyncIterator[bytes]:
+        """
+        分块读取消息行并逐块输出 NDJSON，数据库会话在生成器内打开，随流结束关闭；
+        只读取已有缓存不写入，避免导出长对话时淘汰其他对话的缓存
+
+        :param conversation_id: 对话 ID
+        :return:
+        """
+        async with async_db_session() as db:
+            async for message_rows in ai_message_dao.stream_by_message_index(
+                db,
+                conversation_id,
+                chunk_size=max(settings.AI_EXPORT_CHUNK_SIZE, 1),
+            ):
+                snapshot_messages = self._serialize_snapshot_messages(
+                    conversation_id,
+                    message_rows,
+                    write_cache=False,
+                )
+                if snapshot_messages:
+                    yield b''.join(to_json(message, by_alias=True) + b'\n' for message in snapshot_messages)
+
+    async def export_messages(self, *, conversation_id: str, user_id: int) -> StreamingResponse:
+        """
+        以 NDJSON 流式导出对话全部消息，每行一条协议快照消息，内存占用与对话长度无关
+
+        :param conversation_id: 对话 ID
+        :param user_id: 用户 ID
+        :return:
+        """
+        async with async_db_session() as db:
+            conversation = await self.get_owned_conversation(db=db, conversation_id=conversation_id, user_id=user_id)
+        filename = f'{conversation.conversation_id}.ndjson'
+        return StreamingResponse(
+            self._iter_export_lines(conversation.conversation_id),
+            media_type='application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        )
+
     @staticmethod
     async def get_list(*, db: AsyncSession, user_id: int) -> dict[str, Any]:
         """
@@ -261,25 +500,41 @@ class AIConversationService:
             user_id=user_id,
             for_update=True,
         )
-        await self.ensure_idle(db=db, conversation_id=conversation_id)
+        await self.ensure_idle(db=db, conversation=conversation)
         message_rows = list(await ai_message_dao.get_all_by_message_index(db, conversation_id))
         context_start_message_id = message_rows[-1].id if message_rows else None
         context_cleared_time = timezone.now() if message_rows else None
-        return await ai_conversation_dao.update(
+        return await ai_conversation_dao.set_context_boundary(
             db,
             conversation.id,
-            UpdateAIConversationParam(
-                conversation_id=conversation.conversation_id,
-                title=conversation.title,
-                provider_id=conversation.provider_id,
-                model_id=conversation.model_id,
-                user_id=conversation.user_id,
-                pinned_time=conversation.pinned_time,
-                context_start_message_id=context_start_message_id,
-                context_cleared_time=context_cleared_time,
-            ),
+            context_start_message_id,
+            context_cleared_time,
         )
 
+    async def get_blob(self, *, db: AsyncSession, conversation_id: str, user_id: int, key: str) -> bytes:
+        """
+        获取对话中的二进制内容
+
+        内容存储按内容 SHA-256 跨用户去重，内容键可被猜测，需校验对话中未删除的消息引用了该内容键
+
+        :param db: 数据库会话
+        :param conversation_id: 对话 ID
+        :param user_id: 用户 ID
+        :param key: 内容键
+        :return:
+        """
+        await self.get_owned_conversation(db=db, conversation_id=conversation_id, user_id=user_id)
+        if not is_valid_blob_key(key):
+            raise errors.NotFoundError(msg='附件不存在')
+        message_rows = await ai_message_dao.get_all_by_message_index(db, conversation_id)
+        model_messages, _ = expand_message_rows(message_rows)
+        if not has_message_blob_ref(model_messages, key):
+            raise errors.NotFoundError(msg='附件不存在')
+        try:
+            return await get_blob_store().get(key)
+        except FileNotFoundError as e:
+            raise errors.NotFoundError(msg='附件不存在') from e
+
     async def delete(self, *, db: AsyncSession, conversation_id: str, user_id: int) -> int:
         """
         删除对话
@@ -295,6 +550,7 @@ class AIConversationService:
             user_id=user_id,
             for_update=True,
         )
+        ai_message_cache.invalidate(conversation_id)
         await ai_message_dao.delete(db, conversation_id)
         return await ai_conversation_dao.delete(db, conversation_id, user_id)
 
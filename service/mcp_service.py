@@ -9,6 +9,7 @@ from backend.plugin.ai.crud.crud_mcp import ai_mcp_dao
 from backend.plugin.ai.enums import McpType
 from backend.plugin.ai.model import AIMcp
 from backend.plugin.ai.schema.mcp import CreateAIMcpParam, UpdateAIMcpParam
+from backend.plugin.ai.utils.metadata_cache import ai_metadata_cache
 from backend.utils.pattern_validate import match_string
 
 
@@ -119,7 +120,9 @@ class AIMcpService:
             raise errors.NotFoundError(msg='MCP 不存在')
         if mcp.name != obj.name and await ai_mcp_dao.get_by_name(db, name=obj.name):
             raise errors.ConflictError(msg='MCP 已存在')
-        return await ai_mcp_dao.update(db, pk, obj)
+        count = await ai_mcp_dao.update(db, pk, obj)
+        ai_metadata_cache.invalidate('mcp', db=db)
+        return count
 
     @staticmethod
     async def delete(*, db: AsyncSession, pk: int) -> int:
@@ -130,7 +133,9 @@ class AIMcpService:
         :param pk: MCP ID
         :return:
         """
-        return await ai_mcp_dao.delete(db, pk)
+        count = await ai_mcp_dao.delete(db, pk)
+        ai_metadata_cache.invalidate('mcp', db=db)
+        return count
 
 
 ai_mcp_service: AIMcpService = AIMcpService()
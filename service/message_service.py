@@ -1,4 +1,3 @@
-from copy import deepcopy
 from dataclasses import replace
 from datetime import datetime
 from typing import Any
@@ -11,7 +10,7 @@ from starlette.responses import StreamingResponse
 
 from backend.common.exception import errors
 from backend.common.log import log
-from backend.database.db import async_db_session
+from backend.database.db import async_db_session, uuid4_str
 from backend.plugin.ai.chat.persistence import (
     extract_assistant_messages,
     extract_assistant_run_messages,
@@ -32,13 +31,15 @@ from backend.plugin.ai.model import AIMessage
 from backend.plugin.ai.protocol.base import ChatAgent, ChatProtocolAdapter
 from backend.plugin.ai.protocol.registry import get_chat_protocol_adapter
 from backend.plugin.ai.schema.chat import AIChatForwardedPropsParam, AIChatRegenerateParam
-from backend.plugin.ai.schema.conversation import UpdateAIConversationParam
 from backend.plugin.ai.schema.message import UpdateAIMessageParam
 from backend.plugin.ai.service.conversation_service import ai_conversation_service
+from backend.plugin.ai.utils.message_cache import ai_message_cache
+from backend.plugin.ai.utils.message_codec import encode_model_messages
 from backend.plugin.ai.utils.message_storage import (
+    dump_model_messages,
     expand_message_rows,
-    get_message_row_model_message_payloads,
     get_row_model_messages,
+    resolve_message_blobs,
 )
 
 
@@ -263,10 +264,7 @@ class AIMessageService:
             for_update=True,
         )
         assert conversation is not None
-        await ai_conversation_service.ensure_idle(
-            db=db,
-            conversation_id=persistence.conversation_id,
-        )
+        await ai_conversation_service.ensure_idle(db=db, conversation=conversation)
         message_rows = list(await ai_message_dao.get_all_by_message_index(db, persistence.conversation_id))
         message_versions = self._build_message_versions(message_rows=message_rows)
         context_changed = (
@@ -278,7 +276,15 @@ class AIMessageService:
         ) or context_changed:
             raise errors.ConflictError(msg='对话消息已发生变化，请重试')
 
-        message_index = await ai_message_dao.get_next_message_index(db, persistence.conversation_id)
+        run_id = uuid4_str()
+        (message_index,) = await ai_conversation_dao.start_turn(
+            db,
+            conversation,
+            provider_id=persistence.forwarded_props.provider_id,
+            model_id=persistence.forwarded_props.model_id,
+            run_id=run_id,
+            count=1,
+        )
         assistant_placeholder = await ai_message_dao.create(
             db,
             {
@@ -291,21 +297,7 @@ class AIMessageService:
                 'model_messages': [],
             },
         )
-        await ai_conversation_dao.update(
-            db,
-            conversation.id,
-            UpdateAIConversationParam(
-                conversation_id=conversation.conversation_id,
-                title=conversation.title,
-                provider_id=persistence.forwarded_props.provider_id,
-                model_id=persistence.forwarded_props.model_id,
-                user_id=conversation.user_id,
-                pinned_time=conversation.pinned_time,
-                context_start_message_id=conversation.context_start_message_id,
-                context_cleared_time=conversation.context_cleared_time,
-            ),
-        )
-        return replace(persistence, assistant_message_id=assistant_placeholder.id)
+        return replace(persistence, assistant_message_id=assistant_placeholder.id, run_id=run_id)
 
     async def regenerate_from_user_message(
         self,
@@ -353,7 +345,9 @@ class AIMessageService:
                 raise errors.RequestError(msg='指定消息已不在当前上下文中')
 
             reply_start_index = target_index + 1
-            message_history = state.model_messages[state.context_start_index : target_end_index]
+            message_history = await resolve_message_blobs(
+                state.model_messages[state.context_start_index : target_end_index],
+            )
             expected_message_versions = self._build_message_versions(message_rows=state.message_rows)
             replace_start_index, replace_end_index, insert_before_index = self._get_reply_segment_indexes(
                 message_rows=state.message_rows,
@@ -490,10 +484,8 @@ class AIMessageService:
                 row_model_message_ranges=row_model_message_ranges,
             )
             user_message_index = target_index - 1
-            target_row = state.message_rows[target_index]
             has_adjacent_user_message = (
                 user_message_index >= 0
-                and state.message_rows[user_message_index].message_index == target_row.message_index - 1
                 and row_ranges[user_message_index][0] >= state.context_start_index
                 and self._is_user_message_row(
                     message_rows=state.message_rows,
@@ -506,7 +498,9 @@ class AIMessageService:
                 raise errors.RequestError(msg='未找到对应的用户消息')
 
             _, user_message_end_index = row_ranges[user_message_index]
-            message_history = state.model_messages[state.context_start_index : user_message_end_index]
+            message_history = await resolve_message_blobs(
+                state.model_messages[state.context_start_index : user_message_end_index],
+            )
             replace_start_index, replace_end_index, _ = self._get_reply_segment_indexes(
                 message_rows=state.message_rows,
                 model_messages=state.model_messages,
@@ -592,13 +586,13 @@ class AIMessageService:
         :param obj: 更新参数
         :return:
         """
-        await ai_conversation_service.get_owned_conversation(
+        conversation = await ai_conversation_service.get_owned_conversation(
             db=db,
             conversation_id=conversation_id,
             user_id=user_id,
             for_update=True,
         )
-        await ai_conversation_service.ensure_idle(db=db, conversation_id=conversation_id)
+        await ai_conversation_service.ensure_idle(db=db, conversation=conversation)
         message_rows = list(await ai_message_dao.get_all_by_message_index(db, conversation_id))
         model_messages, row_model_message_ranges = expand_message_rows(message_rows)
         message_row_index = self._get_message_row_index(message_rows=message_rows, pk=pk)
@@ -619,11 +613,16 @@ class AIMessageService:
         content = ' '.join(obj.content.split())
         if not content:
             raise errors.RequestError(msg='消息内容不能为空')
-        model_messages_payload = deepcopy(get_message_row_model_message_payloads(message_rows[message_row_index]))
-        model_payload = deepcopy(model_messages_payload[0])
-        model_payload['parts'][0]['content'] = content
-        model_messages_payload[0] = model_payload
-        return await ai_message_dao.update(db, pk, {'model_messages': model_messages_payload})
+        edited_message = replace(
+            target_message,
+            parts=[replace(target_message.parts[0], content=content), *target_message.parts[1:]],
+        )
+        ai_message_cache.invalidate(conversation_id)
+        return await ai_message_dao.update(
+            db,
+            pk,
+            {'model_messages': encode_model_messages(dump_model_messages([edited_message]))},
+        )
 
     @staticmethod
     async def clear(
@@ -646,21 +645,9 @@ class AIMessageService:
             user_id=user_id,
             for_update=True,
         )
-        await ai_conversation_service.ensure_idle(db=db, conversation_id=conversation_id)
-        await ai_conversation_dao.update(
-            db,
-            conversation.id,
-            UpdateAIConversationParam(
-                conversation_id=conversation.conversation_id,
-                title=conversation.title,
-                provider_id=conversation.provider_id,
-                model_id=conversation.model_id,
-                user_id=conversation.user_id,
-                pinned_time=conversation.pinned_time,
-                context_start_message_id=None,
-                context_cleared_time=None,
-            ),
-        )
+        await ai_conversation_service.ensure_idle(db=db, conversation=conversation)
+        await ai_conversation_dao.set_context_boundary(db, conversation.id, None, None)
+        ai_message_cache.invalidate(conversation_id)
         return await ai_message_dao.delete(db, conversation_id)
 
     async def delete(
@@ -686,7 +673,7 @@ class AIMessageService:
             user_id=user_id,
             for_update=True,
         )
-        await ai_conversation_service.ensure_idle(db=db, conversation_id=conversation_id)
+        await ai_conversation_service.ensure_idle(db=db, conversation=conversation)
         message_rows = list(await ai_message_dao.get_all_by_message_index(db, conversation_id))
         target_message_index = self._get_message_row_index(message_rows=message_rows, pk=pk)
         model_messages, row_model_message_ranges = expand_message_rows(message_rows)
@@ -712,19 +699,11 @@ class AIMessageService:
         if context_start_message_id == pk:
             previous_rows = [row for row in message_rows if row.message_index < target_row.message_index]
             context_start_message_id = previous_rows[-1].id if previous_rows else None
-            await ai_conversation_dao.update(
+            await ai_conversation_dao.set_context_boundary(
                 db,
                 conversation.id,
-                UpdateAIConversationParam(
-                    conversation_id=conversation.conversation_id,
-                    title=conversation.title,
-                    provider_id=conversation.provider_id,
-                    model_id=conversation.model_id,
-                    user_id=conversation.user_id,
-                    pinned_time=conversation.pinned_time,
-                    context_start_message_id=context_start_message_id,
-                    context_cleared_time=conversation.context_cleared_time if context_start_message_id else None,
-                ),
+                context_start_message_id,
+                conversation.context_cleared_time if context_start_message_id else None,
             )
         return count
 
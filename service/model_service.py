@@ -11,12 +11,14 @@ from backend.plugin.ai.crud.crud_model import ai_model_dao
 from backend.plugin.ai.crud.crud_provider import ai_provider_dao
 from backend.plugin.ai.enums import AIProviderType
 from backend.plugin.ai.model import AIModel
+from backend.plugin.ai.providers.model_cache import provider_model_cache
 from backend.plugin.ai.schema.model import (
     CreateAIModelParam,
     CreateAIModelsParam,
     DeleteAIModelParam,
     UpdateAIModelParam,
 )
+from backend.plugin.ai.utils.metadata_cache import ai_metadata_cache
 
 
 class AIModelService:
@@ -140,7 +142,10 @@ class AIModelService:
         existed_model = await ai_model_dao.get_by_model_and_provider(db, obj.model_id, obj.provider_id)
         if existed_model and existed_model.id != pk:
             raise errors.ConflictError(msg='模型已存在')
-        return await ai_model_dao.update(db, pk, obj)
+        count = await ai_model_dao.update(db, pk, obj)
+        ai_metadata_cache.invalidate('model', db=db)
+        await provider_model_cache.invalidate(provider_id=ai_model.provider_id, model_name=ai_model.model_id)
+        return count
 
     @staticmethod
     async def delete(*, db: AsyncSession, obj: DeleteAIModelParam) -> int:
@@ -157,6 +162,9 @@ class AIModelService:
             [(ai_model.provider_id, ai_model.model_id) for ai_model in ai_models],
         )
         count = await ai_model_dao.delete(db, obj.pks)
+        ai_metadata_cache.invalidate('model', db=db)
+        for ai_model in ai_models:
+            await provider_model_cache.invalidate(provider_id=ai_model.provider_id, model_name=ai_model.model_id)
         return count
 
 
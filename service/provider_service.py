@@ -17,6 +17,7 @@ from backend.plugin.ai.crud.crud_provider import ai_provider_dao
 from backend.plugin.ai.enums import AIProviderType
 from backend.plugin.ai.model import AIProvider
 from backend.plugin.ai.providers.base import normalize_provider_api_host
+from backend.plugin.ai.providers.model_cache import provider_model_cache
 from backend.plugin.ai.schema.model import CreateAIModelParam
 from backend.plugin.ai.schema.provider import (
     CreateAIProviderParam,
@@ -25,6 +26,7 @@ from backend.plugin.ai.schema.provider import (
     UpdateAIProviderParam,
 )
 from backend.plugin.ai.utils.api_key_ops import mask_api_key
+from backend.plugin.ai.utils.metadata_cache import ai_metadata_cache
 from backend.utils.timezone import timezone
 
 
@@ -114,7 +116,10 @@ class AIProviderService:
                 )
             }
         )
-        return await ai_provider_dao.update(db, pk, update_obj)
+        count = await ai_provider_dao.update(db, pk, update_obj)
+        ai_metadata_cache.invalidate('provider', db=db)
+        await provider_model_cache.invalidate(provider_id=pk)
+        return count
 
     @staticmethod
     async def delete(*, db: AsyncSession, obj: DeleteAIProviderParam) -> int:
@@ -128,6 +133,9 @@ class AIProviderService:
         await ai_default_model_dao.delete_by_providers(db, obj.pks)
         await ai_model_dao.delete_by_providers(db, obj.pks)
         count = await ai_provider_dao.delete(db, obj.pks)
+        ai_metadata_cache.invalidate('provider', 'model', db=db)
+        for pk in obj.pks:
+            await provider_model_cache.invalidate(provider_id=pk)
         return count
 
     async def get_models(self, *, db: AsyncSession, pk: int) -> list[GetAIProviderModelDetail]:
@@ -178,6 +186,8 @@ class AIProviderService:
         existing_models_by_id = {model.model_id: model for model in existing_models}
         provider_models = await self.get_models(db=db, pk=pk)
         await ai_model_dao.delete_by_provider(db, pk)
+        ai_metadata_cache.invalidate('model', db=db)
+        await provider_model_cache.invalidate(provider_id=pk)
         if not provider_models:
             return
 
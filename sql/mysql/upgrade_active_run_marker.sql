@@ -0,0 +1,14 @@
+alter table ai_conversation
+    add column active_run_id varchar(64) null comment '当前生成任务 ID',
+    add column active_since datetime null comment '当前生成任务开始时间';
+
+update ai_conversation c
+set c.active_run_id = 'legacy',
+    c.active_since  = now()
+where exists (
+    select 1
+    from ai_message m
+    where m.conversation_id = c.conversation_id
+      and m.status = 'pending'
+      and m.deleted = 0
+);
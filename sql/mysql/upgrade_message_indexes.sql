@@ -0,0 +1,7 @@
+create index ix_ai_message_conversation_order on ai_message (conversation_id, deleted, message_index, id);
+
+create index ix_ai_message_conversation_pending on ai_message (conversation_id, status);
+
+drop index ix_ai_message_conversation_id on ai_message;
+
+drop index ix_ai_message_message_index on ai_message;
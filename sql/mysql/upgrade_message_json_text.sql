@@ -0,0 +1,2 @@
+alter table ai_message
+    modify model_messages longtext not null comment '原始 Pydantic 模型消息列表 JSON';
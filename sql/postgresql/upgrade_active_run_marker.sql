@@ -0,0 +1,17 @@
+alter table ai_conversation
+    add column active_run_id varchar(64) null,
+    add column active_since  timestamp with time zone null;
+
+comment on column ai_conversation.active_run_id is '当前生成任务 ID';
+comment on column ai_conversation.active_since is '当前生成任务开始时间';
+
+update ai_conversation c
+set active_run_id = 'legacy',
+    active_since  = now()
+where exists (
+    select 1
+    from ai_message m
+    where m.conversation_id = c.conversation_id
+      and m.status = 'pending'
+      and m.deleted = 0
+);
@@ -0,0 +1,12 @@
+alter table ai_conversation
+    add column next_message_index integer not null default 0;
+
+comment on column ai_conversation.next_message_index is '下一条消息索引';
+
+update ai_conversation c
+set next_message_index = (
+    select coalesce(max(m.message_index), -1) + 1
+    from ai_message m
+    where m.conversation_id = c.conversation_id
+      and m.deleted = 0
+);
@@ -0,0 +1,5 @@
+update ai_message
+set message_index = message_index * 1024;
+
+update ai_conversation
+set next_message_index = next_message_index * 1024;
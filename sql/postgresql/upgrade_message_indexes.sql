@@ -0,0 +1,8 @@
+create index if not exists ix_ai_message_conversation_order on ai_message (conversation_id, deleted, message_index, id);
+
+create index if not exists ix_ai_message_conversation_pending on ai_message (conversation_id, status)
+    where status = 'pending';
+
+drop index if exists ix_ai_message_conversation_id;
+
+drop index if exists ix_ai_message_message_index;
@@ -0,0 +1,4 @@
+alter table ai_message
+    alter column model_messages type text using model_messages::text;
+
+comment on column ai_message.model_messages is '原始 Pydantic 模型消息列表 JSON';
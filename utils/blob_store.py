@@ -0,0 +1,155 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from urllib.parse import urlencode
+
+import anyio
+
+from pydantic_ai import BinaryContent
+
+from backend.core.conf import settings
+from backend.core.path_conf import BASE_PATH
+
+# 外置二进制内容在 vendor_metadata 中记录的内容键
+BLOB_REF_METADATA_KEY = 'ai_blob_ref'
+
+_BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def compute_blob_key(data: bytes) -> str:
+    """
+    计算二进制内容键
+
+    :param data: 二进制内容
+    :return:
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_valid_blob_key(key: str) -> bool:
+    """
+    校验二进制内容键格式
+
+    :param key: 内容键
+    :return:
+    """
+    return _BLOB_KEY_PATTERN.fullmatch(key) is not None
+
+
+def get_blob_ref(content: BinaryContent) -> str | None:
+    """
+    获取已外置二进制内容的内容键
+
+    :param content: 二进制内容
+    :return:
+    """
+    if content.data or not content.vendor_metadata:
+        return None
+    key = content.vendor_metadata.get(BLOB_REF_METADATA_KEY)
+    return key if isinstance(key, str) and is_valid_blob_key(key) else None
+
+
+def build_blob_url(*, conversation_id: str, key: str, media_type: str) -> str:
+    """
+    构建二进制内容下载地址
+
+    :param conversation_id: 对话 ID
+    :param key: 内容键
+    :param media_type: 媒体类型
+    :return:
+    """
+    query = urlencode({'media_type': media_type})
+    return f'{settings.FASTAPI_API_V1_PATH}/conversations/{conversation_id}/blobs/{key}?{query}'
+
+
+class BlobStore(ABC):
+    """二进制内容存储
+
+    以内容 SHA-256 作为键，相同内容只保存一份；实现需保证写入原子性，读取不存在的键时抛出 FileNotFoundError
+    """
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str:
+        """
+        保存二进制内容
+
+        :param data: 二进制内容
+        :return:
+        """
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """
+        读取二进制内容
+
+        :param key: 内容键
+        :return:
+        """
+
+
+class FileSystemBlobStore(BlobStore):
+    """本地文件系统二进制内容存储
+
+    按内容键前两级分片目录保存，写入先落临时文件再原子重命名，已存在的内容直接复用
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        if not is_valid_blob_key(key):
+            raise FileNotFoundError(key)
+        return self.root / key[:2] / key[2:4] / key
+
+    def _write(self, data: bytes) -> str:
+        key = compute_blob_key(data)
+        path = self._path(key)
+        if path.exists():
+            return key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        return key
+
+    async def put(self, data: bytes) -> str:
+        return await anyio.to_thread.run_sync(self._write, data)
+
+    async def get(self, key: str) -> bytes:
+        return await anyio.to_thread.run_sync(self._path(key).read_bytes)
+
+
+_blob_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    """
+    获取当前二进制内容存储，未设置时使用本地文件系统存储
+
+    :return:
+    """
+    global _blob_store
+    if _blob_store is None:
+        root = Path(settings.AI_BLOB_STORE_DIR)
+        _blob_store = FileSystemBlobStore(root if root.is_absolute() else BASE_PATH / root)
+    return _blob_store
+
+
+def set_blob_store(store: BlobStore) -> None:
+    """
+    设置二进制内容存储，用于替换为对象存储等实现
+
+    :param store: 二进制内容存储
+    :return:
+    """
+    global _blob_store
+    _blob_store = store
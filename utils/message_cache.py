@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TypeAlias
+
+from pydantic_ai import ModelMessage
+
+from backend.core.conf import settings
+from backend.plugin.ai.model import AIMessage
+
+MessageRowVersion: TypeAlias = tuple[datetime | None, str, int]
+
+
+@dataclass(frozen=True, slots=True)
+class _CachedRow:
+    """缓存的消息行校验结果"""
+
+    version: MessageRowVersion
+    messages: tuple[ModelMessage, ...]
+    size: int
+
+
+def get_message_row_version(row: AIMessage) -> MessageRowVersion:
+    """
+    获取消息行版本
+
+    :param row: 消息行
+    :return:
+    """
+    return row.updated_time, row.status, len(row.model_messages or '')
+
+
+class AIMessageCache:
+    """AI 消息校验结果缓存
+
+    按对话缓存每个消息行校验后的模型消息，以（更新时间，状态，存储文本长度）作为行版本，读取时版本不一致即视为未命中；
+    按模型消息 JSON 大小估算内存预算，超出时按对话最近使用顺序整体淘汰。缓存的模型消息为共享对象，调用方不得原地修改
+    """
+
+    def __init__(self) -> None:
+        self._conversations: OrderedDict[str, dict[int, _CachedRow]] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._total_size = 0
+
+    def get(self, row: AIMessage) -> tuple[ModelMessage, ...] | None:
+        """
+        获取消息行的缓存模型消息
+
+        :param row: 消息行
+        :return:
+        """
+        cached = self.get_with_size(row)
+        return None if cached is None else cached[0]
+
+    def get_with_size(self, row: AIMessage) -> tuple[tuple[ModelMessage, ...], int] | None:
+        """
+        获取消息行的缓存模型消息及其 JSON 大小
+
+        :param row: 消息行
+        :return:
+        """
+        rows = self._conversations.get(row.conversation_id)
+        if rows is None:
+            return None
+        cached = rows.get(row.id)
+        if cached is None or cached.version != get_message_row_version(row):
+            return None
+        self._conversations.move_to_end(row.conversation_id)
+        return cached.messages, cached.size
+
+    def put(
+        self,
+        *,
+        conversation_id: str,
+        row_id: int,
+        version: MessageRowVersion,
+        size: int,
+        messages: Sequence[ModelMessage],
+    ) -> None:
+        """
+        写入消息行的模型消息
+
+        :param conversation_id: 对话 ID
+        :param row_id: 消息行 ID
+        :param version: 消息行版本
+        :param size: 模型消息 JSON 大小（字节，未压缩）
+        :param messages: 校验后的模型消息
+        :return:
+        """
+        max_bytes = settings.AI_MESSAGE_CACHE_MAX_BYTES
+        if max_bytes <= 0 or size > max_bytes:
+            return
+        rows = self._conversations.setdefault(conversation_id, {})
+        previous = rows.get(row_id)
+        if previous is not None:
+            self._resize(conversation_id, -previous.size)
+        rows[row_id] = _CachedRow(version=version, messages=tuple(messages), size=size)
+        self._resize(conversation_id, size)
+        self._conversations.move_to_end(conversation_id)
+        self._evict(max_bytes)
+
+    def invalidate(self, conversation_id: str) -> None:
+        """
+        失效对话的全部缓存
+
+        :param conversation_id: 对话 ID
+        :return:
+        """
+        self._conversations.pop(conversation_id, None)
+        self._total_size -= self._sizes.pop(conversation_id, 0)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._conversations.clear()
+        self._sizes.clear()
+        self._total_size = 0
+
+    def _resize(self, conversation_id: str, delta: int) -> None:
+        self._sizes[conversation_id] = self._sizes.get(conversation_id, 0) + delta
+        self._total_size += delta
+
+    def _evict(self, max_bytes: int) -> None:
+        """
+        按最近使用顺序淘汰对话，直到总大小不超过预算
+
+        :param max_bytes: 内存预算（字节）
+        :return:
+        """
+        while self._total_size > max_bytes and self._conversations:
+            conversation_id = next(iter(self._conversations))
+            self.invalidate(conversation_id)
+
+
+ai_message_cache: AIMessageCache = AIMessageCache()
@@ -0,0 +1,124 @@
+import base64
+import json
+import zlib
+
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from backend.core.conf import settings
+from backend.core.path_conf import BASE_PATH
+
+# 压缩载荷的编码标记字段
+CODEC_MARKER_KEY = 'codec'
+
+_SUPPORTED_CODECS = ('zlib', 'zstd')
+
+
+def import_zstandard() -> Any:
+    """导入可选依赖 zstandard"""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError('使用 zstd 消息载荷编码需安装 zstandard') from e
+    return zstandard
+
+
+@cache
+def _load_zstd_dict(path: str) -> Any:
+    """
+    加载 zstd 共享字典
+
+    :param path: 字典文件路径
+    :return:
+    """
+    zstandard = import_zstandard()
+    dict_path = Path(path)
+    if not dict_path.is_absolute():
+        dict_path = BASE_PATH / dict_path
+    return zstandard.ZstdCompressionDict(dict_path.read_bytes())
+
+
+def _get_zstd_dict() -> Any | None:
+    path = settings.AI_MESSAGE_CODEC_ZSTD_DICT_PATH
+    return _load_zstd_dict(path) if path else None
+
+
+def _compress(codec: str, raw: bytes) -> tuple[bytes, int | None]:
+    """
+    压缩原始载荷
+
+    :param codec: 编码名称
+    :param raw: 原始 JSON 字节
+    :return:
+    """
+    if codec == 'zlib':
+        return zlib.compress(raw, 6), None
+    zstandard = import_zstandard()
+    zstd_dict = _get_zstd_dict()
+    compressor = zstandard.ZstdCompressor(level=9, dict_data=zstd_dict)
+    return compressor.compress(raw), zstd_dict.dict_id() if zstd_dict is not None else None
+
+
+def _decompress(codec: str, data: bytes, dict_id: int | None) -> bytes:
+    """
+    解压载荷
+
+    :param codec: 编码名称
+    :param data: 压缩数据
+    :param dict_id: zstd 字典 ID
+    :return:
+    """
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec != 'zstd':
+        raise ValueError(f'不支持的消息载荷编码: {codec}')
+    zstandard = import_zstandard()
+    zstd_dict = None
+    if dict_id is not None:
+        zstd_dict = _get_zstd_dict()
+        if zstd_dict is None or zstd_dict.dict_id() != dict_id:
+            raise ValueError(f'消息载荷所需的 zstd 字典不可用: dict_id={dict_id}')
+    return zstandard.ZstdDecompressor(dict_data=zstd_dict).decompress(data)
+
+
+def is_encoded_model_messages(value: str) -> bool:
+    """
+    判断存储值是否为压缩后的模型消息载荷
+
+    :param value: 存储的 JSON 文本
+    :return:
+    """
+    return value.lstrip()[:1] == '{'
+
+
+def encode_model_messages(raw: bytes, *, codec: str | None = None) -> str:
+    """
+    按配置压缩模型消息 JSON，未达到阈值或压缩无收益时原样返回
+
+    :param raw: 模型消息 JSON 字节
+    :param codec: 编码名称，为空时使用 AI_MESSAGE_CODEC
+    :return:
+    """
+    codec = codec or settings.AI_MESSAGE_CODEC
+    if codec not in _SUPPORTED_CODECS or len(raw) < settings.AI_MESSAGE_CODEC_MIN_BYTES:
+        return raw.decode()
+    compressed, dict_id = _compress(codec, raw)
+    encoded = base64.b64encode(compressed).decode()
+    # base64 及标记字段带来约三分之一的膨胀，收益不足时保留原文便于排查
+    if len(encoded) >= len(raw) * 0.8:
+        return raw.decode()
+    return json.dumps({CODEC_MARKER_KEY: codec, 'dict_id': dict_id, 'data': encoded}, separators=(',', ':'))
+
+
+def decode_model_messages(value: str) -> str | bytes:
+    """
+    读取存储的模型消息 JSON，兼容未压缩的原文
+
+    :param value: 存储的 JSON 文本
+    :return:
+    """
+    if not is_encoded_model_messages(value):
+        return value
+    marker = json.loads(value)
+    return _decompress(marker[CODEC_MARKER_KEY], base64.b64decode(marker['data']), marker.get('dict_id'))
@@ -1,43 +1,190 @@
-from collections.abc import Sequence
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import replace
 from typing import Any, Literal, TypeAlias
 
-from pydantic_ai import ModelMessagesTypeAdapter, ModelRequest, ModelResponse
+from pydantic_ai import BinaryContent, FilePart, ModelMessagesTypeAdapter, ModelRequest, ModelResponse, UserPromptPart
 
+from backend.common.exception import errors
+from backend.common.log import log
+from backend.core.conf import settings
 from backend.plugin.ai.model import AIMessage
+from backend.plugin.ai.utils.blob_store import BLOB_REF_METADATA_KEY, get_blob_ref, get_blob_store
+from backend.plugin.ai.utils.message_cache import ai_message_cache, get_message_row_version
+from backend.plugin.ai.utils.message_codec import decode_model_messages, encode_model_messages
 
 ChatMessageRole: TypeAlias = Literal['assistant', 'user']
 StoredModelMessage: TypeAlias = ModelRequest | ModelResponse
 
 
+def dump_model_messages(messages: Sequence[StoredModelMessage]) -> bytes:
+    """
+    序列化模型消息为 JSON 字节
+
+    :param messages: 模型消息
+    :return:
+    """
+    return ModelMessagesTypeAdapter.dump_json(list(messages), by_alias=True)
+
+
 def build_chat_message_record(
     *,
     role: ChatMessageRole,
-    model_messages: Sequence[dict[str, Any]],
+    model_messages: bytes,
 ) -> dict[str, Any]:
     """
-    构建聊天消息记录字段
+    构建聊天消息记录字段，模型消息 JSON 按 AI_MESSAGE_CODEC 压缩存储
 
     :param role: 聊天消息角色
-    :param model_messages: 原始 Pydantic 模型消息
+    :param model_messages: 模型消息 JSON 字节
     :return:
     """
     return {
         'role': role,
-        'model_messages': list(model_messages),
+        'model_messages': encode_model_messages(model_messages),
     }
 
 
-def get_message_row_model_message_payloads(row: AIMessage) -> list[dict[str, Any]]:
+async def _map_message_binaries(
+    messages: Sequence[StoredModelMessage],
+    mapper: Callable[[BinaryContent], Awaitable[BinaryContent]],
+) -> list[StoredModelMessage]:
     """
-    获取消息行中的原始模型消息列表
+    替换用户输入及模型生成文件中的二进制内容，未变化的消息原样返回
 
-    :param row: 消息行
+    :param messages: 模型消息
+    :param mapper: 二进制内容替换函数
+    :return:
+    """
+    mapped_messages: list[StoredModelMessage] = []
+    for message in messages:
+        parts = []
+        for part in message.parts:
+            if isinstance(part, UserPromptPart) and not isinstance(part.content, str):
+                content = [await mapper(item) if isinstance(item, BinaryContent) else item for item in part.content]
+                if any(new is not old for new, old in zip(content, part.content, strict=True)):
+                    part = replace(part, content=content)
+            elif isinstance(part, FilePart):
+                content = await mapper(part.content)
+                if content is not part.content:
+                    part = replace(part, content=content)
+            parts.append(part)
+        if any(new is not old for new, old in zip(parts, message.parts, strict=True)):
+            message = replace(message, parts=parts)
+        mapped_messages.append(message)
+    return mapped_messages
+
+
+async def externalize_message_blobs(messages: Sequence[StoredModelMessage]) -> list[StoredModelMessage]:
+    """
+    将消息中的二进制内容写入内容存储，并替换为仅保留内容键的引用
+
+    :param messages: 模型消息
+    :return:
+    """
+    min_bytes = max(settings.AI_BLOB_STORE_MIN_BYTES, 1)
+
+    async def externalize(content: BinaryContent) -> BinaryContent:
+        if len(content.data) < min_bytes:
+            return content
+        key = await get_blob_store().put(content.data)
+        return type(content)(
+            data=b'',
+            media_type=content.media_type,
+            identifier=content.identifier,
+            vendor_metadata={**(content.vendor_metadata or {}), BLOB_REF_METADATA_KEY: key},
+        )
+
+    return await _map_message_binaries(messages, externalize)
+
+
+async def resolve_message_blobs(messages: Sequence[StoredModelMessage]) -> list[StoredModelMessage]:
+    """
+    读取消息中已外置的二进制内容，用于发送给模型；返回副本，不修改缓存中的共享消息
+
+    :param messages: 模型消息
     :return:
     """
-    model_messages = getattr(row, 'model_messages', None)
-    if isinstance(model_messages, list):
-        return model_messages
-    return []
+    loaded: dict[str, bytes] = {}
+
+    async def resolve(content: BinaryContent) -> BinaryContent:
+        key = get_blob_ref(content)
+        if key is None:
+            return content
+        if key not in loaded:
+            try:
+                loaded[key] = await get_blob_store().get(key)
+            except FileNotFoundError as e:
+                log.error(f'消息附件内容缺失 key={key}')
+                raise errors.ServerError(msg='消息附件已丢失') from e
+        vendor_metadata = {k: v for k, v in (content.vendor_metadata or {}).items() if k != BLOB_REF_METADATA_KEY}
+        return type(content)(
+            data=loaded[key],
+            media_type=content.media_type,
+            identifier=content.identifier,
+            vendor_metadata=vendor_metadata or None,
+        )
+
+    return await _map_message_binaries(messages, resolve)
+
+
+def has_message_blob_ref(messages: Sequence[StoredModelMessage], key: str) -> bool:
+    """
+    判断消息中是否引用了指定内容键的已外置二进制内容
+
+    :param messages: 模型消息
+    :param key: 内容键
+    :return:
+    """
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, UserPromptPart) and not isinstance(part.content, str):
+                contents = [item for item in part.content if isinstance(item, BinaryContent)]
+            elif isinstance(part, FilePart):
+                contents = [part.content]
+            else:
+                continue
+            if any(get_blob_ref(content) == key for content in contents):
+                return True
+    return False
+
+
+def load_message_row_model_messages(row: AIMessage) -> tuple[list[StoredModelMessage], int]:
+    """
+    从 JSON 文本直接校验消息行中的模型消息，压缩存储的载荷透明解压
+
+    :param row: 消息行
+    :return: 模型消息及其 JSON 大小
+    """
+    raw = decode_model_messages(row.model_messages or '[]')
+    return list(ModelMessagesTypeAdapter.validate_json(raw)), len(raw)
+
+
+def get_message_row_model_messages(
+    row: AIMessage,
+    *,
+    write_cache: bool = True,
+) -> tuple[Sequence[StoredModelMessage], int]:
+    """
+    获取消息行的模型消息，优先复用消息缓存中版本一致的校验结果，未命中时从 JSON 文本校验后写回缓存
+
+    :param row: 消息行
+    :param write_cache: 未命中时是否写回缓存，一次性读取大量消息时关闭，避免淘汰其他对话的缓存
+    :return: 模型消息及其 JSON 大小
+    """
+    cached = ai_message_cache.get_with_size(row)
+    if cached is not None:
+        return cached
+    row_messages, size = load_message_row_model_messages(row)
+    if not write_cache:
+        return row_messages, size
+    ai_message_cache.put(
+        conversation_id=row.conversation_id,
+        row_id=row.id,
+        version=get_message_row_version(row),
+        size=size,
+        messages=row_messages,
+    )
+    return row_messages, size
 
 
 def expand_message_rows(
@@ -46,19 +193,18 @@ def expand_message_rows(
     """
     展开消息行中的原始模型消息
 
+    优先复用消息缓存中版本一致的校验结果，未命中的行直接从 JSON 文本校验后写回缓存
+
     :param message_rows: 消息行
     :return:
     """
-    raw_messages: list[dict[str, Any]] = []
+    model_messages: list[StoredModelMessage] = []
     row_message_ranges: list[tuple[int, int]] = []
     for row in message_rows:
-        start = len(raw_messages)
-        row_messages = get_message_row_model_message_payloads(row)
-        raw_messages.extend(row_messages)
-        row_message_ranges.append((start, len(raw_messages)))
-    if not raw_messages:
-        return [], row_message_ranges
-    return list(ModelMessagesTypeAdapter.validate_python(raw_messages)), row_message_ranges
+        start = len(model_messages)
+        model_messages.extend(get_message_row_model_messages(row)[0])
+        row_message_ranges.append((start, len(model_messages)))
+    return model_messages, row_message_ranges
 
 
 def expand_message_row_metadata(
@@ -0,0 +1,190 @@
+import time
+
+from collections.abc import Hashable, Sequence
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.core.conf import settings
+from backend.plugin.ai.crud.crud_mcp import ai_mcp_dao
+from backend.plugin.ai.crud.crud_model import ai_model_dao
+from backend.plugin.ai.crud.crud_provider import ai_provider_dao
+from backend.plugin.ai.dataclasses import AIMcpSnapshot, AIModelSnapshot, AIProviderSnapshot
+from backend.plugin.ai.model import AIMcp, AIModel, AIProvider
+from backend.plugin.ai.utils.dynamic_config import load_ai_config
+
+MetadataKind = Literal['provider', 'model', 'mcp', 'config']
+
+
+@dataclass(frozen=True, slots=True)
+class _CacheEntry:
+    """元数据缓存条目"""
+
+    value: Any
+    expires_at: float
+
+
+def _snapshot_provider(row: AIProvider) -> AIProviderSnapshot:
+    return AIProviderSnapshot(
+        id=row.id,
+        name=row.name,
+        type=row.type,
+        api_key=row.api_key,
+        api_host=row.api_host,
+        status=row.status,
+    )
+
+
+def _snapshot_model(row: AIModel) -> AIModelSnapshot:
+    return AIModelSnapshot(
+        id=row.id,
+        provider_id=row.provider_id,
+        model_id=row.model_id,
+        status=row.status,
+        context_max_part_chars=row.context_max_part_chars,
+        context_max_messages=row.context_max_messages,
+        context_keep_messages=row.context_keep_messages,
+        context_max_tokens=row.context_max_tokens,
+    )
+
+
+def _snapshot_mcp(row: AIMcp) -> AIMcpSnapshot:
+    return AIMcpSnapshot(
+        id=row.id,
+        name=row.name,
+        command=row.command,
+        type=row.type,
+        url=row.url,
+        headers=row.headers,
+        args=row.args,
+        env=row.env,
+        timeout=row.timeout,
+        read_timeout=row.read_timeout,
+        tool_prefix=row.tool_prefix,
+        include_instructions=row.include_instructions,
+    )
+
+
+class AIMetadataCache:
+    """AI 元数据读穿缓存
+
+    缓存供应商、模型、MCP 只读快照及 AI 动态配置的加载状态；写操作按类别递增版本并清空条目，
+    读取前记录版本，版本未变化时才回填，避免并发写入后回填旧数据；TTL 兜底多进程部署下的跨进程更新
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[MetadataKind, Hashable], _CacheEntry] = {}
+        self._versions: dict[MetadataKind, int] = {'provider': 0, 'model': 0, 'mcp': 0, 'config': 0}
+
+    def _get(self, kind: MetadataKind, key: Hashable) -> _CacheEntry | None:
+        entry = self._entries.get((kind, key))
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._entries.pop((kind, key), None)
+            return None
+        return entry
+
+    def _set(self, kind: MetadataKind, key: Hashable, value: Any, version: int) -> None:
+        if self._versions[kind] != version:
+            return
+        self._entries[kind, key] = _CacheEntry(
+            value=value,
+            expires_at=time.monotonic() + settings.AI_METADATA_CACHE_TTL,
+        )
+
+    async def get_provider(self, db: AsyncSession, pk: int) -> AIProviderSnapshot | None:
+        """
+        获取供应商快照
+
+        :param db: 数据库会话
+        :param pk: 供应商 ID
+        :return:
+        """
+        entry = self._get('provider', pk)
+        if entry is not None:
+            return entry.value
+        version = self._versions['provider']
+        row = await ai_provider_dao.get(db, pk)
+        if row is None:
+            return None
+        snapshot = _snapshot_provider(row)
+        self._set('provider', pk, snapshot, version)
+        return snapshot
+
+    async def get_model(self, db: AsyncSession, provider_id: int, model_id: str) -> AIModelSnapshot | None:
+        """
+        获取模型快照
+
+        :param db: 数据库会话
+        :param provider_id: 供应商 ID
+        :param model_id: 模型 ID
+        :return:
+        """
+        key = (provider_id, model_id)
+        entry = self._get('model', key)
+        if entry is not None:
+            return entry.value
+        version = self._versions['model']
+        row = await ai_model_dao.get_by_model_and_provider(db, model_id, provider_id)
+        if row is None:
+            return None
+        snapshot = _snapshot_model(row)
+        self._set('model', key, snapshot, version)
+        return snapshot
+
+    async def get_mcps(self, db: AsyncSession, mcp_ids: Sequence[int]) -> list[AIMcpSnapshot]:
+        """
+        获取 MCP 快照列表，仅查询未命中的 ID
+
+        :param db: 数据库会话
+        :param mcp_ids: MCP ID 列表
+        :return:
+        """
+        snapshots: dict[int, AIMcpSnapshot] = {}
+        missing_ids: list[int] = []
+        for mcp_id in dict.fromkeys(mcp_ids):
+            entry = self._get('mcp', mcp_id)
+            if entry is None:
+                missing_ids.append(mcp_id)
+            else:
+                snapshots[mcp_id] = entry.value
+        if missing_ids:
+            version = self._versions['mcp']
+            for row in await ai_mcp_dao.get_by_ids(db, missing_ids):
+                snapshot = _snapshot_mcp(row)
+                snapshots[row.id] = snapshot
+                self._set('mcp', row.id, snapshot, version)
+        return [snapshots[mcp_id] for mcp_id in sorted(snapshots)]
+
+    async def load_ai_config(self, db: AsyncSession) -> None:
+        """
+        加载 AI 动态配置，TTL 内不重复查询
+
+        :param db: 数据库会话
+        :return:
+        """
+        if self._get('config', None) is not None:
+            return
+        version = self._versions['config']
+        await load_ai_config(db)
+        self._set('config', None, True, version)
+
+    def invalidate(self, *kinds: MetadataKind, db: AsyncSession | None = None) -> None:
+        """
+        失效指定类别的缓存；传入数据库会话时，事务提交后会再次失效，覆盖提交前回填的旧数据
+
+        :param kinds: 元数据类别
+        :param db: 数据库会话
+        :return:
+        """
+        for kind in kinds:
+            self._versions[kind] += 1
+        self._entries = {key: entry for key, entry in self._entries.items() if key[0] not in kinds}
+        if db is not None:
+            event.listen(db.sync_session, 'after_commit', lambda _session: self.invalidate(*kinds), once=True)
+
+
+ai_metadata_cache: AIMetadataCache = AIMetadataCache()
@@ -0,0 +1,269 @@
+import bisect
+import math
+
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import TypeVar
+
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], **extra: str) -> str:
+    pairs = [*zip(labelnames, labelvalues, strict=True), *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """指标基类"""
+
+    type_name: str = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _label_values(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'指标 {self.name} 的标签应为 {self.labelnames}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _render_samples(self) -> list[str]:
+        """
+        渲染指标样本行
+
+        :return:
+        """
+
+    def render(self) -> list[str]:
+        """
+        渲染 Prometheus 文本格式
+
+        :return:
+        """
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}',
+            *self._render_samples(),
+        ]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        增加计数
+
+        :param amount: 增量
+        :param labels: 标签
+        :return:
+        """
+        if amount < 0:
+            raise ValueError('计数器只能递增')
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        设置当前值
+
+        :param value: 当前值
+        :param labels: 标签
+        :return:
+        """
+        self._values[self._label_values(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        增加当前值
+
+        :param amount: 增量
+        :param labels: 标签
+        :return:
+        """
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """
+        减少当前值
+
+        :param amount: 减量
+        :param labels: 标签
+        :return:
+        """
+        self.inc(-amount, **labels)
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        记录一次观测值
+
+        :param value: 观测值
+        :param labels: 标签
+        :return:
+        """
+        key = self._label_values(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for upper_bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, le=_format_value(upper_bound))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(self._sums[key])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+_MetricT = TypeVar('_MetricT', bound=_Metric)
+
+
+class MetricsRegistry:
+    """进程内指标注册表"""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _MetricT) -> _MetricT:
+        existing = self._metrics.get(metric.name)
+        if existing is None:
+            self._metrics[metric.name] = metric
+            return metric
+        if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+            raise ValueError(f'指标 {metric.name} 已以其他类型或标签注册')
+        return existing  # type: ignore[return-value]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        获取或注册计数器
+
+        :param name: 指标名称
+        :param documentation: 指标说明
+        :param labelnames: 标签名称
+        :return:
+        """
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        获取或注册瞬时值
+
+        :param name: 指标名称
+        :param documentation: 指标说明
+        :param labelnames: 标签名称
+        :return:
+        """
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        """
+        获取或注册直方图
+
+        :param name: 指标名称
+        :param documentation: 指标说明
+        :param labelnames: 标签名称
+        :param buckets: 分桶上界
+        :return:
+        """
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        渲染全部指标为 Prometheus 文本格式
+
+        :return:
+        """
+        lines = [line for metric in self._metrics.values() for line in metric.render()]
+        return '\n'.join(lines) + '\n'
+
+
+ai_metrics_registry: MetricsRegistry = MetricsRegistry()
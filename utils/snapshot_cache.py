@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, TypeAlias
+
+from backend.core.conf import settings
+from backend.plugin.ai.model import AIMessage
+
+SnapshotRowVersion: TypeAlias = tuple[datetime | None, str, int, int, int, str]
+
+
+@dataclass(frozen=True, slots=True)
+class _CachedFragment:
+    """缓存的消息行快照片段"""
+
+    version: SnapshotRowVersion
+    snapshot_messages: tuple[Any, ...]
+    size: int
+
+
+def get_snapshot_row_version(row: AIMessage) -> SnapshotRowVersion:
+    """
+    获取消息行快照版本
+
+    :param row: 消息行
+    :return:
+    """
+    return (
+        row.updated_time,
+        row.status,
+        len(row.model_messages or ''),
+        row.message_index,
+        row.provider_id,
+        row.model_id,
+    )
+
+
+class AISnapshotFragmentCache:
+    """AI 消息快照片段缓存
+
+    按消息行 ID 缓存序列化后的协议快照消息，以（更新时间，状态，存储文本长度，消息索引，供应商，模型）作为行版本，
+    编辑、重生成或重新编排索引后版本不一致即视为未命中；按模型消息 JSON 大小估算内存预算，超出时按最近使用顺序淘汰。
+    缓存的快照消息为共享对象，调用方不得原地修改
+    """
+
+    def __init__(self) -> None:
+        self._rows: OrderedDict[int, _CachedFragment] = OrderedDict()
+        self._total_size = 0
+
+    def get(self, row: AIMessage) -> tuple[Any, ...] | None:
+        """
+        获取消息行的缓存快照消息
+
+        :param row: 消息行
+        :return:
+        """
+        cached = self._rows.get(row.id)
+        if cached is None or cached.version != get_snapshot_row_version(row):
+            return None
+        self._rows.move_to_end(row.id)
+        return cached.snapshot_messages
+
+    def put(self, row: AIMessage, snapshot_messages: Sequence[Any], *, size: int) -> None:
+        """
+        写入消息行的快照消息
+
+        :param row: 消息行
+        :param snapshot_messages: 协议快照消息
+        :param size: 消息行模型消息 JSON 大小（字节，未压缩），存储文本可能经过压缩，不能直接按其长度估算
+        :return:
+        """
+        max_bytes = settings.AI_SNAPSHOT_CACHE_MAX_BYTES
+        if max_bytes <= 0 or size > max_bytes:
+            return
+        previous = self._rows.pop(row.id, None)
+        if previous is not None:
+            self._total_size -= previous.size
+        self._rows[row.id] = _CachedFragment(
+            version=get_snapshot_row_version(row),
+            snapshot_messages=tuple(snapshot_messages),
+            size=size,
+        )
+        self._total_size += size
+        while self._total_size > max_bytes and self._rows:
+            _, evicted = self._rows.popitem(last=False)
+            self._total_size -= evicted.size
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._rows.clear()
+        self._total_size = 0
+
+
+ai_snapshot_fragment_cache: AISnapshotFragmentCache = AISnapshotFragmentCache()
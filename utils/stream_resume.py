@@ -0,0 +1,258 @@
+import asyncio
+
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Mapping
+from itertools import islice
+
+from starlette.responses import StreamingResponse
+
+from backend.common.log import log
+from backend.core.conf import settings
+from backend.plugin.ai.utils.metrics import ai_metrics_registry
+
+stream_resume_runs = ai_metrics_registry.gauge(
+    'ai_stream_resume_runs',
+    '进程内保留的可重连流式运行数量',
+)
+stream_resume_total = ai_metrics_registry.counter(
+    'ai_stream_resume_events',
+    '可重连流式运行事件次数，reattached 为重连成功，expired 为重连时事件已过期，abandoned 为宽限期内无人重连',
+    ('outcome',),
+)
+
+
+class AIStreamRun:
+    """可重连的单次流式运行
+
+    后台任务读取已编码的事件帧并按递增 ID 写入有界环形缓冲，客户端订阅时先重放 Last-Event-ID 之后的帧再跟随实时帧；
+    最后一个订阅者断开后等待宽限期，期间无人重连才取消运行，由事件流按中断处理
+    """
+
+    def __init__(
+        self,
+        *,
+        conversation_id: str,
+        run_id: str,
+        user_id: int,
+        media_type: str,
+        headers: Mapping[str, str] | None,
+    ) -> None:
+        self.conversation_id = conversation_id
+        self.run_id = run_id
+        self.user_id = user_id
+        self.media_type = media_type
+        self.headers = dict(headers or {})
+        self.finished = False
+        self._frames: deque[tuple[int, str]] = deque(maxlen=max(settings.AI_STREAM_RESUME_BUFFER_SIZE, 1))
+        self._last_event_id = 0
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._producer: asyncio.Task[None] | None = None
+        self._grace_handle: asyncio.TimerHandle | None = None
+
+    def start(self, frames: AsyncIterator[str], *, on_finished: Callable[['AIStreamRun'], None]) -> None:
+        """
+        启动后台任务读取事件帧，首个订阅者连接前同样按宽限期计时
+
+        :param frames: 已编码的事件帧
+        :param on_finished: 运行结束回调
+        :return:
+        """
+        self._producer = asyncio.create_task(self._produce(frames, on_finished))
+        self._schedule_grace()
+
+    async def _produce(self, frames: AsyncIterator[str], on_finished: Callable[['AIStreamRun'], None]) -> None:
+        """
+        读取事件帧写入环形缓冲
+
+        :param frames: 已编码的事件帧
+        :param on_finished: 运行结束回调
+        :return:
+        """
+        try:
+            async for frame in frames:
+                self._last_event_id += 1
+                self._frames.append((self._last_event_id, frame))
+                self._notify()
+        except Exception as exc:
+            log.exception(f'可重连流式运行异常 conversation_id={self.conversation_id} run_id={self.run_id}: {exc}')
+        finally:
+            self.finished = True
+            self._cancel_grace()
+            self._notify()
+            on_finished(self)
+
+    def _notify(self) -> None:
+        """唤醒等待新事件帧的订阅者"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _schedule_grace(self) -> None:
+        """开始宽限期计时"""
+        self._cancel_grace()
+        loop = asyncio.get_running_loop()
+        self._grace_handle = loop.call_later(max(settings.AI_STREAM_RESUME_GRACE, 0), self._abandon)
+
+    def _cancel_grace(self) -> None:
+        """取消宽限期计时"""
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+
+    def _abandon(self) -> None:
+        """宽限期内无人重连时取消运行"""
+        self._grace_handle = None
+        if self._subscribers or self.finished or self._producer is None:
+            return
+        stream_resume_total.inc(outcome='abandoned')
+        self._producer.cancel()
+
+    def can_replay(self, last_event_id: int) -> bool:
+        """
+        判断 Last-Event-ID 之后的事件帧是否仍在缓冲中
+
+        :param last_event_id: 客户端已收到的最后一个事件 ID
+        :return:
+        """
+        if last_event_id < 0 or last_event_id > self._last_event_id:
+            return False
+        return not self._frames or last_event_id + 1 >= self._frames[0][0]
+
+    async def subscribe(self, last_event_id: int) -> AsyncIterator[str]:
+        """
+        订阅事件帧，重放 Last-Event-ID 之后的帧后跟随实时帧；订阅者落后超出缓冲时结束订阅，由客户端重连
+
+        :param last_event_id: 客户端已收到的最后一个事件 ID
+        :return:
+        """
+        self._subscribers += 1
+        self._cancel_grace()
+        try:
+            next_event_id = last_event_id + 1
+            while True:
+                if self._frames and next_event_id < self._frames[0][0]:
+                    return
+                changed = self._changed
+                start = next_event_id - self._frames[0][0] if self._frames else 0
+                frames = list(islice(self._frames, max(start, 0), None))
+                for event_id, frame in frames:
+                    yield f'id: {event_id}\n{frame}'
+                    next_event_id = event_id + 1
+                if frames:
+                    continue
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self._subscribers -= 1
+            if not self._subscribers and not self.finished:
+                self._schedule_grace()
+
+    def streaming_response(self, last_event_id: int = 0) -> StreamingResponse:
+        """
+        构建订阅事件帧的流式响应
+
+        :param last_event_id: 客户端已收到的最后一个事件 ID
+        :return:
+        """
+        response = StreamingResponse(self.subscribe(last_event_id), headers=self.headers, media_type=self.media_type)
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    async def aclose(self) -> None:
+        """取消运行并等待事件流完成中断处理"""
+        self._cancel_grace()
+        producer = self._producer
+        if producer is None or producer.done():
+            return
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+
+
+class AIStreamRegistry:
+    """可重连流式运行注册表
+
+    按（对话 ID，运行 ID）保存进程内的流式运行，运行结束后保留 ``AI_STREAM_RESUME_TTL`` 秒供断线客户端取回结尾事件；
+    多进程部署下重连请求需路由到原进程
+    """
+
+    def __init__(self) -> None:
+        self._runs: dict[tuple[str, str], AIStreamRun] = {}
+
+    def start(
+        self,
+        *,
+        conversation_id: str,
+        run_id: str,
+        user_id: int,
+        frames: AsyncIterator[str],
+        media_type: str,
+        headers: Mapping[str, str] | None = None,
+    ) -> AIStreamRun:
+        """
+        注册并启动流式运行
+
+        :param conversation_id: 对话 ID
+        :param run_id: 运行 ID
+        :param user_id: 用户 ID
+        :param frames: 已编码的事件帧
+        :param media_type: 响应类型
+        :param headers: 响应头
+        :return:
+        """
+        run = AIStreamRun(
+            conversation_id=conversation_id,
+            run_id=run_id,
+            user_id=user_id,
+            media_type=media_type,
+            headers=headers,
+        )
+        self._runs[conversation_id, run_id] = run
+        stream_resume_runs.set(len(self._runs))
+        run.start(frames, on_finished=self._schedule_expiry)
+        return run
+
+    def _schedule_expiry(self, run: AIStreamRun) -> None:
+        """
+        运行结束后按保留时间移除
+
+        :param run: 流式运行
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        loop.call_later(max(settings.AI_STREAM_RESUME_TTL, 0), self._remove, run)
+
+    def _remove(self, run: AIStreamRun) -> None:
+        """
+        移除流式运行
+
+        :param run: 流式运行
+        :return:
+        """
+        if self._runs.get((run.conversation_id, run.run_id)) is run:
+            del self._runs[run.conversation_id, run.run_id]
+            stream_resume_runs.set(len(self._runs))
+
+    def get(self, conversation_id: str, run_id: str) -> AIStreamRun | None:
+        """
+        获取流式运行
+
+        :param conversation_id: 对话 ID
+        :param run_id: 运行 ID
+        :return:
+        """
+        return self._runs.get((conversation_id, run_id))
+
+    async def aclose(self) -> None:
+        """取消全部未结束的运行并等待其完成中断处理"""
+        runs = list(self._runs.values())
+        await asyncio.gather(*(run.aclose() for run in runs), return_exceptions=True)
+        self._runs.clear()
+        stream_resume_runs.set(0)
+
+
+ai_stream_registry: AIStreamRegistry = AIStreamRegistry()
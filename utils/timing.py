@@ -0,0 +1,68 @@
+import time
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from backend.plugin.ai.utils.metrics import ai_metrics_registry
+
+chat_phase_seconds = ai_metrics_registry.histogram(
+    'ai_chat_phase_seconds',
+    'AI 聊天各阶段耗时（秒）',
+    ('phase', 'provider_type', 'model'),
+)
+
+
+class ChatPhaseTimings:
+    """聊天阶段耗时记录
+
+    每个阶段结束时写入直方图；响应头发送前完成的阶段可通过 Server-Timing 返回
+    """
+
+    def __init__(self) -> None:
+        self.provider_type = ''
+        self.model = ''
+        self._durations: dict[str, float] = {}
+
+    def set_labels(self, *, provider_type: str, model: str) -> None:
+        """
+        设置指标标签
+
+        :param provider_type: 供应商类型
+        :param model: 模型 ID
+        :return:
+        """
+        self.provider_type = provider_type
+        self.model = model
+
+    def record(self, phase: str, seconds: float) -> None:
+        """
+        记录阶段耗时
+
+        :param phase: 阶段名称
+        :param seconds: 耗时（秒）
+        :return:
+        """
+        self._durations[phase] = self._durations.get(phase, 0) + seconds
+        chat_phase_seconds.observe(seconds, phase=phase, provider_type=self.provider_type, model=self.model)
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """
+        计量代码块耗时，异常退出时同样记录
+
+        :param phase: 阶段名称
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def server_timing(self) -> str:
+        """
+        构建 Server-Timing 响应头
+
+        :return:
+        """
+        return ', '.join(f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in self._durations.items())